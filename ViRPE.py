@@ -1,18 +1,38 @@
+import time
+_T0 = time.perf_counter()  # --profile-startup の計測開始
 import sys
 import os
-import re
-from PIL import Image
-import piexif
-import yaml
+
+# ヘッドレスのサブコマンドは PyQt6 を読み込む前に振り分ける
+if __name__=="__main__":
+    if getattr(sys, 'frozen', False):
+        # PyInstaller の exe で multiprocessing の子プロセスとして起動された
+        import multiprocessing
+        multiprocessing.freeze_support()
+    # 起動済みの ViRPE があれば、フォルダ / ファイルの引数を渡してすぐ終わる（PyQt6 もサブコマンドも読み込まない）
+    from virpe_instance import forward_to_running
+    if forward_to_running(sys.argv[1:]):
+        sys.exit(0)
+    # フォルダ・ファイルやオプションだけのときは virpe_cli（argparse など）を読み込まない
+    if len(sys.argv) > 1 and not sys.argv[1].startswith('-') and not os.path.exists(sys.argv[1]):
+        from virpe_cli import COMMANDS, main as cli_main
+        if sys.argv[1] in COMMANDS:
+            sys.exit(cli_main(sys.argv[1:]))
+
 import logging
-import ctypes
-from PyQt6.QtWidgets import QApplication, QLabel, QListWidget, QVBoxLayout, QWidget, QFileDialog, QPushButton, QGridLayout, QHBoxLayout, QTextEdit, QScrollArea, QComboBox
-from PyQt6.QtGui import QPixmap, QMouseEvent, QKeyEvent, QIcon
-from PyQt6.QtCore import Qt, QEvent, QSize
-from datetime import datetime
-from fractions import Fraction
-import pyperclip
-import subprocess
+from PyQt6.QtWidgets import QApplication, QListView, QVBoxLayout, QWidget, QFileDialog, QPushButton, QHBoxLayout, QTextEdit, QComboBox, QProgressBar, QMessageBox, QAbstractItemView, QLineEdit
+from PyQt6.QtGui import QMouseEvent, QKeyEvent, QIcon, QKeySequence, QShortcut
+from PyQt6.QtCore import Qt, QSize, QFileSystemWatcher, QTimer, QItemSelection, QItemSelectionModel
+from virpe_core import exif_rename_pairs, rename_template, replace_invalid_chars, load_config, uses_exiftool
+# 最初の画面に要るものだけを読み込む（Exif インデックス・グループ分け・書き出しは使うときに読み込む）
+from virpe_decode import DecodePool
+from virpe_listmodel import ImageListModel
+from virpe_view import ImageView
+from virpe_renamer import RenameQueue
+from virpe_journal import CANCELLED
+from virpe_memory import MemoryBudget
+import virpe_fileio
+import virpe_trace
 version="v1.0.6"
 
 # logging
@@ -26,6 +46,7 @@ def _maybe_set_app_user_model_id(app_id: str = "NobuoJt.ViRPE"):
     if os.name != 'nt':
         return
     try:
+        import ctypes
         ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID(app_id)
     except Exception:
         pass
@@ -34,6 +55,8 @@ class ImageViewer(QWidget):
     """メインクラス"""
 
     name="ViPRE "+version
+    # 最初の描画が終わったら 1 度だけ呼ぶ（起動時間の計測用）
+    _on_first_paint = None
     def __init__(self):
         super().__init__()
 
@@ -86,6 +109,16 @@ class ImageViewer(QWidget):
         self.btn_exifCopy.setDefault(True)
         self.layout.topButton.addWidget(self.btn_exifCopy)
 
+        #連写・類似画像のグループ選択ボタン（選択後の Exif リネームはグループ全体に効く）
+        self.btn_group=QPushButton("グループ選択")
+        self.btn_group.clicked.connect(self.select_group)
+        self.layout.topButton.addWidget(self.btn_group)
+
+        #フォルダ内の Exif を CSV / JSON Lines に書き出すボタン（書き出し中に押すとキャンセル）
+        self.btn_export=QPushButton("Exif書き出し")
+        self.btn_export.clicked.connect(self.export_exif)
+        self.layout.topButton.addWidget(self.btn_export)
+
         #custom_command1起動ボタン
         self.btn_custom_command1=QPushButton(self.custom_command1_name)
         self.btn_custom_command1.clicked.connect(self.custom_command1)
@@ -105,13 +138,64 @@ class ImageViewer(QWidget):
         self.text_widget.func_rename_exif=self.rename_image_2
         self.layout.addWidget(self.text_widget)
 
-        #画像リスト
-        self.list_widget=QListWidget()
-        self.list_widget.setMinimumHeight(140)
-        self.list_widget.setMaximumHeight(140)
-        self.list_widget.itemClicked.connect(self.display_image)
-        self.list_widget.itemActivated.connect(self.display_image)
-        self.layout.addWidget(self.list_widget)
+        # リネームの進捗（キューが動いている間だけ表示）
+        self.rename_progress = QProgressBar()
+        self.rename_progress.setMaximumHeight(16)
+        self.btn_rename_cancel = QPushButton("キャンセル")
+        self.layout.renameProgress = QHBoxLayout()
+        self.layout.renameProgress.addWidget(self.rename_progress)
+        self.layout.renameProgress.addWidget(self.btn_rename_cancel)
+        self.layout.addLayout(self.layout.renameProgress)
+        self.rename_progress.hide()
+        self.btn_rename_cancel.hide()
+
+        # リネームはワーカースレッドで行い、一覧は先に書き換えておく
+        self._renamer = RenameQueue(self)
+        self._renamer.moved.connect(self._on_moved)
+        self._renamer.failed.connect(self._on_rename_failed)
+        self._renamer.progress.connect(self._on_rename_progress)
+        self._renamer.idle.connect(self._on_rename_idle)
+        self._renamer.planned.connect(self._on_rename_planned)
+        self.btn_rename_cancel.clicked.connect(self._renamer.cancel)
+        self._rename_errors = []
+        # Ctrl+Z: 直前のリネームを取り消す（テキストボックスの中ではテキストの取り消し）
+        QShortcut(QKeySequence.StandardKey.Undo, self, self.undo_rename)
+
+        #画像リスト（表示されている行だけを描画するモデル/ビュー）
+        self.list_model = ImageListModel(self)
+        self.folder_model = self.list_model.folder_model
+        self.list_model.scan_finished.connect(self._on_scan_finished)
+        self._select_when_listed = None
+        self.list_view=QListView()
+        self.list_view.setModel(self.list_model)
+        self.list_view.setUniformItemSizes(True)
+        # Ctrl/Shift で複数選択して、まとめて Exif リネームできる
+        self.list_view.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        self.list_view.setMinimumHeight(140)
+        self.list_view.setMaximumHeight(140)
+        self.list_view.clicked.connect(self.display_image)
+        self.list_view.activated.connect(self.display_image)
+        # 矢印キーでの選択移動でも表示を追従させる
+        self.list_view.selectionModel().currentChanged.connect(lambda cur, _prev: self.display_image(cur))
+
+        # Exif の条件式で一覧を絞り込み・並べ替える（入力が止まってから適用する）
+        self.filter_edit = QLineEdit()
+        self.filter_edit.setPlaceholderText("絞り込み 例: iso>=3200 time=14:00..15:00 focal>=200 sort:-date")
+        self.filter_edit.setClearButtonEnabled(True)
+        self._filter_timer = QTimer(self)
+        self._filter_timer.setSingleShot(True)
+        self._filter_timer.setInterval(300)
+        self._filter_timer.timeout.connect(self._apply_filter)
+        self.filter_edit.textChanged.connect(lambda _: self._filter_timer.start())
+        self.filter_edit.returnPressed.connect(self._apply_filter)
+        # Exif の読み込み中は、届いた分で 1 秒ごとに掛け直す
+        self._refilter_timer = QTimer(self)
+        self._refilter_timer.setSingleShot(True)
+        self._refilter_timer.setInterval(1000)
+        self._refilter_timer.timeout.connect(lambda: self._apply_query(self.list_model.query))
+        self.list_model.metadata_changed.connect(self._on_metadata_changed)
+        self.layout.addWidget(self.filter_edit)
+        self.layout.addWidget(self.list_view)
 
         # 表示モード選択 (Fit / 100%)
         self.mode_combo = QComboBox()
@@ -120,86 +204,96 @@ class ImageViewer(QWidget):
         self.mode_combo.currentIndexChanged.connect(lambda _: self._update_display_mode())
         self.layout.topButton.addWidget(self.mode_combo)
 
-        # 画像表示領域: QScrollArea + QLabel (パン対応)
-        self.scroll_area = QScrollArea()
-        self.scroll_area.setWidgetResizable(True)
-
-        class PanLabel(QLabel):
-            def __init__(self, parent=None, scroll_area=None):
-                super().__init__(parent)
-                self.setBackgroundRole(self.backgroundRole())
-                self.setSizePolicy(self.sizePolicy())
-                self.setAlignment(Qt.AlignmentFlag.AlignCenter)
-                self._dragging = False
-                self._last_pos = None
-                self._scroll_area = scroll_area
-                self.setMouseTracking(True)
-                self.setCursor(Qt.CursorShape.OpenHandCursor)
-
-            def mousePressEvent(self, ev: QMouseEvent):
-                if ev.button() == Qt.MouseButton.LeftButton:
-                    self._dragging = True
-                    # use local position to compute deltas
-                    try:
-                        self._last_pos = ev.position()
-                    except Exception:
-                        self._last_pos = ev.pos()
-                    self.setCursor(Qt.CursorShape.ClosedHandCursor)
-                    logger.debug("PanLabel.mousePressEvent pos=%s", self._last_pos)
-                    ev.accept()
-                else:
-                    super().mousePressEvent(ev)
-
-            def mouseMoveEvent(self, ev: QMouseEvent):
-                if self._dragging and self._last_pos is not None and self._scroll_area:
-                    try:
-                        cur = ev.position()
-                    except Exception:
-                        cur = ev.pos()
-                    dx = cur.x() - self._last_pos.x()
-                    dy = cur.y() - self._last_pos.y()
-                    hbar = self._scroll_area.horizontalScrollBar()
-                    vbar = self._scroll_area.verticalScrollBar()
-                    # subtract dx/dy to move content with mouse drag direction
-                    hbar.setValue(int(hbar.value() - dx))
-                    vbar.setValue(int(vbar.value() - dy))
-                    logger.debug("PanLabel.mouseMoveEvent dx=%.1f dy=%.1f h=%d v=%d", dx, dy, hbar.value(), vbar.value())
-                    self._last_pos = cur
-                    ev.accept()
-                else:
-                    super().mouseMoveEvent(ev)
-
-            def mouseReleaseEvent(self, ev: QMouseEvent):
-                if ev.button() == Qt.MouseButton.LeftButton:
-                    self._dragging = False
-                    self._last_pos = None
-                    self.setCursor(Qt.CursorShape.OpenHandCursor)
-                    logger.debug("PanLabel.mouseReleaseEvent")
-                    ev.accept()
-                else:
-                    super().mouseReleaseEvent(ev)
-
-        # 内部ラベルを作成してスクロールエリアに設定
-        self.image_label = PanLabel(scroll_area=self.scroll_area)
-        self.image_label.setText("画像表示領域")
-        # 不要な固定の最大/最小サイズ制約を外して、pixmap に合わせてラベルをリサイズする
-        self.image_label.setScaledContents(False)
-        self.scroll_area.setWidget(self.image_label)
-        self.layout.addWidget(self.scroll_area)
-
-        # ビューポート用のパン状態
-        self._panning = False
-        self._pan_last_pos = None
-        self.scroll_area.viewport().setMouseTracking(True)
-        self.scroll_area.viewport().installEventFilter(self)
-        # ラベル自体がビューポートを覆っている場合があるので、ラベルにもフィルタを設置
-        self.image_label.setMouseTracking(True)
-        self.image_label.installEventFilter(self)
-
-        # 内部で保持する現在のpixmap（元サイズ）
-        self._current_pixmap = None
-        # ズーム係数: None=Fitモードに対応、float=倍率(1.0=100%)
-        self._zoom = None
+        # 一覧の並び順（ディレクトリは読み直さない）
+        self.sort_combo = QComboBox()
+        self.sort_combo.addItems(["名前順", "自然順", "更新日時順"])
+        self.sort_combo.currentIndexChanged.connect(self._update_sort)
+        self.layout.topButton.addWidget(self.sort_combo)
+
+        # 一覧の表示（テキスト / フィルムストリップ / グリッド）。サムネイルは最初に切り替えたときに用意する
+        self.list_mode_combo = QComboBox()
+        self.list_mode_combo.addItems(["テキスト", "フィルムストリップ", "グリッド"])
+        self.list_mode_combo.currentIndexChanged.connect(self._update_list_mode)
+        self.layout.topButton.addWidget(self.list_mode_combo)
+        self.thumbnail_size = int(config.get('thumbnail_size', 128))
+        self._thumbs = None
+        self._thumb_loader = None
+        # スクロール中は止まってから、見えている行の分だけ要求する
+        self._thumb_timer = QTimer(self)
+        self._thumb_timer.setSingleShot(True)
+        self._thumb_timer.setInterval(50)
+        self._thumb_timer.timeout.connect(self._request_thumbnails)
+        self._thumb_budget_timer = QTimer(self)
+        self._thumb_budget_timer.setSingleShot(True)
+        self._thumb_budget_timer.setInterval(200)
+        for signal in (self.list_view.verticalScrollBar().valueChanged, self.list_view.horizontalScrollBar().valueChanged,
+                       self.list_model.rowsInserted, self.list_model.layoutChanged, self.list_model.modelReset):
+            signal.connect(self._schedule_thumbnails)
+        self.list_model.rowsInserted.connect(self._select_listed)
+
+        # 画像表示領域: 見えている範囲だけを描画するビュー (ドラッグでパン、Zoom 時はホイールで拡大縮小)
+        self.image_view = ImageView()
+        self.image_view.setText("画像表示領域")
+        self.image_view.zoom_changed.connect(lambda z: self.mode_combo.setItemText(1, f"Zoom({int(z*100)}%)"))
+        self.image_view.resolution_needed.connect(self._request_full_resolution)
+        self.layout.addWidget(self.image_view)
+
+        # デコードはワーカースレッドで行い、前後の画像を先読みしておく
+        # 通常は画面に収まる解像度で直接デコードし、原寸は Zoom で必要になったときだけ読む
+        self.prefetch_count = int(config.get('prefetch_count', 2))
+        screen = QApplication.primaryScreen()
+        dpr = screen.devicePixelRatio()
+        fit_size = QSize(int(screen.size().width() * dpr), int(screen.size().height() * dpr))
+        # デコードキャッシュ・表示中の画像（縮小段を含む）をまとめて 1 つのメモリ予算で管理する
+        budget_mb = int(config.get('memory_budget_mb', config.get('decode_cache_mb', 768)))
+        self.memory = MemoryBudget(budget_mb * 1024 * 1024)
+        self._decoder = DecodePool(
+            max_threads=int(config.get('decode_threads', 2)),
+            cache_bytes=self.memory.limit,
+            fit_size=fit_size,
+            budget=self.memory,
+            parent=self,
+        )
+        self.memory.register("view", self.image_view, priority=2)
+        self._thumb_budget_timer.timeout.connect(self.memory.enforce)
+        self.image_view.budget = self.memory
+        # Ctrl+Shift+M: メモリ使用量の表示（config の memory_debug で起動時から表示）
+        QShortcut(QKeySequence("Ctrl+Shift+M"), self, self._toggle_memory_readout)
+        if config.get('memory_debug'):
+            self._toggle_memory_readout()
+        self._decoder.image_ready.connect(self._on_image_ready)
+        self._decoder.preview_ready.connect(self._on_preview_ready)
+        self._decoder.decode_failed.connect(self._show_pending_exif)
+        self._shown_path = None
+        # デコーダーが読んだファイルの内容を Exif の解析と共有する（ファイルは 1 回だけ読む）
+        virpe_fileio.configure(config)
+        # デコーダーが読み終わってから Exif を表示するパス
+        self._exif_pending = None
+
+        # Exif 解析結果はセッションをまたいで SQLite に保存しておく
+        # Exif インデックス（SQLite）は最初に使うときに開く
+        self._exif_index = None
+        self._exif_index_path = config.get('exif_index_path')
+
+        # 知覚ハッシュによるグループ分け（最初にグループ選択したときに作る）
+        self._grouper = None
+        self._hash_jobs = int(config.get('hash_jobs', 0))
+        self._groups_folder = None
+        self._grouping_folder = None
+        self._select_group_when_ready = False
+
+        # Exif の書き出し（最初に書き出すときに作る）
+        self._exporter = None
+        # 実行中のカスタムコマンド（CommandJob）
+        self._command_jobs = set()
+
+        # 外部からの変更の監視
+        self.folder_watcher = QFileSystemWatcher(self)
+        self._folder_sync_timer = QTimer(self)
+        self._folder_sync_timer.setSingleShot(True)
+        self._folder_sync_timer.setInterval(200)
+        self._folder_sync_timer.timeout.connect(self._sync_folder)
+        self.folder_watcher.directoryChanged.connect(lambda _: self._folder_sync_timer.start())
 
         #レイアウトを適用
         self.setLayout(self.layout)
@@ -214,45 +308,390 @@ class ImageViewer(QWidget):
         folder = QFileDialog.getExistingDirectory(self, "フォルダ選択", default_folder)
         if not folder:
             return
-        
+        self.open_folder(folder)
+
+    def open_folder(self, folder):
+        """folder の画像一覧を表示する"""
+        self._select_when_listed = None
         self.setWindowTitle(self.name+" 📂["+folder+"]")
 
-        self.list_widget.clear()
-        self.image_files =[]
+        # 先頭のチャンクが読めた時点から一覧に表示される
+        if self._grouper is not None:
+            self._grouper.cancel()
+        self._groups_folder = None
+        self.btn_group.setText("グループ選択")
+        self.list_model.open_folder(folder)
         self.text_widget.setText(self.text_require_sel_pix)
 
-        for file in os.listdir(folder):
-            if file.lower().endswith(('.png','.jpg','jpeg','bmp','gif')):
-                self.list_widget.addItem(file)
-                self.image_files.append(os.path.join(folder,file))
+        # フォルダ外からの追加・削除・リネームを監視する
+        if self.folder_watcher.directories():
+            self.folder_watcher.removePaths(self.folder_watcher.directories())
+        self.folder_watcher.addPath(folder)
+
+    def open_paths(self, paths):
+        """
+        コマンドラインや 2 回目以降の起動から渡されたフォルダ / ファイルを開き、ウィンドウを前に出す。
+        開いているフォルダのファイルなら読み直さずに選ぶだけ（デコード・Exif のキャッシュをそのまま使う）
+        """
+        if self.isMinimized():
+            self.showNormal()
+        self.raise_()
+        self.activateWindow()
+        if not paths:
+            return
+        path = os.path.abspath(paths[0])
+        if os.path.isdir(path):
+            folder, name = path, None
+        elif os.path.isfile(path):
+            folder, name = os.path.split(path)
+        else:
+            return
+        current = self.folder_model.folder
+        if current is None or os.path.normcase(os.path.abspath(current)) != os.path.normcase(folder):
+            self.open_folder(folder)
+        if name is not None:
+            self._select_when_listed = name
+            self._select_listed()
+
+    def _select_listed(self, *_):
+        """open_paths で渡されたファイルが一覧に入っていれば選ぶ"""
+        name = self._select_when_listed
+        if name is None:
+            return
+        index = self.list_model.index_of(name)
+        if index.isValid():
+            self._select_when_listed = None
+            self.list_view.setCurrentIndex(index)
+            self.list_view.scrollTo(index)
+
+    def _on_scan_finished(self):
+        self._select_listed()
+        self._select_when_listed = None
+        # 未解析のファイルだけバックグラウンドで Exif を読んでおく
+        # 読めた分から絞り込み・並べ替え用の表（MetadataTable）にも入れていく
+        self.exif_index.warm((self.folder_model.path(i) for i in range(len(self.folder_model))),
+                             on_batch=self.list_model.metadata_sink())
+
+    def select_group(self):
+        """表示中の画像と同じグループ（連写・ほぼ同じ画像）をまとめて選択する。初回はグループ分けから行う"""
+        if not self.folder_model.folder:
+            return
+        if self._groups_folder == self.folder_model.folder:
+            self._select_current_group()
+            return
+        self._select_group_when_ready = True
+        if self._grouper is None:
+            from virpe_groups import HashGrouper
+            self._grouper = HashGrouper(self.exif_index, self._hash_jobs, self)
+            self._grouper.progress.connect(lambda done, total: self.btn_group.setText(f"グループ解析中 {done}/{total}"))
+            self._grouper.finished.connect(self._on_groups_ready)
+        if not self._grouper.running:
+            self._grouping_folder = self.folder_model.folder
+            fm = self.folder_model
+            self._grouper.start(
+                (self._renamer.source_of(fm.path(i)), fm.sizes[i], fm.mtimes[i]) for i in range(len(fm))
+            )
+
+    def _on_groups_ready(self, groups):
+        self.btn_group.setText("グループ選択")
+        if self._grouping_folder != self.folder_model.folder:
+            return
+        self._groups_folder = self._grouping_folder
+        self.list_model.set_groups(groups)
+        if self._select_group_when_ready:
+            self._select_group_when_ready = False
+            self._select_current_group()
+
+    def _select_current_group(self):
+        current = self.list_view.currentIndex()
+        if not current.isValid():
+            return
+        selection = QItemSelection()
+        for row in self.list_model.group_rows(current.data()):
+            index = self.list_model.index(row)
+            selection.select(index, index)
+        self.list_view.selectionModel().select(selection, QItemSelectionModel.SelectionFlag.ClearAndSelect)
+
+    def export_exif(self):
+        """表示中のフォルダの画像の Exif を CSV / JSON Lines に書き出す"""
+        if self._exporter is not None and self._exporter.running:
+            self._exporter.cancel()
+            return
+        folder = self.folder_model.folder
+        if not folder:
+            return
+        output, selected = QFileDialog.getSaveFileName(
+            self, "Exif書き出し", os.path.join(folder, "exif.csv"),
+            "CSV (*.csv);;JSON Lines (*.jsonl)",
+        )
+        if not output:
+            return
+        from virpe_export import format_for, parse_columns
+        fmt = format_for(output, 'jsonl' if selected.startswith("JSON") else 'csv')
+        if self._exporter is None:
+            from virpe_exporter import ExifExporter
+            self._exporter = ExifExporter(self)
+            self._exporter.progress.connect(lambda n: self.btn_export.setText(f"書き出し中 {n}件"))
+            self._exporter.finished.connect(self._on_export_finished)
+        config = load_config()
+        fm = self.folder_model
+        self.btn_export.setText("書き出し中")
+        self._exporter.start(
+            [self._renamer.source_of(fm.path(i)) for i in range(len(fm))], output, fmt,
+            parse_columns(config.get('export_columns')), root=folder,
+        )
+
+    def _on_export_finished(self, count, output, error):
+        self.btn_export.setText("Exif書き出し")
+        if error == self._exporter.CANCELLED:
+            return
+        if error:
+            QMessageBox.warning(self, "Exif書き出し", f"書き出しに失敗しました:\n{error}")
+        else:
+            QMessageBox.information(self, "Exif書き出し", f"{count}件を書き出しました:\n{output}")
 
-    def reload_images(self,item):
-        """画像一覧をリロード"""
-        if not hasattr(self,"image_path"):
+    def _update_sort(self, index):
+        from virpe_folder import SORT_KEYS
+        self.list_model.sort_by(SORT_KEYS[index])
+        self.list_view.scrollTo(self.list_view.currentIndex())
+
+    def _apply_filter(self):
+        """入力された条件式で一覧を絞り込む（書けない式ならそのまま）"""
+        self._filter_timer.stop()
+        from virpe_metatable import compile_query
+        try:
+            query = compile_query(self.filter_edit.text())
+        except ValueError as e:
+            self.filter_edit.setStyleSheet("QLineEdit { background: #ffe0e0; }")
+            self.filter_edit.setToolTip(str(e))
+            return
+        self.filter_edit.setStyleSheet("")
+        self.filter_edit.setToolTip("")
+        self._apply_query(query)
+
+    def _apply_query(self, query):
+        # 選択は行の移動に付いていくので、表示中の画像の行が動いたときだけ見える位置へ寄せる
+        current = self.list_view.currentIndex()
+        row = current.row()
+        self.list_model.apply_query(query)
+        current = self.list_view.currentIndex()
+        if current.isValid() and current.row() != row:
+            self.list_view.scrollTo(current)
+
+    def _on_metadata_changed(self):
+        if self.list_model.query is not None and not self._refilter_timer.isActive():
+            self._refilter_timer.start()
+
+    def _update_list_mode(self, index):
+        """一覧の表示を切り替える（0: テキスト, 1: フィルムストリップ, 2: グリッド）"""
+        view = self.list_view
+        if index == 0:
+            view.setViewMode(QListView.ViewMode.ListMode)
+            view.setFlow(QListView.Flow.TopToBottom)
+            view.setWrapping(False)
+            view.setGridSize(QSize())
+            view.setIconSize(QSize())
+            view.setVerticalScrollMode(QAbstractItemView.ScrollMode.ScrollPerItem)
+            view.setHorizontalScrollMode(QAbstractItemView.ScrollMode.ScrollPerItem)
+            view.setMinimumHeight(140)
+            view.setMaximumHeight(140)
+            self.list_model.set_thumbnails(None)
+            if self._thumb_loader is not None:
+                self._thumb_loader.cancel()
+                self._thumbs.clear()
+        else:
+            if self._thumbs is None:
+                from virpe_thumbs import ThumbnailCache, ThumbnailLoader
+                self._thumbs = ThumbnailCache()
+                self.memory.register("thumbs", self._thumbs, priority=1)
+                self._thumb_loader = ThumbnailLoader(
+                    size=self.thumbnail_size,
+                    max_threads=int(load_config().get('decode_threads', 2)),
+                    parent=self,
+                )
+                self._thumb_loader.ready.connect(self._on_thumbnail_ready)
+            size = self.thumbnail_size
+            cell = QSize(size + 16, size + view.fontMetrics().height() + 16)
+            view.setViewMode(QListView.ViewMode.IconMode)
+            view.setMovement(QListView.Movement.Static)
+            view.setResizeMode(QListView.ResizeMode.Adjust)
+            view.setFlow(QListView.Flow.LeftToRight)
+            view.setWrapping(index == 2)
+            view.setIconSize(QSize(size, size))
+            view.setGridSize(cell)
+            view.setVerticalScrollMode(QAbstractItemView.ScrollMode.ScrollPerPixel)
+            view.setHorizontalScrollMode(QAbstractItemView.ScrollMode.ScrollPerPixel)
+            # フィルムストリップは 1 段 + スクロールバー、グリッドは 3 段分
+            height = cell.height() + view.horizontalScrollBar().sizeHint().height() + 4 if index == 1 else cell.height() * 3
+            view.setMinimumHeight(height)
+            view.setMaximumHeight(height)
+            self.list_model.set_thumbnails(self._thumbs)
+        self._schedule_thumbnails()
+        view.scrollTo(view.currentIndex())
+
+    def _schedule_thumbnails(self, *_):
+        if self.list_model.thumbnails is not None:
+            self._thumb_timer.start()
+
+    def _visible_rows(self):
+        """グリッドの升目から、見えている行範囲 (first, last) を計算する（indexAt は升目の隙間で外れる）"""
+        view = self.list_view
+        cell = view.gridSize()
+        viewport = view.viewport()
+        if view.isWrapping():
+            per_line = max(1, viewport.width() // cell.width())
+            top = view.verticalScrollBar().value()
+            return top // cell.height() * per_line, ((top + viewport.height()) // cell.height() + 1) * per_line - 1
+        left = view.horizontalScrollBar().value()
+        return left // cell.width(), (left + viewport.width()) // cell.width()
+
+    def _request_thumbnails(self):
+        """見えている行を先に、その前後 1 画面分を後に要求する（未着手の古い要求は取り消される）"""
+        if self.list_model.thumbnails is None or not self.list_model.rowCount():
             return
-        folder=os.path.dirname(self.image_path)
-        self.list_widget.clear()
-        self.image_files =[]
+        first, last = self._visible_rows()
+        page = last - first + 1
+        model = self.list_model
+        items = model.missing_thumbnails(first, last)
+        items += model.missing_thumbnails(last + 1, last + page)
+        items += model.missing_thumbnails(first - page, first - 1)
+        if items:
+            self._thumb_loader.request(items)
+
+    def _on_thumbnail_ready(self, path, image):
+        self.list_model.thumbnail_ready(path, image)
+        self._thumb_budget_timer.start()
 
-        for file in os.listdir(folder):
-            if file.lower().endswith(('.png','.jpg','jpeg','bmp','gif')):
-                self.list_widget.addItem(file)
-                self.image_files.append(os.path.join(folder,file))
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self._schedule_thumbnails()
 
+    def reload_images(self,item):
+        """画像一覧をディスクと突き合わせ、差分だけ反映してから item を選択"""
+        if not self.folder_model.folder:
+            return
+        self._sync_folder()
         if item:
             item=os.path.basename(item)
-            for i in range(self.list_widget.count()):
-                if self.list_widget.item(i).text()==item:
-                    self.list_widget.setCurrentItem(self.list_widget.item(i))
-                    break
-        from PyQt6.QtWidgets import QApplication, QLabel, QListWidget, QVBoxLayout, QWidget, QFileDialog, QPushButton, QGridLayout, QHBoxLayout, QTextEdit, QScrollArea, QComboBox
-        self.text_widget.setText(os.path.splitext(item)[0])
+            index = self.list_model.index_of(item)
+            if index.isValid():
+                self.list_view.setCurrentIndex(index)
+            self.text_widget.setText(os.path.splitext(item)[0])
+
+    def _sync_folder(self):
+        """ディレクトリの変更通知を受けて、一覧の差分だけを反映する"""
+        if self._renamer.busy:
+            # 一覧はリネーム後の名前に書き換え済みなので、終わるまで突き合わせない
+            self._folder_sync_timer.start()
+            return
+        self.list_model.apply_sync()
+
+    def _selected_paths(self):
+        """一覧で選択中の画像のパス（ディスク上の現在のパス、一覧の順）"""
+        rows = sorted(index.row() for index in self.list_view.selectionModel().selectedRows())
+        paths = [self._renamer.source_of(self.folder_model.path(row)) for row in rows]
+        if not paths and getattr(self, 'image_path', None):
+            paths = [self.image_path]
+        return paths
+
+    def _in_current_folder(self, path):
+        folder = self.folder_model.folder
+        return bool(folder) and os.path.normcase(os.path.dirname(path)) == os.path.normcase(folder)
+
+    def _submit_renames(self, pairs, undo_of=None):
+        """リネームをキューに積み、一覧の名前は結果を待たずに書き換える"""
+        # 一覧の別のファイル（同じまとまりで名前が空くものを除く）と同じ名前にするものは積まない
+        leaving = {os.path.basename(old) for old, _ in pairs if self._in_current_folder(old)}
+        allowed = []
+        for old_path, new_path in pairs:
+            name = os.path.basename(new_path)
+            if (self._in_current_folder(new_path) and name != os.path.basename(old_path)
+                    and name in self.folder_model and name not in leaving):
+                self._rename_errors.append(f"{os.path.basename(old_path)}: 同名のファイルがあります: {name}")
+                continue
+            allowed.append((old_path, new_path))
+        accepted = self._renamer.submit(allowed, undo_of)
+        self.list_model.rename_many(
+            (os.path.basename(old_path), os.path.basename(new_path))
+            for old_path, new_path in accepted if self._in_current_folder(old_path)
+        )
+        for old_path, new_path in accepted:
+            if old_path == getattr(self, 'image_path', None):
+                self.text_widget.setText(os.path.splitext(os.path.basename(new_path))[0])
+
+    def undo_rename(self):
+        """直前のリネーム（まとめて行ったものは 1 回分）を元に戻す。繰り返すとさらに前へさかのぼる"""
+        if self._renamer.busy:
+            return
+        undo_of, pairs = self._renamer.undo_pairs()
+        if not pairs:
+            QMessageBox.information(self, self.name, "元に戻せるリネームはありません")
+            return
+        self._submit_renames(pairs, undo_of)
+
+    def _on_moved(self, old_path, new_path):
+        """ディスク上のリネーム（実行順）。デコード結果と Exif を新しいパスへ引き継ぐ"""
+        self._decoder.cache.rename(old_path, new_path)
+        virpe_fileio.shared.rename(old_path, new_path)
+        self.exif_index.rename(old_path, new_path)
+        if getattr(self, 'image_path', None) == old_path:
+            self.image_path = new_path
+            self._shown_path = new_path
+
+    def _on_rename_failed(self, failures):
+        """失敗・取り消したリネームは一覧を元の名前に戻す"""
+        self.list_model.rename_many(
+            (os.path.basename(new_path), os.path.basename(old_path))
+            for old_path, new_path, _ in failures if self._in_current_folder(old_path)
+        )
+        for old_path, new_path, message in failures:
+            old_name = os.path.basename(old_path)
+            if getattr(self, 'image_path', None) == old_path:
+                self.text_widget.setText(os.path.splitext(old_name)[0])
+            if message != CANCELLED:
+                self._rename_errors.append(f"{old_name}: {message}")
+
+    def _on_rename_progress(self, done, total):
+        self.rename_progress.setRange(0, total)
+        self.rename_progress.setValue(done)
+        self.rename_progress.setFormat("リネーム %v / %m")
+        self.rename_progress.show()
+        self.btn_rename_cancel.show()
+
+    def _on_rename_idle(self, succeeded, failed):
+        self.rename_progress.hide()
+        self.btn_rename_cancel.hide()
+        self._show_rename_errors()
+        # 止めていた外部変更の突き合わせ
+        self._folder_sync_timer.start()
+
+    def _show_rename_errors(self):
+        errors, self._rename_errors = self._rename_errors, []
+        if errors:
+            shown = errors[:20] + ([f"... ほか {len(errors) - 20} 件"] if len(errors) > 20 else [])
+            QMessageBox.warning(self, self.name, f"{len(errors)} 件リネームできませんでした\n\n" + "\n".join(shown))
 
     def rename_image_2(self):
-        if hasattr(self,"image_path") and self.image_path:
-            new_path = rename_exif(self.image_path)
-            self.image_path=new_path
-            self.reload_images(new_path)
+        """選択中の画像（複数可）に Exif 情報を付けてリネームする（変更先はワーカースレッドで求める）"""
+        try:
+            template = rename_template(load_config())
+        except ValueError as e:
+            QMessageBox.warning(self, self.name, str(e))
+            return
+        paths = self._selected_paths()
+        if not paths:
+            return
+        index = self.exif_index  # 接続は GUI スレッドで開いておく
+        self._renamer.plan(lambda: exif_rename_pairs(paths, index.get, template))
+
+    def _on_rename_planned(self, pairs, errors):
+        for path, message in errors:
+            self._rename_errors.append(f"{os.path.basename(path)}: {message}" if path else message)
+        self._submit_renames(pairs)
+        if not self._renamer.busy:
+            # 何も積まれなかったときは idle が来ないので、ここで知らせる
+            self._show_rename_errors()
+
     def rename_image_3(self):
         """テキストボックスの文字列で画像ファイル名をリネームする関数"""
         if hasattr(self,"image_path") and self.image_path:
@@ -266,414 +705,205 @@ class ImageViewer(QWidget):
             # ファイルをリネーム
             if self.text_require_sel_pix not in new_name:
                 new_path = os.path.join(os.path.dirname(self.image_path), replace_invalid_chars(new_name))
-                os.rename(self.image_path, new_path)
-            self.image_path=new_path
-            self.reload_images(new_path)
-            return new_path
+                self._submit_renames([(self.image_path, new_path)])
+                return new_path
+            return self.image_path
         return
 
     def exif_clip_2(self):
         """Exif情報を使って画像ファイル名をリネームする関数"""
         if hasattr(self,"image_path") and self.image_path:
-            exif_info = get_exif(self.image_path)
+            exif_info = self.exif_index.get(self.image_path)
             if not exif_info:return
-            content=""
-
-            # 取得したExifデータをクリップボードにコピー
-            for key, value in exif_info.items():
-                content+=(f"{key}: {value}\n")\
+            # 取得したExifデータをクリップボードにコピー（全タグの変換はここで初めて行われる）
+            content = "".join(f"{key}: {value}\n" for key, value in exif_info.items())
 
+            import pyperclip
             pyperclip.copy(content)
             self.text_widget.setText(content)
 
-    def display_image(self,item):
+    def display_image(self,index):
         """選択した画像を表示"""
-        file_name=item.text()
-        for path in self.image_files:
-            if file_name in path:
-                pixmap = QPixmap(path)
-                if pixmap.isNull():
-                    return
-
-                # 保存しておく（元サイズ）
-                self._current_pixmap = pixmap
-
-                # Fit モード: ビューポートに合わせてアスペクト比維持で縮小表示
-                if getattr(self, 'mode_combo', None) and self.mode_combo.currentIndex() == 0:
-                    # Fit モード: ビューポートに合わせてアスペクト比維持で縮小表示
-                    vp_size = self.scroll_area.viewport().size()
-                    scaled = pixmap.scaled(vp_size.width(), vp_size.height(), Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
-                    self.image_label.setPixmap(scaled)
-                    # ラベルのサイズをピクセルに合わせる（スクロールしない）
-                    self.image_label.setFixedSize(scaled.size())
-                    self.image_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-                    # ビューポート内で小さい画像は中央に表示する
-                    try:
-                        self.scroll_area.setAlignment(Qt.AlignmentFlag.AlignCenter)
-                    except Exception:
-                        pass
-                    self.scroll_area.setWidgetResizable(False)
-                    # Fit モード時はズーム係数を None にする
-                    self._zoom = None
-                else:
-                    # 100% モード: 元ピクセルで表示し、スクロールでパンする
-                    # ズーム係数が未設定なら100%に初期化
-                    if self._zoom is None:
-                        self._zoom = 1.0
-                    # 表示は元ピクセル * ズーム係数
-                    try:
-                        new_w = max(1, int(self._current_pixmap.width() * self._zoom))
-                        new_h = max(1, int(self._current_pixmap.height() * self._zoom))
-                        scaled = self._current_pixmap.scaled(new_w, new_h, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
-                    except Exception:
-                        scaled = pixmap
-                    self.image_label.setPixmap(scaled)
-                    self.image_label.setFixedSize(scaled.size())
-                    # 初期表示は中央に置く（スクロール可能なサイズになればスクロールでパン）
-                    self.image_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-                    self.scroll_area.setWidgetResizable(False)
-                    # UI 更新（ズーム表示）
-                    # モード表示は固定のまま（拡大率は表示しない）
-
-                # パスを保存
-                self.image_path = path
-                self.image_path_simple = os.path.splitext(os.path.basename(path))[0]
-
-                exif = get_exif(path)
-                if exif is None:
-                    break
-                self.text_widget.setText(self.image_path_simple)
-                title_time = exif.get("DateTimeOriginal", "no DateTime")
-                self.setWindowTitle(self.name + " 📂[" + os.path.dirname(self.image_path) + "] ⌚" + title_time)
-
-                break
+        if index is None or not index.isValid():
+            return
+        # 名前 → パスは辞書で引く（部分一致で別ファイルを拾わないように）
+        path = self.folder_model.path_of(index.data())
+        if path is None:
+            return
+        # リネーム待ちの行は、まだ元の名前でディスク上にある
+        path = self._renamer.source_of(path)
 
-    def mousePressEvent(self, event:QMouseEvent):
-        # 全体クリックは特別扱いしない（パンは PanLabel が処理）
-        super().mousePressEvent(event)
+        # パスを保存
+        self.image_path = path
+        self.image_path_simple = os.path.splitext(os.path.basename(path))[0]
 
-    def zoom_pix(self,click_x_on_label,click_y_on_label,isZoom:bool):
-        # 旧来の強引なズーム処理は廃止。将来的にズーム機能を追加する場合はここを実装。
-        return
+        # デコード済みなら即表示、未デコードなら _on_image_ready で表示する
+        decoded = self._decoder.request(path, self._neighbor_paths(index.row()))
+        if decoded is not None:
+            self._show_image(path, decoded)
 
-    def eventFilter(self, source, event):
-        # scroll_area のビューポート上でのドラッグを拾ってパンする
-        try:
-            is_viewport = (source is self.scroll_area.viewport())
-        except Exception:
-            is_viewport = False
+        # 未解析の Exif は、デコーダーがファイルを読み終えてからその内容で解析する（同じファイルを 2 回読まない）
+        if decoded is None and not uses_exiftool(path) and not self.exif_index.cached(path):
+            self._exif_pending = path
+            return
+        self._exif_pending = None
+        self._show_exif(path)
 
-        # パンは 100% モードのみ有効にする
-        mode_ok = getattr(self, 'mode_combo', None) and self.mode_combo.currentIndex() == 1
-        if not mode_ok:
-            return super().eventFilter(source, event)
+    def _show_pending_exif(self, path):
+        if self._exif_pending == path and getattr(self, 'image_path', None) == path:
+            self._exif_pending = None
+            self._show_exif(path)
 
-        # source がビューポートまたはラベルの場合に処理
-        try:
-            is_label = (source is self.image_label)
-        except Exception:
-            is_label = False
+    def _show_exif(self, path):
+        exif = self.exif_index.get(path)
+        if exif is None:
+            return
+        self.text_widget.setText(self.image_path_simple)
+        title_time = exif.get("DateTimeOriginal", "no DateTime")
+        self.setWindowTitle(self.name + " 📂[" + os.path.dirname(self.image_path) + "] ⌚" + title_time)
+
+    def _neighbor_paths(self, row):
+        """リスト上で row の前後 prefetch_count 件のパス（近い順）"""
+        paths = []
+        for d in range(1, self.prefetch_count + 1):
+            for i in (row + d, row - d):
+                if 0 <= i < self.list_model.rowCount():
+                    paths.append(self.folder_model.path(i))
+        return paths
+
+    def _on_image_ready(self, path, decoded):
+        # 追い越された結果は DecodePool 側で捨てられるが、念のため現在の選択と照合する
+        if getattr(self, 'image_path', None) == path:
+            self._show_image(path, decoded)
+            self._show_pending_exif(path)
+
+    def _on_preview_ready(self, path, image):
+        # 本デコードが終わるまで Exif 埋め込みサムネイルを仮表示（Fit モードのみ）
+        if getattr(self, 'image_path', None) == path and self.image_view.zoom is None:
+            self.image_view.set_image(image)
+            self._shown_path = None
+
+    def _show_image(self, path, decoded):
+        """デコード済みの画像を現在の表示モードで表示"""
+        if decoded.image.isNull():
+            return
+        # 同じ画像の高解像度版への差し替えなら倍率と位置を保つ
+        keep_view = self._shown_path == path
+        self._shown_path = path
+        self.image_view.set_image(decoded.image, decoded.full_width, decoded.full_height, keep_view)
+
+    def _request_full_resolution(self):
+        """Zoom で縮小デコードの解像度を超えたら原寸を読み込む"""
+        path = getattr(self, 'image_path', None)
+        if not path:
+            return
+        row = self.folder_model.row(os.path.basename(path))
+        decoded = self._decoder.request(path, self._neighbor_paths(row) if row >= 0 else (), full=True)
+        if decoded is not None:
+            self._show_image(path, decoded)
 
-        if is_viewport or is_label:
-            if event.type() == QEvent.Type.MouseButtonPress and event.button() == Qt.MouseButton.LeftButton:
-                try:
-                    self._pan_last_pos = event.position()
-                except Exception:
-                    self._pan_last_pos = event.pos()
-                self._panning = True
-                logger.debug("eventFilter: start panning at %s (source=%s)", self._pan_last_pos, 'label' if is_label else 'viewport')
-                return True
+    def mousePressEvent(self, event:QMouseEvent):
+        # 全体クリックは特別扱いしない（パンは ImageView が処理）
+        super().mousePressEvent(event)
 
-            if event.type() == QEvent.Type.MouseMove and self._panning and self._pan_last_pos is not None:
-                try:
-                    cur = event.position()
-                except Exception:
-                    cur = event.pos()
-                dx = cur.x() - self._pan_last_pos.x()
-                dy = cur.y() - self._pan_last_pos.y()
-                hbar = self.scroll_area.horizontalScrollBar()
-                vbar = self.scroll_area.verticalScrollBar()
-                hbar.setValue(int(hbar.value() - dx))
-                vbar.setValue(int(vbar.value() - dy))
-                logger.debug("eventFilter: move dx=%.1f dy=%.1f -> h=%d v=%d", dx, dy, hbar.value(), vbar.value())
-                self._pan_last_pos = cur
-                return True
-
-            if event.type() == QEvent.Type.MouseButtonRelease and event.button() == Qt.MouseButton.LeftButton:
-                logger.debug("eventFilter: stop panning (source=%s)", 'label' if is_label else 'viewport')
-                self._panning = False
-                self._pan_last_pos = None
-                return True
-
-            # ホイールでズーム（Zoom モード時）
-            if event.type() == QEvent.Type.Wheel:
-                # 100%（Zoom）モードのみ
-                if getattr(self, 'mode_combo', None) and self.mode_combo.currentIndex() == 1 and self._current_pixmap is not None:
-                    # Qt の角度デルタ
-                    try:
-                        delta = event.angleDelta().y()
-                    except Exception:
-                        # 古い Qt イベント互換
-                        delta = 0
-                    if delta == 0:
-                        return True
-
-                    # ホイールの刻みを元に倍率を決定
-                    factor = 1.001 ** delta  # 滑らかな調整
-                    old_zoom = self._zoom or 1.0
-                    new_zoom = max(0.05, min(6.0, old_zoom * factor))
-
-                    # 画像の中央基準でズームする（上下左右中央を固定）
-                    hbar = self.scroll_area.horizontalScrollBar()
-                    vbar = self.scroll_area.verticalScrollBar()
-                    vp = self.scroll_area.viewport()
-                    vp_w = vp.width()
-                    vp_h = vp.height()
-
-                    # ビューポート中心の座標（画像上の座標）
-                    try:
-                        cur_pixmap = self.image_label.pixmap()
-                    except Exception:
-                        cur_pixmap = None
-                    if cur_pixmap is None:
-                        return True
-                    cur_w = cur_pixmap.width()
-                    cur_h = cur_pixmap.height()
-                    if cur_w == 0 or cur_h == 0:
-                        return True
-
-                    view_center_x = hbar.value() + vp_w/2
-                    view_center_y = vbar.value() + vp_h/2
-
-                    # ホイールズームの基準はマウスポインタ位置（ビューポート座標）に戻す
-                    try:
-                        pos = event.position()
-                    except Exception:
-                        pos = event.pos()
-
-                    # ビューポート中心を原点とした signed 座標（ログ用）
-                    vp = self.scroll_area.viewport()
-                    vp_w = vp.width()
-                    vp_h = vp.height()
-                    offset_x = pos.x() - (vp_w / 2)
-                    offset_y = pos.y() - (vp_h / 2)
-
-                    # 現在ポインタが指している画像内のピクセル座標
-                    hbar = self.scroll_area.horizontalScrollBar()
-                    vbar = self.scroll_area.verticalScrollBar()
-                    img_x = hbar.value() + pos.x()
-                    img_y = vbar.value() + pos.y()
-
-                    # 画像上の比率（現在表示されている画像サイズを基準に）
-                    cur_pixmap = self.image_label.pixmap()
-                    if cur_pixmap is None:
-                        return True
-                    cur_w = cur_pixmap.width()
-                    cur_h = cur_pixmap.height()
-                    if cur_w == 0 or cur_h == 0:
-                        return True
-
-                    rel_x = img_x / cur_w
-                    rel_y = img_y / cur_h
-
-                    # 新しい表示サイズ
-                    orig_w = self._current_pixmap.width()
-                    orig_h = self._current_pixmap.height()
-                    new_w = max(1, int(orig_w * new_zoom))
-                    new_h = max(1, int(orig_h * new_zoom))
-
-                    scaled = self._current_pixmap.scaled(new_w, new_h, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
-                    self.image_label.setPixmap(scaled)
-                    self.image_label.setFixedSize(scaled.size())
-
-                    # マウスポインタ位置が同じ画像上の位置を指すようスクロール位置を調整（ポインタ基準）
-                    new_img_x = int(rel_x * scaled.width())
-                    new_img_y = int(rel_y * scaled.height())
-                    new_h_val = int(new_img_x - pos.x())
-                    new_v_val = int(new_img_y - pos.y())
-                    # clamp to scrollbar range
-                    new_h_val = max(0, min(new_h_val, hbar.maximum()))
-                    new_v_val = max(0, min(new_v_val, vbar.maximum()))
-                    hbar.setValue(new_h_val)
-                    vbar.setValue(new_v_val)
-
-                    # 状態更新 + UI 更新（モード表示に拡大率を反映）
-                    self._zoom = new_zoom
-                    try:
-                        self.mode_combo.setItemText(1, f"Zoom({int(self._zoom*100)}%)")
-                    except Exception:
-                        pass
-
-                    logger.debug("eventFilter: wheel zoom old=%.3f new=%.3f rel=(%.3f,%.3f) offset=(%+.1f,%+.1f) img=(%d,%d) -> scroll=(%d,%d)", old_zoom, new_zoom, rel_x, rel_y, offset_x, offset_y, int(img_x), int(img_y), hbar.value(), vbar.value())
-                    return True
-
-            # 上記条件に該当しない場合はデフォルト処理へ戻す（常に bool を返す）
-            return super().eventFilter(source, event)
+    def zoom_pix(self,click_x_on_label,click_y_on_label,isZoom:bool):
+        # 旧来の強引なズーム処理は廃止。将来的にズーム機能を追加する場合はここを実装。
+        return
 
     def _update_display_mode(self):
-        # モード切替時に現在表示中の画像を再描画
-        if hasattr(self, 'image_path') and self.image_path:
-            # find the corresponding item in the list
-            base = os.path.basename(self.image_path)
-            for i in range(self.list_widget.count()):
-                it = self.list_widget.item(i)
-                if it.text() == base:
-                    self.display_image(it)
-                    break
-
-    def resizeEvent(self, event):
-        # ウィンドウリサイズ時に Fit モードなら再スケール
-        super().resizeEvent(event)
-        try:
-            if getattr(self, 'mode_combo', None) and self.mode_combo.currentIndex() == 0 and self._current_pixmap is not None:
-                vp_size = self.scroll_area.viewport().size()
-                scaled = self._current_pixmap.scaled(vp_size.width(), vp_size.height(), Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
-                self.image_label.setPixmap(scaled)
-        except Exception:
-            pass
+        # Fit: ビューポートに合わせる / Zoom: 100% から開始し、ホイールで倍率変更
+        if self.mode_combo.currentIndex() == 0:
+            self.image_view.set_fit()
+        elif self.image_view.zoom is None:
+            self.image_view.set_zoom(1.0)
+
+    def _toggle_memory_readout(self):
+        if self.memory.changed is None:
+            self.memory.changed = lambda: self.image_view.set_overlay(self.memory.format_usage())
+            self.memory.changed()
+        else:
+            self.memory.changed = None
+            self.image_view.set_overlay("")
+
+    @property
+    def exif_index(self):
+        if self._exif_index is None:
+            from virpe_index import ExifIndex
+            self._exif_index = ExifIndex(self._exif_index_path)
+        return self._exif_index
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self._on_first_paint is not None:
+            # 子ウィジェットの描画まで終わってから呼ぶ
+            callback, self._on_first_paint = self._on_first_paint, None
+            QTimer.singleShot(0, callback)
+
+    def closeEvent(self, event):
+        if self._grouper is not None:
+            self._grouper.cancel()
+        if self._exporter is not None:
+            self._exporter.cancel()
+        for job in list(self._command_jobs):
+            job.cancel()
+        self._renamer.shutdown()
+        self._decoder.shutdown()
+        if self._thumb_loader is not None:
+            self._thumb_loader.shutdown()
+        if self._exif_index is not None:
+            self._exif_index.close()
+        if virpe_trace.enabled():
+            path = virpe_trace.dump()
+            logger.info("trace: %s\n%s", path, virpe_trace.format_summary())
+        super().closeEvent(event)
 
     def custom_command1(self):
-        config = load_config()
-        cmd = config.get('custom_command1')
-        if cmd:
-            subprocess.Popen(cmd)
+        self._run_custom_command('custom_command1', self.custom_command1_name)
         return False
     
     def custom_command2(self):
-        config = load_config()
-        cmd = config.get('custom_command2')
-        if cmd:
-            subprocess.Popen(cmd)
+        self._run_custom_command('custom_command2', self.custom_command2_name)
         return False
 
-def get_exif(file_path):
-    """Exif情報を取得する関数"""
-    exif_data=None
-    try:
-        exif_data=piexif.load(file_path)
-    except Exception as e:
-        if(e):return
-    finally:
-        if not exif_data:return
-
-        # Exif情報を辞書として登録
-        exif_dict ={}
-
-        # 各IFD（Exif情報のカテゴリ）を走査
-        for ifd_name in exif_data:
-            if isinstance(exif_data[ifd_name], dict):  # items() を使うため辞書かチェック
-                for tag, value in exif_data[ifd_name].items():
-                    tag_name = piexif.TAGS[ifd_name].get(tag, {"name": tag})["name"]
-
-                    # `bytes` 型ならデコード（例: メーカー名など）
-                    if isinstance(value, bytes):
-                        try:
-                            value = value.decode("utf-8",errors="replace").replace('\x00','')
-                        except UnicodeDecodeError:
-                            value = value.hex()  # デコードできなければ16進数に変換
-
-                    # `Rational`（分数表記）を処理
-                    if isinstance(value, tuple) and len(value) == 2:
-                        value = Fraction(value[0], value[1])  # 分子/分母 → Fractionに変換
-
-                    exif_dict[tag_name] = value
-
-        return exif_dict
-
-def rename_exif(file_path):
-    """Exif情報を使って画像ファイル名をリネームする関数"""
-    exif_info = get_exif(file_path)
-
-    # Exifの撮影日時を取得
-    datetime_str = exif_info['DateTimeOriginal']
-    match = re.search(r"\d{4}:\d{2}:\d{2} \d{2}:\d{2}:\d{2}", datetime_str)
-    if match:
-
-        # Exif情報を取得
-        shutter_speed = exif_info.get('ExposureTime')
-        f_number = exif_info.get('FNumber')
-        iso = exif_info.get('ISOSpeedRatings') or exif_info.get('PhotographicSensitivity')
-        focal_length_actual = exif_info.get('FocalLength') # 実際のレンズ焦点距離
-        focal_length_35mm = exif_info.get('FocalLengthIn35mmFilm') # 35mm換算焦点距離
-        focal_length_multiplier = focal_length_35mm/focal_length_actual if focal_length_actual and focal_length_35mm else None # 焦点距離倍率
-        is_apsc = focal_length_multiplier and focal_length_multiplier == 1.5     #APSCサイズ
-        is_fullframe = focal_length_multiplier and focal_length_multiplier == 1 #フルサイズ
-
-        # シャッタースピードの整形
-        if isinstance(shutter_speed, Fraction):
-            shutter_speed_str = f" {shutter_speed.numerator}／{shutter_speed.denominator}秒"
-        elif isinstance(shutter_speed, (int, float)):
-            shutter_speed_str = f" {shutter_speed:.1f}秒"
-        else:
-            shutter_speed_str = ""
-
-        # F値の整形
-        f_number_str_o = f" F{float(f_number)}" if f_number else ""
-        f_number_str=f_number_str_o.replace("/","／")
-
-        # ISOの整形
-        iso_str = f" ISO{iso}" if iso else ""
-
-        # 焦点距離の整形
-        if is_apsc:
-            focal_length_str = f" {int(focal_length_actual)}mm(35:{int(focal_length_35mm)})" if focal_length_actual else ""
-        elif is_fullframe:
-            focal_length_str = f" {int(focal_length_actual)}mm(f)" if focal_length_actual else ""
-        else:
-            focal_length_str = f" {int(focal_length_actual)}mm(35:{int(focal_length_35mm)} mul:{focal_length_multiplier} apsc:{is_apsc} full:{is_fullframe})" if focal_length_actual else ""
-
-        # 新しいファイル名を作成
-        new_name = os.path.splitext(file_path)[0]
-        new_name += replace_invalid_chars(f"{shutter_speed_str}{f_number_str}{iso_str}{focal_length_str}")
-        new_name += os.path.splitext(file_path)[1]  # 拡張子を追加
-
-        # ファイルをリネーム
-        new_path = os.path.join(os.path.dirname(file_path), new_name)
-        if "ISO" not in os.path.basename(file_path):
-            os.rename(file_path, new_path)
-        else:
-            return file_path
-
-        return new_path
-
-
-    return file_path  # Exif情報がなければ変更しない
-
-
-def replace_invalid_chars(filename: str) -> str:
-    # 置換用のマッピング（半角→全角）
-    replacement_table = {
-        '\\': '￥',   # バックスラッシュ → 全角円記号
-        '/':  '／',   # スラッシュ → 全角スラッシュ
-        ':':  '：',   # コロン → 全角コロン
-        '*':  '＊',   # アスタリスク → 全角アスタリスク
-        '?':  '？',   # クエスチョンマーク → 全角クエスチョンマーク
-        '"':  '”',   # ダブルクォート → 全角ダブルクォート（例）
-        '<':  '＜',   # 小なり → 全角小なり
-        '>':  '＞',   # 大なり → 全角大なり
-        '|':  '｜'    # パイプ → 全角パイプ
-    }
-    
-    # マッピングに従って文字を置換
-    for char, replacement in replacement_table.items():
-        filename = filename.replace(char, replacement)
-    
-    return filename
-
-
-def load_config() -> dict:
-    """`config.yaml` を読み込み、辞書を返す。存在しないか読み込み失敗なら空辞書を返す。"""
-    config_path = 'config.yaml'
-    if not os.path.exists(config_path):
-        return {}
-    try:
-        with open(config_path, 'r', encoding='utf-8') as f:
-            data = yaml.safe_load(f) or {}
-            if isinstance(data, dict):
-                return data
-            return {}
-    except Exception:
-        return {}
+    def _run_custom_command(self, key, title):
+        """
+        config の key のコマンドを実行する。{path} などのプレースホルダーがあれば選択中のファイルごとに
+        custom_command_jobs 個ずつ並列で実行し、進み具合と結果をパネルに表示する
+        """
+        config = load_config()
+        cmd = config.get(key)
+        if not cmd:
+            return
+        from virpe_commands import CommandRunner, CommandTemplate, launch
+        try:
+            template = CommandTemplate(str(cmd))
+        except ValueError as e:
+            QMessageBox.warning(self, title, f"コマンドを解釈できません:\n{e}")
+            return
+        if not template.per_file:
+            try:
+                launch(template)
+            except OSError as e:
+                QMessageBox.warning(self, title, f"コマンドを起動できません:\n{e}")
+            return
+        paths = self._selected_paths()
+        if not paths:
+            QMessageBox.information(self, title, "画像を選択してください")
+            return
+        from virpe_commandpanel import CommandJob, CommandPanel
+        runner = CommandRunner(
+            template,
+            jobs=int(config.get('custom_command_jobs', 0)),
+            timeout=float(config.get('custom_command_timeout', 0)) or None,
+            exif_for=self.exif_index.get,
+        )
+        job = CommandJob(runner, paths, self)
+        self._command_jobs.add(job)
+        job.finished.connect(lambda *_: self._command_jobs.discard(job))
+        panel = CommandPanel(f"{title}（{len(paths)}件）", job, self)
+        panel.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
+        panel.show()
+        job.start()
 
 class ModifiedTextEdit(QTextEdit):
     def func_rename(self):return False
@@ -693,8 +923,48 @@ if __name__=="__main__":
     except Exception:
         pass
 
-    app= QApplication(sys.argv)
+    from virpe_startup import StartupProfile, parse_startup_args
+    profile_startup, startup_budget, argv = parse_startup_args(sys.argv)
+    profile = StartupProfile(_T0) if profile_startup else None
+    if profile:
+        profile.mark("imports")
+
+    from virpe_instance import NEW_INSTANCE, path_args
+    new_instance = NEW_INSTANCE in argv
+    argv = [a for a in argv if a != NEW_INSTANCE]
+    app= QApplication(argv)
+    if profile:
+        profile.mark("QApplication")
+    # 2 回目以降の起動からパスを受け取る（--new-instance で起動したものは待ち受けない）
+    server = None
+    if load_config().get('single_instance', True) and not new_instance:
+        from virpe_server import InstanceServer
+        server = InstanceServer(parent=app)
+        if not server.listen():
+            server = None
+            # ほぼ同時に起動した別の ViRPE が先に待ち受けを始めていた
+            if forward_to_running(argv[1:]):
+                sys.exit(0)
     viewer = ImageViewer()
+    if server is not None:
+        server.received.connect(viewer.open_paths)
+    if profile:
+        profile.mark("ImageViewer.__init__")
+
+        def _first_paint():
+            profile.mark("first paint")
+            profile.report()
+            if startup_budget is not None:
+                over = profile.total * 1000 > startup_budget
+                print(f"startup: budget {startup_budget:.0f} ms -> {'FAIL' if over else 'ok'}", file=sys.stderr)
+                app.exit(1 if over else 0)
+
+        viewer._on_first_paint = _first_paint
     viewer.show()
+    if profile:
+        profile.mark("show")
+    paths = [p for p in path_args(argv[1:]) if os.path.exists(p)]
+    if paths:
+        viewer.open_paths(paths)
     sys.exit(app.exec())
 
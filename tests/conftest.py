@@ -0,0 +1,7 @@
+"""テスト共通: リポジトリ直下のモジュール（virpe_*.py）を import できるようにする"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
@@ -0,0 +1,74 @@
+"""テスト用の exiftool の代わり（`-stay_open True -@ -` のやり取りだけを真似る）
+
+- `-j` はファイルごとに決まったタグを JSON で返す（存在しないファイルは返さない）
+- `-b -<プレビューのタグ>` は小さな JPEG の bytes を返す
+- ファイル名に "crash" を含むものを渡すと、出力の途中で終了する
+- 環境変数 FAKE_EXIFTOOL_LOG があれば、起動と 1 回のやり取りごとに 1 行書く
+"""
+import json
+import os
+import sys
+
+PREVIEW = b"\xff\xd8\xff\xd9"
+
+
+def log(line):
+    path = os.environ.get("FAKE_EXIFTOOL_LOG")
+    if path:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def record(path):
+    return {
+        "SourceFile": path,
+        "Make": "FAKE",
+        "Model": "RAW-1",
+        "DateTimeOriginal": "2024:01:02 03:04:05",
+        "ExposureTime": 0.004,
+        "FNumber": 2.8,
+        "ISO": 400,
+        "FocalLength": 35,
+        "FocalLengthIn35mmFilm": 52,
+        "Orientation": 6,
+    }
+
+
+def run(args, out):
+    files = [a for a in args if not a.startswith("-")]
+    log(f"execute {len(files)}")
+    if any("crash" in os.path.basename(f) for f in files):
+        out.write(b'[{"SourceFile": ')
+        out.flush()
+        sys.exit(1)
+    if "-b" in args:
+        if any(a in ("-JpgFromRaw", "-PreviewImage") for a in args):
+            out.write(PREVIEW)
+        return
+    records = [record(f) for f in files if os.path.exists(f)]
+    if "-Orientation" in args:
+        records = [{"SourceFile": r["SourceFile"], "Orientation": r["Orientation"]} for r in records]
+    if records:
+        out.write(json.dumps(records).encode("utf-8"))
+        out.write(b"\n")
+
+
+def main():
+    log("start")
+    out = sys.stdout.buffer
+    args = []
+    for line in sys.stdin.buffer:
+        arg = line.decode("utf-8").rstrip("\r\n")
+        if arg.startswith("-execute"):
+            run(args, out)
+            out.write(b"{ready%s}\n" % arg[len("-execute"):].encode())
+            out.flush()
+            args = []
+        elif args[-1:] == ["-stay_open"] and arg == "False":
+            return
+        else:
+            args.append(arg)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""合成した写真フォルダ（virpe_bench.make_corpus）での処理時間（pytest-benchmark）
+
+    python -m pytest tests/test_bench.py --benchmark-only
+    python -m pytest tests/test_bench.py --benchmark-autosave --benchmark-compare
+
+ケースは virpe_bench と同じものを使う（ViRPE.py bench は JSON を手元で比べたいとき用）。
+"""
+import os
+import shutil
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+pytest.importorskip("PIL")
+pytest.importorskip("piexif")
+
+import virpe_bench
+
+CORPUS_COUNT = int(os.environ.get("VIRPE_BENCH_COUNT", 100))
+
+CORE_CASES = (
+    "get_exif", "exif_segment_file", "exif_segment_shared", "exif_new_path", "exif_new_path_template",
+    "rename_exif", "replace_invalid_chars", "folder_load", "folder_reload", "folder_sort",
+)
+# NumPy があるときだけ作られるケース
+META_CASES = ("meta_extract", "meta_filter_sort")
+
+
+@pytest.fixture(scope="module")
+def corpus(tmp_path_factory):
+    folder = tmp_path_factory.mktemp("corpus")
+    return sorted(virpe_bench.make_corpus(str(folder), CORPUS_COUNT, seed=0))
+
+
+@pytest.fixture(scope="module")
+def cases(corpus, tmp_path_factory):
+    # リネームの往復は作業用コピーで行う
+    workdir = tmp_path_factory.mktemp("work")
+    for path in corpus:
+        shutil.copy2(path, workdir)
+    return {name: (func, items) for name, func, items in virpe_bench._core_cases(corpus, str(workdir))}
+
+
+def test_corpus_is_reproducible(corpus, tmp_path):
+    again = virpe_bench.make_corpus(str(tmp_path), CORPUS_COUNT, seed=0)
+    assert sorted(os.path.basename(p) for p in again) == [os.path.basename(p) for p in corpus]
+
+
+@pytest.mark.parametrize("name", CORE_CASES + META_CASES)
+def test_bench(benchmark, cases, name):
+    if name not in cases:
+        pytest.skip(f"{name} は NumPy が無いと測れません")
+    func, items = cases[name]
+    benchmark.group = "core"
+    benchmark.extra_info["items"] = items
+    benchmark(func)
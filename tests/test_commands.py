@@ -0,0 +1,132 @@
+"""カスタムコマンドの展開と並列実行（virpe_commands）"""
+import os
+import shlex
+import sys
+import threading
+import time
+from fractions import Fraction
+
+import pytest
+
+from virpe_commands import CANCELLED, TIMED_OUT, CommandRunner, CommandTemplate
+
+# Windows はコマンドを文字列のまま渡すので、shlex での分割と引用符の付け方が変わる
+pytestmark = pytest.mark.skipif(os.name == 'nt', reason="POSIX のコマンドの分け方を前提にしている")
+
+EXIF = {
+    "Model": "Canon EOS R5",
+    "ExposureTime": Fraction(1, 250),
+    "FNumber": Fraction(28, 10),
+    "ISOSpeedRatings": 400,
+    "DateTimeOriginal": "2024:05:01 14:10:00",
+}
+
+
+def _python(script, *args):
+    return " ".join([shlex.quote(sys.executable), "-c", shlex.quote(script), *args])
+
+
+def _files(folder, count):
+    paths = []
+    for i in range(count):
+        path = folder / f"img {i}.jpg"
+        path.write_bytes(b"")
+        paths.append(str(path))
+    return paths
+
+
+def test_expands_file_fields_into_single_arguments():
+    template = CommandTemplate('convert {path} "{dir}/small/{stem}.png" {stem}{ext} {name}')
+    assert template.per_file and not template.uses_exif
+    assert template.command("/photos/my trip/a b.jpg") == [
+        "convert", "/photos/my trip/a b.jpg", "/photos/my trip/small/a b.png", "a b.jpg", "a b.jpg",
+    ]
+
+
+def test_expands_exif_fields_with_format_specs():
+    template = CommandTemplate('tag "-Artist={Model} x" {ExposureTime} {FNumber:.1f} {iso} '
+                               '{DateTimeOriginal:%Y%m%d} {ISOSpeedRatings:05d}')
+    assert template.uses_exif
+    assert template.command("/p/a.jpg", EXIF) == [
+        "tag", "-Artist=Canon EOS R5 x", "1/250", "2.8", "ISO400", "20240501", "00400",
+    ]
+    # Exif が無ければ空の引数になる
+    assert template.command("/p/a.jpg", None) == ["tag", "-Artist= x", "", "", "", "", ""]
+
+
+def test_without_placeholders_runs_once():
+    template = CommandTemplate("open -a 'Preview App'")
+    assert not template.per_file
+    assert template.command() == ["open", "-a", "Preview App"]
+
+
+def test_runs_in_file_folder_with_expanded_arguments(tmp_path):
+    [path] = _files(tmp_path, 1)
+    script = "import os, sys; print(os.getcwd()); print('|'.join(sys.argv[1:])); sys.exit(3)"
+    template = CommandTemplate(_python(script, "{name}", "{FNumber}"))
+    runner = CommandRunner(template, jobs=1, exif_for=lambda p: EXIF)
+    [result] = list(runner.run([path]))
+    assert result.returncode == 3 and not result.ok
+    assert result.error == ""
+    cwd, args = result.output.splitlines()
+    assert os.path.samefile(cwd, tmp_path)
+    assert args == "img 0.jpg|2.8"
+
+
+def test_jobs_limits_concurrent_processes(tmp_path):
+    paths = _files(tmp_path, 6)
+    runner = CommandRunner(CommandTemplate(_python("import time; time.sleep(0.3)", "{path}")), jobs=2)
+    seen = []
+    stop = threading.Event()
+
+    def watch():
+        while not stop.is_set():
+            with runner._lock:
+                seen.append(len(runner._procs))
+            time.sleep(0.005)
+
+    watcher = threading.Thread(target=watch)
+    watcher.start()
+    start = time.monotonic()
+    try:
+        results = list(runner.run(paths))
+    finally:
+        stop.set()
+        watcher.join()
+    assert sorted(r.path for r in results) == sorted(paths)
+    assert all(r.ok for r in results)
+    assert max(seen) == 2
+    # 2 本ずつ 3 回
+    assert time.monotonic() - start >= 0.9
+
+
+def test_timeout_kills_process(tmp_path):
+    [path] = _files(tmp_path, 1)
+    runner = CommandRunner(CommandTemplate(_python("import time; time.sleep(30)", "{path}")), jobs=1, timeout=0.5)
+    start = time.monotonic()
+    [result] = list(runner.run([path]))
+    assert result.error == TIMED_OUT
+    assert not result.ok
+    assert time.monotonic() - start < 10
+
+
+def test_cancel_kills_running_and_skips_queued(tmp_path):
+    paths = _files(tmp_path, 5)
+    runner = CommandRunner(CommandTemplate(_python("import time; time.sleep(30)", "{path}")), jobs=2)
+    results = []
+    thread = threading.Thread(target=lambda: results.extend(runner.run(paths)))
+    start = time.monotonic()
+    thread.start()
+    while time.monotonic() - start < 10:
+        with runner._lock:
+            if len(runner._procs) == 2:
+                break
+        time.sleep(0.01)
+    runner.cancel()
+    thread.join(10)
+    assert not thread.is_alive()
+    assert sorted(r.path for r in results) == sorted(paths)
+    assert all(r.error == CANCELLED for r in results)
+    # 起動したのは jobs 個分だけ
+    assert sum(r.command is not None for r in results) == 2
+    assert time.monotonic() - start < 10
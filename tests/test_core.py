@@ -0,0 +1,37 @@
+"""Exif からの変更先（virpe_core.exif_new_path）の従来の書式"""
+from fractions import Fraction
+
+import pytest
+
+from virpe_core import exif_new_path
+
+
+@pytest.fixture
+def exif():
+    return {
+        "DateTimeOriginal": "2024:01:02 03:04:05",
+        "ExposureTime": Fraction(1, 250),
+        "FNumber": Fraction(18, 10),
+        "ISOSpeedRatings": 200,
+        "FocalLength": Fraction(26, 1),
+    }
+
+
+def test_without_35mm_equivalent(exif):
+    # スマホなど FocalLengthIn35mmFilm が無いものは実焦点距離だけ付ける
+    assert exif_new_path("/p/IMG_1.jpg", exif) == "/p/IMG_1 1／250秒 F1.8 ISO200 26mm.jpg"
+
+
+def test_apsc(exif):
+    exif["FocalLengthIn35mmFilm"] = 39
+    assert exif_new_path("/p/IMG_1.jpg", exif) == "/p/IMG_1 1／250秒 F1.8 ISO200 26mm(35：39).jpg"
+
+
+def test_fullframe(exif):
+    exif["FocalLengthIn35mmFilm"] = 26
+    assert exif_new_path("/p/IMG_1.jpg", exif) == "/p/IMG_1 1／250秒 F1.8 ISO200 26mm(f).jpg"
+
+
+def test_skips_without_date(exif):
+    del exif["DateTimeOriginal"]
+    assert exif_new_path("/p/IMG_1.jpg", exif) is None
@@ -0,0 +1,99 @@
+"""Exif のタグ名 → 値のマッピング（virpe_exif.ExifTags）を全タグ変換の辞書と比べる"""
+import io
+import pickle
+
+import pytest
+
+piexif = pytest.importorskip("piexif")
+Image = pytest.importorskip("PIL.Image")
+
+import virpe_exif
+from virpe_core import _exif_to_dict, get_exif
+from virpe_exif import ExifTags
+
+# 名前の付いていないタグ番号
+UNKNOWN_TAG = 0xFEDC
+
+
+def _thumbnail():
+    buf = io.BytesIO()
+    Image.new("RGB", (4, 4)).save(buf, "JPEG")
+    return buf.getvalue()
+
+
+def _ifds():
+    exif = {
+        "0th": {
+            piexif.ImageIFD.Make: b"Canon",
+            piexif.ImageIFD.Model: b"Canon EOS R5\x00",
+            piexif.ImageIFD.XResolution: (300, 1),
+            piexif.ImageIFD.Orientation: 1,
+        },
+        "Exif": {
+            piexif.ExifIFD.DateTimeOriginal: b"2024:05:01 14:10:05",
+            piexif.ExifIFD.ExposureTime: (1, 250),
+            piexif.ExifIFD.FNumber: (28, 10),
+            piexif.ExifIFD.ISOSpeedRatings: 400,
+            piexif.ExifIFD.FocalLength: (50, 1),
+            piexif.ExifIFD.MakerNote: b"\x01\x02" * 500,
+        },
+        "GPS": {
+            piexif.GPSIFD.GPSLatitudeRef: b"N",
+            piexif.GPSIFD.GPSLatitude: ((35, 1), (39, 1), (2940, 100)),
+        },
+        "Interop": {piexif.InteropIFD.InteroperabilityIndex: b"R98"},
+        # 0th と同じ名前のタグ（後の IFD の値が優先される）
+        "1st": {piexif.ImageIFD.XResolution: (72, 1)},
+        "thumbnail": _thumbnail(),
+    }
+    ifds = piexif.load(piexif.dump(exif))
+    ifds["Exif"][UNKNOWN_TAG] = 7
+    return ifds
+
+
+def test_matches_full_conversion():
+    ifds = _ifds()
+    expected = _exif_to_dict(ifds)
+    tags = ExifTags(ifds)
+    assert len(tags) == len(expected)
+    assert set(tags) == set(expected)
+    assert dict(tags) == expected
+    assert tags["XResolution"] == 72
+    assert tags[UNKNOWN_TAG] == 7
+    for key in list(expected) + ["LensModel", 0xFEDD, "Foo"]:
+        assert (key in tags) == (key in expected)
+        assert tags.get(key) == expected.get(key)
+    with pytest.raises(KeyError):
+        tags["LensModel"]
+
+
+def test_decodes_only_what_is_read(monkeypatch):
+    decoded = []
+    decode_value = virpe_exif.decode_value
+    monkeypatch.setattr(virpe_exif, "decode_value", lambda value: decoded.append(value) or decode_value(value))
+    tags = ExifTags(_ifds())
+    assert "MakerNote" in tags and "Model" in tags
+    assert len(tags) > 10
+    list(tags)
+    assert decoded == []
+    assert tags["Model"] == "Canon EOS R5"
+    assert tags.get("Model") == "Canon EOS R5"
+    assert decoded == [b"Canon EOS R5\x00"]
+
+
+def test_empty_and_pickle():
+    assert len(ExifTags({"0th": {}, "Exif": {}, "thumbnail": None})) == 0
+    tags = ExifTags(_ifds())
+    tags["Model"]
+    restored = pickle.loads(pickle.dumps(tags))
+    assert dict(restored) == dict(tags)
+
+
+def test_get_exif_returns_lazy_tags(tmp_path):
+    ifds = _ifds()
+    del ifds["Exif"][UNKNOWN_TAG]
+    path = str(tmp_path / "a.jpg")
+    Image.new("RGB", (8, 8)).save(path, exif=piexif.dump(ifds))
+    exif = get_exif(path)
+    assert isinstance(exif, ExifTags)
+    assert dict(exif) == _exif_to_dict(piexif.load(path))
@@ -0,0 +1,150 @@
+"""exiftool ワーカー（virpe_exiftool）と、RAW をまとめて読む CLI / 書き出しのテスト（exiftool は偽物を使う）"""
+import io
+import json
+import os
+import stat
+import sys
+
+import pytest
+
+import virpe_cli
+import virpe_export
+import virpe_exiftool
+from virpe_exiftool import ExifToolError, ExifToolPool
+
+pytestmark = pytest.mark.skipif(os.name == 'nt', reason="偽の exiftool はシェルスクリプトで起動する")
+
+FAKE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_exiftool.py")
+
+
+@pytest.fixture
+def launches(tmp_path, monkeypatch):
+    """偽の exiftool の起動・やり取りの記録（読むたびにファイルから読み直す）"""
+    log = tmp_path / "exiftool.log"
+    monkeypatch.setenv("FAKE_EXIFTOOL_LOG", str(log))
+    return lambda: log.read_text(encoding="utf-8").splitlines() if log.exists() else []
+
+
+@pytest.fixture
+def executable(tmp_path, launches):
+    script = tmp_path / "exiftool"
+    script.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{FAKE}" "$@"\n', encoding="utf-8")
+    script.chmod(script.stat().st_mode | stat.S_IXUSR)
+    return str(script)
+
+
+@pytest.fixture
+def pool(executable):
+    pool = ExifToolPool(executable, size=1)
+    yield pool
+    pool.close()
+
+
+@pytest.fixture
+def default_pool(pool, monkeypatch):
+    """get_exif / get_exif_many が使う共有プールを偽物にする"""
+    monkeypatch.setattr(virpe_exiftool, "_default", pool)
+    return pool
+
+
+def _raw_files(folder, names):
+    paths = []
+    for name in names:
+        path = folder / name
+        path.write_bytes(b"RAW")
+        paths.append(str(path))
+    return paths
+
+
+def test_metadata_is_read_in_one_exchange(pool, tmp_path, launches):
+    paths = _raw_files(tmp_path, ["a.dng", "b.cr3", "c.nef"])
+    exifs = pool.metadata(paths + [str(tmp_path / "missing.dng")])
+    assert [e["Make"] for e in exifs[:3]] == ["FAKE"] * 3
+    assert exifs[3] is None
+    # get_exif と同じタグ名・値の形
+    assert exifs[0]["ISOSpeedRatings"] == 400
+    assert exifs[0]["ExposureTime"].denominator == 250
+    assert launches() == ["start", "execute 4"]
+
+
+def test_preview(pool, tmp_path):
+    path, = _raw_files(tmp_path, ["a.arw"])
+    data, orientation = pool.preview(path)
+    assert data[:2] == b"\xff\xd8"
+    assert orientation == 6
+
+
+def test_process_is_replaced_after_error(pool, tmp_path, launches):
+    good = _raw_files(tmp_path, ["a.dng"])
+    crash = _raw_files(tmp_path, ["crash.dng"])
+    assert pool.metadata(good)[0]["Make"] == "FAKE"
+    with pytest.raises(ExifToolError):
+        pool.metadata(crash)
+    # 途中で失敗したプロセスはプールに戻らない
+    assert pool._started == 0
+    assert pool.metadata(good)[0]["Make"] == "FAKE"
+    assert launches().count("start") == 2
+
+
+def test_failed_process_is_killed(pool, tmp_path):
+    good = _raw_files(tmp_path, ["a.dng"])
+    with pytest.raises(ExifToolError):
+        with pool.process() as proc:
+            # 応答を読み切る前に失敗した（プロセスはまだ動いている）
+            proc._proc.stdin.write(b"-j\n" + good[0].encode() + b"\n-execute99\n")
+            proc._proc.stdin.flush()
+            raise ExifToolError("interrupted")
+    assert not proc.alive
+    assert pool._started == 0
+    # 前の応答が混ざらない
+    assert pool.metadata(good)[0]["Make"] == "FAKE"
+
+
+def test_read_metadata_returns_none_on_error(default_pool, tmp_path):
+    paths = _raw_files(tmp_path, ["crash.dng", "b.dng"])
+    assert virpe_exiftool.read_metadata(paths) == [None, None]
+
+
+def test_rename_exif_reads_raw_in_parent(default_pool, tmp_path, launches, capsys):
+    folder = tmp_path / "photos"
+    folder.mkdir()
+    _raw_files(folder, [f"IMG_{i}.dng" for i in range(5)])
+    # Exif の無い JPEG はワーカープロセスへ渡る
+    for i in range(3):
+        (folder / f"plain_{i}.jpg").write_bytes(b"")
+    status = virpe_cli.main(["rename-exif", str(folder), "--jobs", "2", "--dry-run", "--template", "{stem} {iso}"])
+    out = capsys.readouterr().out
+    assert status == 0
+    assert sum("IMG_" in line and "->" in line and "400" in line for line in out.splitlines()) == 5
+    # 5 枚を 1 回のやり取りで読む
+    assert launches() == ["start", "execute 5"]
+
+
+def test_export_reads_raw_in_parent(default_pool, tmp_path, launches):
+    paths = _raw_files(tmp_path, [f"IMG_{i}.dng" for i in range(4)])
+    (tmp_path / "plain.jpg").write_bytes(b"")
+    paths.insert(2, str(tmp_path / "plain.jpg"))
+    fp = io.StringIO()
+    count = virpe_export.export(paths, fp, 'jsonl', columns=("Make", "iso"), jobs=2)
+    rows = [json.loads(line) for line in fp.getvalue().splitlines()]
+    assert count == 5
+    # 元の順番のまま
+    assert [row["file"] for row in rows] == paths
+    assert [row["Make"] for row in rows] == ["FAKE", "FAKE", "", "FAKE", "FAKE"]
+    assert launches() == ["start", "execute 4"]
+
+
+def test_export_classifies_each_path_once(default_pool, tmp_path, launches, monkeypatch):
+    paths = _raw_files(tmp_path, ["a.dng", "b.dng"])
+    (tmp_path / "plain.jpg").write_bytes(b"")
+    plain = str(tmp_path / "plain.jpg")
+    # 同じファイルが 2 回出てきても、それぞれの位置に行を返す
+    paths = [paths[0], plain, paths[1], plain, paths[0]]
+    checked = []
+    uses_exiftool = virpe_export.uses_exiftool
+    monkeypatch.setattr(virpe_export, "uses_exiftool", lambda path: checked.append(path) or uses_exiftool(path))
+    rows = list(virpe_export.iter_rows(paths, ("Make",), jobs=1))
+    assert [path for path, _ in rows] == paths
+    assert [values["Make"] for _, values in rows] == ["FAKE", "", "FAKE", "", "FAKE"]
+    assert checked == paths
+    assert launches() == ["start", "execute 3"]
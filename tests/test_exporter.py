@@ -0,0 +1,46 @@
+"""GUI からの Exif の書き出し（virpe_exporter）"""
+import os
+import time
+
+import pytest
+
+pytest.importorskip("PyQt6.QtCore")
+from PyQt6.QtCore import QCoreApplication
+
+from virpe_exporter import ExifExporter
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+def _wait(app, done, timeout=60):
+    end = time.monotonic() + timeout
+    while not done() and time.monotonic() < end:
+        app.processEvents()
+        time.sleep(0.01)
+    assert done()
+
+
+def test_restart_does_not_share_part_file(app, tmp_path):
+    paths = []
+    for i in range(300):
+        path = tmp_path / f"IMG_{i:04d}.jpg"
+        path.write_bytes(b"")
+        paths.append(str(path))
+    output = str(tmp_path / "exif.jsonl")
+    exporter = ExifExporter()
+    results = []
+    exporter.finished.connect(lambda *args: results.append(args))
+
+    exporter.start(paths, output, 'jsonl', jobs=2)
+    # 前の書き出しを止めきる前に、同じ出力先へもう一度書き出す
+    exporter.cancel()
+    exporter.start(paths, output, 'jsonl', jobs=2)
+    _wait(app, lambda: results and not any(n.endswith(".part") for n in os.listdir(tmp_path)))
+
+    # 取り消した方の finished は届かない
+    assert results == [(300, output, "")]
+    with open(output, encoding='utf-8') as f:
+        assert len(f.read().splitlines()) == 300
@@ -0,0 +1,114 @@
+"""読んだファイルの内容の短期キャッシュ（virpe_fileio.FileBuffers）"""
+import os
+import threading
+import time
+import types
+from contextlib import contextmanager
+
+import pytest
+
+import virpe_fileio
+from virpe_fileio import FileBuffers
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """FileBuffers の時刻（秒）を進められるようにする"""
+    now = [1000.0]
+    monkeypatch.setattr(virpe_fileio, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def _write(path, data, mtime_ns=None):
+    path.write_bytes(data)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+    return str(path)
+
+
+def test_concurrent_reads_are_merged(tmp_path, monkeypatch):
+    path = _write(tmp_path / "a.jpg", b"x" * 1000)
+    entered = threading.Event()
+    release = threading.Event()
+    reads = []
+
+    @contextmanager
+    def span(name, **kwargs):
+        # 1 回目の読み込みを止めておき、その間に 2 つ目のスレッドが読みに来る
+        reads.append(kwargs["path"])
+        entered.set()
+        release.wait(10)
+        yield
+
+    monkeypatch.setattr(virpe_fileio, "span", span)
+    buffers = FileBuffers()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(bytes(buffers.read(path)))) for _ in range(2)]
+    threads[0].start()
+    assert entered.wait(10)
+    threads[1].start()
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join(10)
+    assert results == [b"x" * 1000] * 2
+    assert reads == [path]
+    assert buffers.bytes_read == 1000
+
+
+def test_expires_after_window(tmp_path, clock):
+    path = _write(tmp_path / "a.jpg", b"abc")
+    buffers = FileBuffers(window=10)
+    buffers.read(path)
+    clock[0] += 9
+    # 使うたびに期限が延びる
+    assert bytes(buffers.peek(path)) == b"abc"
+    clock[0] += 9
+    assert buffers.peek(path) is not None
+    clock[0] += 10
+    assert buffers.peek(path) is None
+    assert path not in buffers
+    assert buffers.bytes == 0
+
+
+def test_changed_file_is_read_again(tmp_path):
+    path = _write(tmp_path / "a.jpg", b"abc", mtime_ns=1_000_000_000)
+    buffers = FileBuffers()
+    buffers.read(path)
+    # 同じサイズで更新時刻だけ変わった
+    _write(tmp_path / "a.jpg", b"xyz", mtime_ns=2_000_000_000)
+    assert buffers.peek(path) is None
+    assert bytes(buffers.read(path)) == b"xyz"
+    # 更新時刻は同じでサイズが変わった
+    _write(tmp_path / "a.jpg", b"longer", mtime_ns=2_000_000_000)
+    assert bytes(buffers.read(path)) == b"longer"
+    assert buffers.bytes_read == 12
+    assert buffers.bytes == 6
+
+
+def test_rename_keeps_contents(tmp_path):
+    old = _write(tmp_path / "a.jpg", b"abc")
+    new = str(tmp_path / "b.jpg")
+    buffers = FileBuffers()
+    buffers.read(old)
+    os.rename(old, new)
+    buffers.rename(old, new)
+    assert old not in buffers
+    assert bytes(buffers.read(new)) == b"abc"
+    assert bytes(buffers.head(new, 2)) == b"ab"
+    assert buffers.bytes_read == 3
+
+
+def test_evicts_least_recently_used(tmp_path):
+    paths = [_write(tmp_path / f"{i}.jpg", b"x" * 40) for i in range(3)]
+    buffers = FileBuffers(max_bytes=100)
+    buffers.read(paths[0])
+    buffers.read(paths[1])
+    buffers.peek(paths[0])
+    buffers.read(paths[2])
+    assert paths[0] in buffers and paths[2] in buffers
+    assert paths[1] not in buffers
+    assert buffers.bytes == 80
+    # keep=False は置かない
+    buffers.read(paths[1], keep=False)
+    assert paths[1] not in buffers
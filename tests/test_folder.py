@@ -0,0 +1,64 @@
+"""一覧のデータ（virpe_folder.FolderModel）と Exif リネームの変更先（virpe_core.exif_rename_pairs）"""
+from virpe_core import exif_rename_pairs
+from virpe_folder import FolderModel
+
+
+def _model(*names):
+    model = FolderModel()
+    model.folder = "/photos"
+    model.extend([(name, 1, 1) for name in names])
+    return model
+
+
+def _rows(model):
+    return {name: model.row(name) for name in model.names}
+
+
+def test_rename_many_swaps():
+    model = _model("a.jpg", "b.jpg", "c.jpg")
+    applied = model.rename_many([("a.jpg", "b.jpg"), ("b.jpg", "a.jpg")])
+    assert sorted(applied) == [(0, "a.jpg", "b.jpg"), (1, "b.jpg", "a.jpg")]
+    assert model.names == ["b.jpg", "a.jpg", "c.jpg"]
+    assert _rows(model) == {"b.jpg": 0, "a.jpg": 1, "c.jpg": 2}
+
+
+def test_rename_many_refuses_existing_name():
+    model = _model("a.jpg", "b.jpg", "c.jpg")
+    assert model.rename_many([("a.jpg", "b.jpg")]) == []
+    assert model.names == ["a.jpg", "b.jpg", "c.jpg"]
+    assert _rows(model) == {"a.jpg": 0, "b.jpg": 1, "c.jpg": 2}
+
+
+def test_rename_many_refuses_chain_onto_refused_name():
+    # a→b が断られると a は残るので、c→a も断る
+    model = _model("a.jpg", "b.jpg", "c.jpg")
+    assert model.rename_many([("c.jpg", "a.jpg"), ("a.jpg", "b.jpg")]) == []
+    assert _rows(model) == {"a.jpg": 0, "b.jpg": 1, "c.jpg": 2}
+
+
+def test_rename_many_refuses_duplicate_target():
+    model = _model("a.jpg", "b.jpg")
+    assert model.rename_many([("a.jpg", "z.jpg"), ("b.jpg", "z.jpg")]) == [(0, "a.jpg", "z.jpg")]
+    assert _rows(model) == {"z.jpg": 0, "b.jpg": 1}
+
+
+def test_rename_refuses_existing_name():
+    model = _model("a.jpg", "b.jpg")
+    assert model.rename("a.jpg", "b.jpg") == 0
+    assert model.names == ["a.jpg", "b.jpg"]
+
+
+def test_exif_rename_pairs_reports_errors_per_file():
+    exifs = {
+        "/p/a.jpg": {"DateTimeOriginal": "2024:01:02 03:04:05", "ISOSpeedRatings": 400},
+        "/p/b.jpg": None,
+    }
+
+    def get(path):
+        if path == "/p/broken.jpg":
+            raise OSError("read error")
+        return exifs[path]
+
+    pairs, errors = exif_rename_pairs(["/p/a.jpg", "/p/b.jpg", "/p/broken.jpg"], get)
+    assert pairs == [("/p/a.jpg", "/p/a ISO400.jpg")]
+    assert errors == [("/p/broken.jpg", "OSError: read error")]
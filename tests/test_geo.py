@@ -0,0 +1,139 @@
+"""GPS → 地名（virpe_geo）。KD 木の検索は総当たりの弦の距離と比べる"""
+from fractions import Fraction
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import virpe_geo
+from virpe_geo import Gazetteer, build_gazetteer, gps_coordinates, to_xyz
+
+# leaf_size の倍数にならない点の数
+COUNT = 1001
+LEAF_SIZE = 8
+
+
+@pytest.fixture(scope="module")
+def places():
+    rng = np.random.default_rng(0)
+    lats = np.degrees(np.arcsin(rng.uniform(-1, 1, COUNT)))
+    lons = rng.uniform(-180, 180, COUNT)
+    names = [f"P{i}\tC{i % 7}" for i in range(COUNT)]
+    return lats, lons, names
+
+
+@pytest.fixture(scope="module")
+def gazetteer(places, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("geo") / "gazetteer.bin")
+    assert build_gazetteer(*places, path, leaf_size=LEAF_SIZE) == COUNT
+    gazetteer = Gazetteer(path)
+    yield gazetteer
+    gazetteer.close()
+
+
+def _brute(gazetteer, coords):
+    """総当たりでの最近傍の弦の長さの 2 乗"""
+    q = to_xyz(coords[:, 0], coords[:, 1]).astype(np.float32)
+    diff = gazetteer.points[None, :, :] - q[:, None, :]
+    return np.einsum('ijk,ijk->ij', diff, diff).min(axis=1)
+
+
+def _found(gazetteer, coords, index):
+    q = to_xyz(coords[:, 0], coords[:, 1]).astype(np.float32)
+    diff = gazetteer.points[index] - q
+    return np.einsum('ij,ij->i', diff, diff)
+
+
+def _queries(gazetteer):
+    rng = np.random.default_rng(1)
+    random = np.column_stack((np.degrees(np.arcsin(rng.uniform(-1, 1, 300))), rng.uniform(-180, 180, 300)))
+    # 根の節の子同士の境目（両方のボックスの間）をまたぐ点
+    a, b = gazetteer.boxes[1], gazetteer.boxes[2]
+    axis = int(np.argmax(np.minimum(np.abs(a[3:] - b[:3]), np.abs(b[3:] - a[:3])) < 1e-3))
+    plane = float((a[3 + axis] + b[axis]) / 2)
+    xyz = rng.normal(size=(200, 3))
+    xyz[:, axis] = plane + rng.uniform(-1e-3, 1e-3, 200)
+    xyz /= np.linalg.norm(xyz, axis=1, keepdims=True)
+    border = np.column_stack((np.degrees(np.arcsin(xyz[:, 2])), np.degrees(np.arctan2(xyz[:, 1], xyz[:, 0]))))
+    return np.vstack((random, border))
+
+
+def test_tree_shape(gazetteer):
+    assert len(gazetteer) == COUNT
+    leaves = gazetteer.hi[(1 << gazetteer.depth) - 1:] - gazetteer.lo[(1 << gazetteer.depth) - 1:]
+    assert leaves.sum() == COUNT
+    assert leaves.max() <= LEAF_SIZE
+
+
+def test_batch_matches_brute_force(gazetteer):
+    coords = _queries(gazetteer)
+    index = gazetteer.nearest(coords, max_km=None)
+    np.testing.assert_allclose(_found(gazetteer, coords, index), _brute(gazetteer, coords), rtol=0, atol=1e-7)
+
+
+def test_batch_in_chunks(gazetteer, monkeypatch):
+    monkeypatch.setattr(virpe_geo, "CHUNK", 64)
+    coords = _queries(gazetteer)
+    index = gazetteer.nearest(coords, max_km=None)
+    np.testing.assert_allclose(_found(gazetteer, coords, index), _brute(gazetteer, coords), rtol=0, atol=1e-7)
+
+
+def test_single_query_matches_brute_force(gazetteer):
+    coords = _queries(gazetteer)[::5]
+    index = np.array([gazetteer.nearest(c, max_km=None)[0] for c in coords])
+    np.testing.assert_allclose(_found(gazetteer, coords, index), _brute(gazetteer, coords), rtol=0, atol=1e-7)
+
+
+def test_exact_match(gazetteer, places):
+    lats, lons, names = places
+    coords = np.column_stack((lats[:50], lons[:50]))
+    expected = [tuple(n.split("\t")) for n in names[:50]]
+    assert [gazetteer.name(i) for i in gazetteer.nearest(coords)] == expected
+    assert gazetteer.name(gazetteer.nearest(coords[7])[0]) == expected[7]
+
+
+def test_max_km(gazetteer, places):
+    lats, lons, _ = places
+    # 点から約 0.5 度（55km）北
+    coords = np.column_stack((np.clip(lats[:20] + 0.5, -90, 90), lons[:20]))
+    far = gazetteer.nearest(coords, max_km=1.0)
+    assert (far == -1).all()
+    assert (gazetteer.nearest(coords[0], max_km=1.0) == -1).all()
+    assert (gazetteer.nearest(coords, max_km=20000) >= 0).all()
+
+
+def test_gps_coordinates_piexif_rationals():
+    exif = {
+        "GPSLatitude": ((35, 1), (39, 1), (2940, 100)),
+        "GPSLatitudeRef": b"N",
+        "GPSLongitude": ((139, 1), (44, 1), (4080, 100)),
+        "GPSLongitudeRef": b"W",
+    }
+    lat, lon = gps_coordinates(exif)
+    assert lat == pytest.approx(35 + 39 / 60 + 29.4 / 3600)
+    assert lon == pytest.approx(-(139 + 44 / 60 + 40.8 / 3600))
+
+
+def test_gps_coordinates_fractions():
+    exif = {
+        "GPSLatitude": (Fraction(33), Fraction(51), Fraction(0)),
+        "GPSLatitudeRef": "S",
+        "GPSLongitude": (Fraction(151), Fraction(12), Fraction(36)),
+        "GPSLongitudeRef": "E",
+    }
+    assert gps_coordinates(exif) == pytest.approx((-(33 + 51 / 60), 151 + 12 / 60 + 36 / 3600))
+
+
+def test_gps_coordinates_exiftool_strings():
+    # exiftool -n の数値と、度分秒の空白区切り
+    assert gps_coordinates({"GPSLatitude": 35.5, "GPSLatitudeRef": "N",
+                            "GPSLongitude": "139 30 0", "GPSLongitudeRef": "E"}) == pytest.approx((35.5, 139.5))
+    assert gps_coordinates({"GPSLatitude": "12.25", "GPSLatitudeRef": "S",
+                            "GPSLongitude": "-0.5", "GPSLongitudeRef": ""}) == pytest.approx((-12.25, -0.5))
+
+
+def test_gps_coordinates_missing_or_invalid():
+    assert gps_coordinates(None) is None
+    assert gps_coordinates({"GPSLatitude": "abc", "GPSLongitude": "1"}) is None
+    assert gps_coordinates({"GPSLatitude": 0, "GPSLongitude": 0}) is None
+    assert gps_coordinates({"GPSLatitude": 95, "GPSLongitude": 0.5}) is None
@@ -0,0 +1,49 @@
+"""知覚ハッシュによるグループ分け（virpe_groups.HashGrouper）"""
+import os
+import time
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("PyQt6.QtCore")
+Image = pytest.importorskip("PIL.Image")
+from PyQt6.QtCore import QCoreApplication
+
+from virpe_groups import HashGrouper
+from virpe_index import ExifIndex
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+def _save(path, pattern):
+    image = Image.new("L", (160, 120))
+    image.putdata([pattern(x, y) for y in range(120) for x in range(160)])
+    image.convert("RGB").save(path, "JPEG", quality=90)
+
+
+def test_groups_near_duplicates(app, tmp_path):
+    folder = tmp_path / "photos"
+    folder.mkdir()
+    _save(folder / "a.jpg", lambda x, y: x)
+    _save(folder / "a2.jpg", lambda x, y: min(255, x + 3))
+    _save(folder / "b.jpg", lambda x, y: (x * 7 + y * 13) % 256)
+    entries = []
+    for name in ("a.jpg", "a2.jpg", "b.jpg"):
+        st = os.stat(folder / name)
+        entries.append((str(folder / name), st.st_size, st.st_mtime_ns))
+
+    index = ExifIndex(str(tmp_path / "index.db"))
+    grouper = HashGrouper(index, jobs=2)
+    results = []
+    grouper.finished.connect(results.append)
+    grouper.start(entries)
+    end = time.monotonic() + 60
+    while not results and time.monotonic() < end:
+        app.processEvents()
+        time.sleep(0.01)
+    index.close()
+
+    assert results == [{"a.jpg": 0, "a2.jpg": 0}]
@@ -0,0 +1,45 @@
+"""Exif のインデックスの先読み（virpe_index.ExifIndex.warm）"""
+import threading
+
+import pytest
+
+import virpe_index
+from virpe_index import ExifIndex
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = ExifIndex(str(tmp_path / "index.sqlite3"))
+    yield index
+    index.close()
+
+
+def test_cancelled_warm_does_not_write_into_next_folder(tmp_path, index, monkeypatch):
+    (tmp_path / "a.jpg").write_bytes(b"a")
+    (tmp_path / "b.jpg").write_bytes(b"b")
+    a, b = str(tmp_path / "a.jpg"), str(tmp_path / "b.jpg")
+    entered = threading.Event()
+    release = threading.Event()
+
+    def get_exif_many(paths):
+        paths = list(paths)
+        if a in paths:
+            # 1 回目の先読みは解析中に止めておき、その間に次のフォルダへ移る
+            entered.set()
+            release.wait(10)
+        return [{"Model": path} for path in paths]
+
+    monkeypatch.setattr(virpe_index, "get_exif_many", get_exif_many)
+    index.warm([a])
+    assert entered.wait(10)
+    old = index._warm_thread
+    index.warm([b])
+    release.set()
+    old.join(10)
+    index._warm_thread.join(10)
+
+    assert a not in index._mem
+    assert index._mem[b][2] == {"Model": b}
+    assert index.parsed == 2
+    # 取り消された分も保存はされている
+    assert index.get(a) == {"Model": a}
@@ -0,0 +1,106 @@
+"""多重起動の抑止（virpe_server.InstanceServer と、別プロセスからの virpe_instance.forward）"""
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+pytest.importorskip("PyQt6.QtNetwork")
+from PyQt6.QtCore import QCoreApplication
+
+from conftest import ROOT
+from virpe_server import InstanceServer
+
+# 別プロセスから forward する（PyQt6 は読み込まない）
+FORWARD = (
+    "import sys; sys.path.insert(0, sys.argv[1]); from virpe_instance import forward; "
+    "paths = sys.argv[3:] if sys.argv[3:] != ['PING'] else None; "
+    "sys.exit(0 if forward(paths, sys.argv[2]) else 1)"
+)
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+@pytest.fixture
+def name(tmp_path):
+    if os.name == 'nt':
+        return f"virpe-test-{os.getpid()}"
+    # Unix ソケットのパスは 100 文字ほどまで
+    return str(tmp_path / "s.sock")
+
+
+@pytest.fixture
+def server(app, name):
+    server = InstanceServer(name)
+    yield server
+    server.close()
+
+
+def _forward(app, name, *args, timeout=10):
+    """子プロセスで forward し、終わるまで GUI スレッドのイベントを回す。終了コードを返す"""
+    child = subprocess.Popen([sys.executable, "-c", FORWARD, ROOT, name, *args])
+    end = time.monotonic() + timeout
+    while child.poll() is None and time.monotonic() < end:
+        app.processEvents()
+        time.sleep(0.01)
+    if child.poll() is None:
+        child.kill()
+        pytest.fail("forward did not finish")
+    # 返事を送った後の切断などを処理する
+    for _ in range(10):
+        app.processEvents()
+    return child.returncode
+
+
+def test_receives_paths_from_another_process(app, server, name):
+    assert server.listen()
+    received = []
+    server.received.connect(received.append)
+    paths = [os.path.join(ROOT, "a b.jpg"), os.path.join(ROOT, "写真")]
+    assert _forward(app, name, *paths) == 0
+    assert received == [paths]
+
+
+def test_ping_is_not_received(app, server, name):
+    assert server.listen()
+    received = []
+    server.received.connect(received.append)
+    assert _forward(app, name, "PING") == 0
+    assert received == []
+
+
+def test_forward_without_server(app, name):
+    assert _forward(app, name, "PING") == 1
+
+
+@pytest.mark.skipif(os.name == 'nt', reason="Unix ソケットのファイルだけの話")
+def test_listen_replaces_stale_socket_file(app, server, name):
+    # 異常終了したプロセスのソケットのファイルだけが残っている
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(name)
+    stale.close()
+    assert os.path.exists(name)
+
+    assert server.listen()
+    received = []
+    server.received.connect(received.append)
+    assert _forward(app, name, ROOT) == 0
+    assert received == [[ROOT]]
+
+
+def test_second_server_does_not_take_over(app, server, name):
+    assert server.listen()
+    other = InstanceServer(name)
+    try:
+        assert not other.listen()
+    finally:
+        other.close()
+    received = []
+    server.received.connect(received.append)
+    assert _forward(app, name, ROOT) == 0
+    assert received == [[ROOT]]
@@ -0,0 +1,109 @@
+"""リネームの計画・ジャーナル・復旧・取り消し（virpe_journal）"""
+import os
+
+import pytest
+
+from virpe_journal import RenameJournal, apply_renames, plan_renames
+
+
+@pytest.fixture
+def journal(tmp_path):
+    # 利用者のジャーナル（default_journal）は使わない
+    return RenameJournal(str(tmp_path / "journal.jsonl"))
+
+
+def _files(folder, *names):
+    for name in names:
+        (folder / name).write_text(name)
+
+
+def _contents(folder):
+    return {p.name: p.read_text() for p in folder.iterdir() if p.name.endswith(".jpg")}
+
+
+def _undo(journal):
+    tx = journal.last_undoable()
+    assert tx is not None
+    pairs = [(new, old) for old, new in reversed(tx['moves'])]
+    return apply_renames(pairs, journal, undo_of=tx['id'])
+
+
+def test_swap_goes_through_temp_name(tmp_path, journal):
+    _files(tmp_path, "a.jpg", "b.jpg")
+    a, b = str(tmp_path / "a.jpg"), str(tmp_path / "b.jpg")
+    plan = plan_renames([(a, b), (b, a)], {"a.jpg", "b.jpg"}, token="t")
+    assert plan.rejected == []
+    [(unit, temp)] = plan.units
+    assert temp == str(tmp_path / ".virpe-t-0.tmp")
+    assert unit[0][:2] == (a, temp)
+    assert unit[-1][:2] == (temp, b)
+
+    moved = []
+    renamed = apply_renames([(a, b), (b, a)], journal, moved=lambda src, dst: moved.append((src, dst)))
+    assert sorted(renamed) == sorted([(a, b), (b, a)])
+    assert _contents(tmp_path) == {"a.jpg": "b.jpg", "b.jpg": "a.jpg"}
+    assert len(moved) == 3
+    assert not any(name.endswith(".tmp") for name in os.listdir(tmp_path))
+
+
+def test_chain_moves_free_target_first(tmp_path, journal):
+    _files(tmp_path, "a.jpg", "b.jpg")
+    a, b, c = (str(tmp_path / n) for n in ("a.jpg", "b.jpg", "c.jpg"))
+    # a→b→c: b を先に c へ動かしてから a を b へ
+    plan = plan_renames([(a, b), (b, c)], {"a.jpg", "b.jpg"})
+    assert [(src, dst) for src, dst, _ in plan.steps] == [(b, c), (a, b)]
+
+    moved = []
+    apply_renames([(a, b), (b, c)], journal, moved=lambda src, dst: moved.append((src, dst)))
+    assert moved == [(b, c), (a, b)]
+    assert _contents(tmp_path) == {"b.jpg": "a.jpg", "c.jpg": "b.jpg"}
+
+
+def test_chain_onto_existing_name_is_rejected(tmp_path, journal):
+    _files(tmp_path, "a.jpg", "b.jpg", "c.jpg", "d.jpg")
+    a, b, c, d = (str(tmp_path / n) for n in ("a.jpg", "b.jpg", "c.jpg", "d.jpg"))
+    # b→c は c が既にあるので断られ、その b を待つ a→b も断る。無関係な d は動かす
+    errors = []
+    renamed = apply_renames(
+        [(a, b), (b, c), (d, str(tmp_path / "e.jpg"))], journal,
+        report=lambda results: errors.extend(r for r in results if r[2]),
+    )
+    assert renamed == [(d, str(tmp_path / "e.jpg"))]
+    assert sorted(old for old, _, _ in errors) == [a, b]
+    assert _contents(tmp_path) == {"a.jpg": "a.jpg", "b.jpg": "b.jpg", "c.jpg": "c.jpg", "e.jpg": "d.jpg"}
+
+
+def test_recover_rolls_back_uncommitted_transaction(tmp_path, journal):
+    _files(tmp_path, "a.jpg", "b.jpg")
+    a, b = str(tmp_path / "a.jpg"), str(tmp_path / "b.jpg")
+    plan = plan_renames([(a, b), (b, a)], {"a.jpg", "b.jpg"}, token="t")
+    journal.begin(plan.moves, plan.steps)
+    # 入れ替えの途中（a を一時的な名前へ逃がし、b を a にしたところ）で落ちたことにする
+    for src, dst, _ in plan.steps[:-1]:
+        os.rename(src, dst)
+    assert len(journal.pending()) == 1
+
+    assert journal.recover() == 2
+    assert _contents(tmp_path) == {"a.jpg": "a.jpg", "b.jpg": "b.jpg"}
+    assert journal.pending() == []
+    # 巻き戻したものは取り消しの対象にならない
+    assert journal.last_undoable() is None
+    assert journal.recover() == 0
+
+
+def test_undo_twice(tmp_path, journal):
+    _files(tmp_path, "a.jpg")
+    a, b, c = (str(tmp_path / n) for n in ("a.jpg", "b.jpg", "c.jpg"))
+    apply_renames([(a, b)], journal)
+    apply_renames([(b, c)], journal)
+    assert _contents(tmp_path) == {"c.jpg": "a.jpg"}
+
+    assert _undo(journal) == [(c, b)]
+    assert _contents(tmp_path) == {"b.jpg": "a.jpg"}
+    assert _undo(journal) == [(b, a)]
+    assert _contents(tmp_path) == {"a.jpg": "a.jpg"}
+    assert journal.last_undoable() is None
+
+    txs = journal.transactions()
+    assert [tx['undo_of'] is not None for tx in txs] == [True, True, False, False]
+    assert all(tx['undone'] for tx in txs[2:])
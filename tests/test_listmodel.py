@@ -0,0 +1,69 @@
+"""一覧の Qt モデルの絞り込み（virpe_listmodel.ImageListModel.apply_query）"""
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("PyQt6.QtCore")
+from PyQt6.QtCore import QCoreApplication, QPersistentModelIndex
+
+from virpe_listmodel import ImageListModel
+from virpe_metatable import compile_query, extract
+
+ISOS = {"a.jpg": 800, "b.jpg": 100, "c.jpg": 3200, "d.jpg": 400}
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+@pytest.fixture
+def model(app):
+    model = ImageListModel()
+    model.folder_model.folder = "/photos"
+    model._insert([(name, 1, 1) for name in ISOS])
+    model._on_metadata_rows("/photos", [(name, extract({"ISOSpeedRatings": iso})) for name, iso in ISOS.items()])
+    resets = []
+    model.modelReset.connect(lambda: resets.append(1))
+    model.resets = resets
+    return model
+
+
+def _shown(model):
+    return [model.index(row).data() for row in range(model.rowCount())]
+
+
+def test_filter_keeps_selection_without_reset(model):
+    selected = QPersistentModelIndex(model.index(0))
+    hidden = QPersistentModelIndex(model.index(1))
+    model.apply_query(compile_query("iso>=400 sort:-iso"))
+    assert _shown(model) == ["c.jpg", "a.jpg", "d.jpg"]
+    assert selected.data() == "a.jpg" and selected.row() == 1
+    assert not hidden.isValid()
+
+    model.apply_query(compile_query("iso>=200"))
+    assert _shown(model) == ["a.jpg", "c.jpg", "d.jpg"]
+    assert selected.row() == 0
+
+    model.apply_query(None)
+    assert _shown(model) == ["a.jpg", "b.jpg", "c.jpg", "d.jpg"]
+    assert model.resets == []
+
+
+def test_unchanged_order_is_not_notified(model):
+    query = compile_query("iso>=400")
+    model.apply_query(query)
+    changes = []
+    for signal in (model.layoutChanged, model.rowsInserted, model.rowsRemoved):
+        signal.connect(lambda *_: changes.append(1))
+    model.apply_query(query)
+    assert changes == []
+
+
+def test_sort_under_query_keeps_base_order(model):
+    model.apply_query(compile_query("iso>=400"))
+    selected = QPersistentModelIndex(model.index(2))
+    model.sort_by("name", reverse=True)
+    assert _shown(model) == ["d.jpg", "c.jpg", "a.jpg"]
+    assert selected.data() == "d.jpg" and selected.row() == 0
+    model.apply_query(None)
+    assert _shown(model) == ["d.jpg", "c.jpg", "b.jpg", "a.jpg"]
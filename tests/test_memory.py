@@ -0,0 +1,83 @@
+"""画像バッファのメモリ予算（virpe_memory.MemoryBudget）"""
+import itertools
+
+from virpe_memory import MemoryBudget
+
+_keys = itertools.count()
+
+
+class FakeImage:
+    """QImage の代わり（cacheKey と sizeInBytes だけ）"""
+
+    def __init__(self, size):
+        self.size = size
+        self.key = next(_keys)
+
+    def cacheKey(self):
+        return self.key
+
+    def sizeInBytes(self):
+        return self.size
+
+
+class FakePool:
+    """shrink() で古いものから 1 枚ずつ捨てるプール"""
+
+    def __init__(self, *sizes):
+        self.held = [FakeImage(s) for s in sizes]
+
+    def images(self):
+        return list(self.held)
+
+    def shrink(self):
+        if not self.held:
+            return False
+        self.held.pop(0)
+        return True
+
+
+def _budget(limit, cache, thumbs, view):
+    budget = MemoryBudget(limit)
+    budget.register("cache", cache, priority=0)
+    budget.register("thumbs", thumbs, priority=1)
+    budget.register("view", view, priority=2)
+    return budget
+
+
+def test_evicts_lowest_priority_first():
+    cache, thumbs, view = FakePool(30, 30, 30), FakePool(10, 10), FakePool(40)
+    budget = _budget(100, cache, thumbs, view)
+    budget.enforce()
+    assert budget.usage()[0] <= 100
+    assert len(cache.held) == 1
+    assert len(thumbs.held) == 2
+    assert len(view.held) == 1
+
+
+def test_keeps_lower_pools_when_view_alone_is_over_budget():
+    # 原寸の画像（150）だけで上限（100）を超えている。縮小段（20）は減らせるが、それでも収まらない
+    cache, thumbs, view = FakePool(30, 30), FakePool(10), FakePool(20, 150)
+    budget = _budget(100, cache, thumbs, view)
+    budget.enforce()
+    assert len(cache.held) == 2
+    assert len(thumbs.held) == 1
+
+
+def test_shrinks_lower_pools_after_view_shrinks():
+    # 表示中の画像の縮小段を捨てると上位だけなら収まるので、その後にキャッシュを減らす
+    cache, thumbs, view = FakePool(30, 30), FakePool(10), FakePool(50, 60)
+    budget = _budget(100, cache, thumbs, view)
+    budget.enforce()
+    assert budget.usage()[0] <= 100
+    assert len(view.held) == 1
+    assert len(thumbs.held) == 1
+    assert len(cache.held) == 1
+
+
+def test_shared_image_is_counted_once():
+    shared = FakeImage(60)
+    cache, view = FakePool(), FakePool()
+    cache.held.append(shared)
+    view.held.append(shared)
+    budget = _budget(100, cache, FakePool(), view)
+    assert budget.usage()[0] == 60
@@ -0,0 +1,89 @@
+"""一覧の絞り込み・並べ替えの条件式（virpe_metatable）"""
+from fractions import Fraction
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from virpe_metatable import MetadataTable, compile_query, extract
+
+EXIFS = [
+    {"DateTimeOriginal": "2024:05:01 14:10:00", "ISOSpeedRatings": 3200, "Model": "Canon EOS R5"},
+    {"DateTimeOriginal": "2024:05:01 23:30:00", "ISOSpeedRatings": 100, "Model": "iPhone 15"},
+    {"DateTimeOriginal": "2024:05:02 01:15:00", "PhotographicSensitivity": 800, "Model": "Canon EOS R5"},
+    {"DateTimeOriginal": "2024:04:30 09:00:00", "Model": "NIKON Z 8 "},
+    None,
+    {"DateTimeOriginal": "2024:05:01 14:10:00", "ISOSpeedRatings": 800,
+     "ExposureTime": Fraction(1, 250), "Model": "iPhone 15"},
+]
+
+
+@pytest.fixture
+def table():
+    table = MetadataTable(len(EXIFS))
+    table.set_rows(list(range(len(EXIFS))), [extract(exif) for exif in EXIFS])
+    return table
+
+
+def _hits(table, text):
+    order, count = compile_query(text).arrange(table)
+    return sorted(order[:count].tolist())
+
+
+def test_extract_iso_falls_back_to_photographic_sensitivity():
+    assert extract(EXIFS[2])[3] == 800
+    assert extract({"ISOSpeedRatings": 0, "PhotographicSensitivity": 400})[3] == 400
+    assert np.isnan(extract(EXIFS[3])[3])
+    assert extract(EXIFS[3])[-1] == "NIKON Z 8"
+
+
+def test_date_range(table):
+    assert _hits(table, "date=2024-05-01") == [0, 1, 5]
+    assert _hits(table, "date>=2024-05-01") == [0, 1, 2, 5]
+    assert _hits(table, "date<2024-05-01") == [3]
+    assert _hits(table, "date=2024-05-01..2024-05-02") == [0, 1, 2, 5]
+    assert _hits(table, "date=2024-05-01T14:00..2024-05-01T15:30") == [0, 5]
+    assert _hits(table, "date=..2024-04-30") == [3]
+
+
+def test_time_range(table):
+    assert _hits(table, "time=14:00..15:00") == [0, 5]
+    assert _hits(table, "time=14:10") == [0, 5]
+    assert _hits(table, "time>=23:00") == [1]
+
+
+def test_time_range_wraps_midnight(table):
+    assert _hits(table, "time=22:00..02:00") == [1, 2]
+
+
+def test_model(table):
+    assert _hits(table, "model=eos") == [0, 2]
+    # != は機種名の無い行を含めない
+    assert _hits(table, "model!=iPhone") == [0, 2, 3]
+    assert _hits(table, "model=eos iso>=1000") == [0]
+
+
+def test_sort_descending_with_nan_last(table):
+    order, count = compile_query("sort:-iso,date").arrange(table)
+    assert count == len(EXIFS)
+    # ISO の同じ 2 と 5 は日時順、ISO の無い 3 と 4 は最後（同順位は元の並び）
+    assert order.tolist() == [0, 5, 2, 1, 3, 4]
+
+
+def test_sort_puts_matching_rows_first(table):
+    order, count = compile_query("iso>=800 sort:date").arrange(table)
+    assert count == 3
+    assert order[:count].tolist() == [0, 5, 2]
+    assert sorted(order[count:].tolist()) == [1, 3, 4]
+
+
+def test_invalid_queries():
+    assert compile_query("  ") is None
+    with pytest.raises(ValueError):
+        compile_query("aperture>=2")
+    with pytest.raises(ValueError):
+        compile_query("model>=EOS")
+    with pytest.raises(ValueError):
+        compile_query("date=2024/05/01")
+    with pytest.raises(ValueError):
+        compile_query("sort:size")
@@ -0,0 +1,61 @@
+"""ワーカースレッドのリネームキュー（virpe_renamer.RenameQueue）"""
+import os
+import time
+
+import pytest
+
+pytest.importorskip("PyQt6.QtCore")
+from PyQt6.QtCore import QCoreApplication
+
+import virpe_journal
+from virpe_renamer import RenameQueue
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+@pytest.fixture
+def queue(app, tmp_path, monkeypatch):
+    # 利用者のジャーナルには書かない
+    monkeypatch.setattr(virpe_journal, "_default", virpe_journal.RenameJournal(str(tmp_path / "journal.jsonl")))
+    queue = RenameQueue()
+    yield queue
+    queue.shutdown()
+
+
+def _wait_idle(app, queue, idle, timeout=10):
+    end = time.monotonic() + timeout
+    while not idle and time.monotonic() < end:
+        app.processEvents()
+        time.sleep(0.01)
+    assert idle
+    assert not queue.busy
+
+
+def test_renames_and_reports_idle(app, queue, tmp_path):
+    (tmp_path / "a.jpg").write_bytes(b"a")
+    (tmp_path / "b.jpg").write_bytes(b"b")
+    idle = []
+    queue.idle.connect(lambda ok, ng: idle.append((ok, ng)))
+    pairs = [(str(tmp_path / "a.jpg"), str(tmp_path / "b.jpg")), (str(tmp_path / "b.jpg"), str(tmp_path / "a.jpg"))]
+    assert queue.submit(pairs) == pairs
+    _wait_idle(app, queue, idle)
+    assert idle == [(2, 0)]
+    assert (tmp_path / "a.jpg").read_bytes() == b"b"
+
+
+def test_pairs_dropped_by_planner_are_reported(app, queue, tmp_path, monkeypatch):
+    # Windows と同じく大文字小文字を区別しない（"A.jpg" と "a.jpg" は同じ元のファイルとして 2 件目が除かれる）
+    monkeypatch.setattr(virpe_journal, "_name_key", str.casefold)
+    (tmp_path / "A.jpg").write_bytes(b"a")
+    idle = []
+    failed = []
+    queue.idle.connect(lambda ok, ng: idle.append((ok, ng)))
+    queue.failed.connect(failed.extend)
+    pairs = [(str(tmp_path / "A.jpg"), str(tmp_path / "b.jpg")), (str(tmp_path / "a.jpg"), str(tmp_path / "c.jpg"))]
+    assert queue.submit(pairs) == pairs
+    _wait_idle(app, queue, idle)
+    assert idle == [(1, 1)]
+    assert [(os.path.basename(old), os.path.basename(new)) for old, new, _ in failed] == [("a.jpg", "c.jpg")]
@@ -0,0 +1,25 @@
+"""起動時間の予算（ViRPE.py --startup-budget）を超えたら失敗させる"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ROOT
+
+pytest.importorskip("PyQt6.QtWidgets")
+
+# 既定は readme の例と同じ 1500ms。遅い CI では VIRPE_STARTUP_BUDGET_MS で変える
+BUDGET_MS = float(os.environ.get("VIRPE_STARTUP_BUDGET_MS", 1500))
+
+
+def test_startup_within_budget(tmp_path):
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen")
+    # トレースは書き出さない（計測が遅くなる）
+    env.pop("VIPRE_TRACE", None)
+    proc = subprocess.run(
+        [sys.executable, os.path.join(ROOT, "ViRPE.py"), "--new-instance", "--startup-budget", str(BUDGET_MS)],
+        cwd=tmp_path, env=env, capture_output=True, text=True, timeout=60,
+    )
+    assert "startup: budget" in proc.stderr, proc.stderr
+    assert proc.returncode == 0, proc.stderr
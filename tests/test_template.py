@@ -0,0 +1,80 @@
+"""リネーム用のファイル名テンプレート（virpe_template）"""
+from fractions import Fraction
+
+import pytest
+
+import virpe_template
+from virpe_template import compile_template
+
+EXIF = {
+    "DateTimeOriginal": "2024:05:01 14:10:05",
+    "ExposureTime": Fraction(1, 250),
+    "FNumber": Fraction(28, 10),
+    "ISOSpeedRatings": 400,
+    "FocalLength": Fraction(50, 1),
+    "FocalLengthIn35mmFilm": 75,
+    "Model": "Canon EOS R5",
+}
+
+
+def test_fields_and_stem():
+    template = compile_template("{stem} {Model} {shutter} {fnumber} {iso} {focal}")
+    assert template.uses_stem
+    assert template.render(EXIF, "IMG_1") == "IMG_1 Canon EOS R5 1／250秒 F2.8 ISO400 50mm(35:75)"
+
+
+def test_optional_group_dropped_when_field_is_empty():
+    template = compile_template("{stem}[ {shutter}][ {ISOSpeedRatings}][ ({Model} {LensModel})]")
+    assert template.render(EXIF, "a") == "a 1／250秒 400"
+    assert template.render({"LensModel": "RF50", "Model": "R5"}, "a") == "a (R5 RF50)"
+    # 括弧の外のフィールドは空でもそのまま
+    assert compile_template("{stem}_{Model}").render({}, "a") == "a_"
+
+
+def test_nested_groups():
+    template = compile_template("x[-{Model}[-{LensModel}]]")
+    assert template.render({"Model": "R5"}) == "x-R5"
+    assert template.render({"Model": "R5", "LensModel": "RF50"}) == "x-R5-RF50"
+    assert template.render({"LensModel": "RF50"}) == "x"
+
+
+def test_format_specs():
+    template = compile_template("{DateTimeOriginal:%Y%m%d_%H%M%S} {FNumber:.2f} {ISOSpeedRatings:05d} {ExposureTime}")
+    assert template.render(EXIF) == "20240501_141005 2.80 00400 1/250"
+    # 書式に合わない値はそのまま
+    assert compile_template("{Model:%Y}|{Model:05d}").render(EXIF) == "Canon EOS R5|Canon EOS R5"
+
+
+def test_unknown_field_is_rejected():
+    with pytest.raises(ValueError, match="fnumbr"):
+        compile_template("{stem} {fnumbr}")
+    with pytest.raises(ValueError):
+        compile_template("{stem")
+    with pytest.raises(ValueError):
+        compile_template("{stem}]")
+    with pytest.raises(ValueError):
+        compile_template("[{stem}")
+
+
+def test_iso_falls_back_to_photographic_sensitivity():
+    exif = {"PhotographicSensitivity": 6400}
+    assert compile_template("{iso} {ISO}").render(exif) == "ISO6400 6400"
+    assert compile_template("{iso}").render({"ISOSpeedRatings": 100, "PhotographicSensitivity": 6400}) == "ISO100"
+    assert compile_template("x[ {iso}]").render({}) == "x"
+
+
+def test_prepare_prefetches_once(monkeypatch):
+    calls = []
+    monkeypatch.setitem(virpe_template.PREFETCH_FIELDS, "place", lambda exifs: calls.append(list(exifs)))
+    monkeypatch.setitem(virpe_template.PREFETCH_FIELDS, "country", lambda exifs: calls.append(list(exifs)))
+    monkeypatch.setitem(virpe_template.BUILTIN_FIELDS, "place", lambda exif: (exif or {}).get("Place"))
+    # 組み込みフィールドは解析のときに引くので、差し替えた BUILTIN_FIELDS でキャッシュを通さずに作る
+    template = compile_template.__wrapped__("{stem}[ {place}]")
+    names = template.render_many([({"Place": "Kyoto"}, "a"), (None, "b"), ({}, "c")])
+    assert names == ["a Kyoto", "b", "c"]
+    # Exif の無いものは渡さない
+    assert calls == [[{"Place": "Kyoto"}]]
+
+    calls.clear()
+    compile_template("{stem}").prepare([EXIF])
+    assert calls == []
@@ -0,0 +1,327 @@
+"""ベンチマーク（合成した写真フォルダで Exif 読み込み・リネーム・一覧・表示の処理時間を測る）
+
+    python ViRPE.py make-corpus <folder> [--count N] [--seed S]
+    python ViRPE.py bench <folder> [--repeat N] [--output result.json] [--compare old.json]
+
+コーパスの生成には Pillow と piexif を使う。同じ seed なら同じファイル群になる。
+結果は JSON に保存し、--compare で以前の結果と比べて遅くなったケースを表示する。
+表示系のケースは PyQt6 があるときだけ、QT_QPA_PLATFORM=offscreen で実行する。
+"""
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from virpe_core import (
+    exif_new_path, exif_segment_of, get_exif, is_image_file, read_exif_segment, rename_exif, replace_invalid_chars,
+)
+from virpe_folder import FolderModel
+from virpe_template import compile_template
+
+# 生成する画像の大きさ（小さいものほど多めに出す）
+CORPUS_SIZES = ((640, 480), (1024, 768), (1600, 1200), (3000, 2000), (4000, 3000), (6000, 4000))
+CORPUS_WEIGHTS = (8, 8, 6, 4, 2, 1)
+# --compare でこの割合以上遅くなったケースを回帰として扱う
+REGRESSION_RATIO = 1.10
+
+_SHUTTER_DENOMINATORS = (8000, 4000, 2000, 1000, 500, 250, 125, 60, 30, 15, 8, 4, 2)
+_CAMERAS = (
+    (b"Canon", b"Canon EOS R6", 1.0),
+    (b"SONY", b"ILCE-6400", 1.5),
+    (b"FUJIFILM", b"X-T4", 1.5),
+    (b"OLYMPUS CORPORATION", b"E-M1MarkII", 2.0),
+    (b"Apple", b"iPhone 13", 0),
+)
+
+
+def _corpus_name(rng, i):
+    # 実際のカメラ・スマホ・リネーム済みに近い名前を混ぜる
+    kind = rng.random()
+    if kind < 0.4:
+        return f"IMG_{i:04d}.JPG"
+    if kind < 0.7:
+        return f"DSC{i:05d}.jpg"
+    if kind < 0.8:
+        return f"P{i} 旅行.jpeg"
+    if kind < 0.9:
+        return f"IMG_{i:04d} 1／250秒 F2.8 ISO400.jpg"
+    return f"photo-{i}.jpg"
+
+
+def _corpus_exif(rng, i, piexif, thumbnail):
+    make, model, crop = rng.choice(_CAMERAS)
+    taken = time.gmtime(1_700_000_000 + i * 37)
+    stamp = time.strftime("%Y:%m:%d %H:%M:%S", taken).encode()
+    if rng.random() < 0.1:
+        exposure = (rng.choice((13, 25, 30)), 10)  # 1.3秒 など
+    else:
+        exposure = (1, rng.choice(_SHUTTER_DENOMINATORS))
+    focal = rng.choice((12, 18, 24, 35, 50, 85, 135, 200))
+    exif_ifd = {
+        piexif.ExifIFD.DateTimeOriginal: stamp,
+        piexif.ExifIFD.ExposureTime: exposure,
+        piexif.ExifIFD.FNumber: (rng.choice((14, 18, 28, 40, 56, 80, 110)), 10),
+        piexif.ExifIFD.ISOSpeedRatings: rng.choice((100, 200, 400, 800, 1600, 6400)),
+        piexif.ExifIFD.FocalLength: (focal * 10, 10),
+    }
+    if crop:
+        exif_ifd[piexif.ExifIFD.FocalLengthIn35mmFilm] = int(focal * crop)
+    if rng.random() < 0.7:
+        # メーカーノートは中身も長さもまちまち（数十バイト〜数十KB、NUL や不正な UTF-8 を含む）
+        length = rng.choice((32, 600, 4000, 30000))
+        exif_ifd[piexif.ExifIFD.MakerNote] = make[:5] + b"\x00\xff" + rng.randbytes(length)
+    exif = {
+        "0th": {
+            piexif.ImageIFD.Make: make,
+            piexif.ImageIFD.Model: model,
+            piexif.ImageIFD.Orientation: rng.choice((1, 1, 1, 3, 6, 8)),
+            piexif.ImageIFD.DateTime: stamp,
+        },
+        "Exif": exif_ifd,
+        "GPS": {},
+        "Interop": {},
+        "1st": {},
+        "thumbnail": None,
+    }
+    if thumbnail is not None:
+        exif["1st"] = {piexif.ImageIFD.Compression: 6}
+        exif["thumbnail"] = thumbnail
+    return piexif.dump(exif)
+
+
+def make_corpus(folder, count=200, seed=0):
+    """folder に合成した JPEG を count 枚作る。一部は Exif なし・PNG にする。作ったパスのリストを返す"""
+    try:
+        import piexif
+        from PIL import Image
+    except ImportError as e:
+        raise RuntimeError(f"コーパスの生成には Pillow と piexif が必要です ({e})")
+    rng = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for i in range(count):
+        w, h = rng.choices(CORPUS_SIZES, CORPUS_WEIGHTS)[0]
+        # ノイズを拡大して、写真に近い圧縮率になるようにする
+        noise = Image.effect_noise((max(1, w // 16), max(1, h // 16)), rng.uniform(20, 80))
+        base = Image.merge("RGB", (noise, noise.rotate(90, expand=False), noise.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+        image = base.resize((w, h), Image.Resampling.BILINEAR)
+        name = _corpus_name(rng, i)
+        path = os.path.join(folder, name)
+        kind = rng.random()
+        if kind < 0.05:
+            path = os.path.splitext(path)[0] + ".png"
+            image.save(path, "PNG", compress_level=1)
+        elif kind < 0.12:
+            image.save(path, "JPEG", quality=85)
+        else:
+            thumbnail = None
+            if rng.random() < 0.6:
+                thumb = image.copy()
+                thumb.thumbnail((160, 120))
+                buf = _jpeg_bytes(thumb)
+                thumbnail = buf if len(buf) < 20000 else None
+            image.save(path, "JPEG", quality=85, exif=_corpus_exif(rng, i, piexif, thumbnail))
+        # 更新日時順の並べ替えも再現できるよう時刻を固定する
+        stamp = 1_700_000_000 + rng.randrange(0, 86400 * 365)
+        os.utime(path, (stamp, stamp))
+        paths.append(path)
+    return paths
+
+
+def _jpeg_bytes(image):
+    buf = io.BytesIO()
+    image.save(buf, "JPEG", quality=75)
+    return buf.getvalue()
+
+
+# --- 計測 ---
+
+def _measure(func, repeat):
+    times = []
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def _result(times, items):
+    best = min(times)
+    return {
+        "items": items,
+        "repeat": len(times),
+        "min_s": best,
+        "median_s": statistics.median(times),
+        "mean_s": statistics.fmean(times),
+        "items_per_s": items / best if best > 0 else None,
+    }
+
+
+def _core_cases(files, workdir):
+    """(名前, 関数, 1 回あたりの件数) の並び。workdir はリネームの往復に使う作業用コピー"""
+    exifs = [get_exif(p) for p in files]
+    names = [os.path.basename(p) for p in files]
+    template = compile_template("{DateTimeOriginal:%Y%m%d_%H%M%S}[ {shutter}][ {fnumber}][ {iso}][ {focal}]")
+    work = [os.path.join(workdir, n) for n in names]
+    folder = os.path.dirname(files[0])
+    model = FolderModel(folder)
+
+    def rename_roundtrip():
+        for path, exif in zip(work, exifs):
+            new_path = rename_exif(path, exif)
+            if new_path and new_path != path:
+                os.rename(new_path, path)
+
+    # デコーダーが読んだ直後（virpe_fileio に内容がある）の Exif の取り出し。ファイルから読むものと比べる
+    jpegs = [p for p in files if not p.lower().endswith('.png')]
+    contents = []
+    for path in jpegs:
+        with open(path, 'rb') as f:
+            contents.append(f.read())
+
+    def resort():
+        # 並び済みのリストを並べ直すと速すぎるので、毎回別のキーから並べ直す
+        model.sort('mtime')
+        model.sort('natural')
+
+    cases = [
+        ("get_exif", lambda: [get_exif(p) for p in files], len(files)),
+        ("exif_segment_file", lambda: [read_exif_segment(p) for p in jpegs], len(jpegs)),
+        ("exif_segment_shared", lambda: [exif_segment_of(c) for c in contents], len(contents)),
+        ("exif_new_path", lambda: [exif_new_path(p, e) for p, e in zip(files, exifs)], len(files)),
+        ("exif_new_path_template", lambda: [exif_new_path(p, e, template) for p, e in zip(files, exifs)], len(files)),
+        ("rename_exif", rename_roundtrip, len(files)),
+        ("replace_invalid_chars", lambda: [replace_invalid_chars(n + ' 1/250秒 "a:b"?') for n in names], len(names)),
+        ("folder_load", lambda: FolderModel(folder), len(files)),
+        ("folder_reload", model.sync, len(files)),
+        ("folder_sort", resort, len(files)),
+    ]
+    return cases + _meta_cases(exifs)
+
+
+def _meta_cases(exifs):
+    """Exif の表（MetadataTable）での絞り込み・並べ替え。NumPy が無ければ空"""
+    try:
+        from virpe_metatable import MetadataTable, compile_query, extract
+    except ImportError:
+        return []
+    table = MetadataTable(len(exifs))
+    table.set_rows(list(range(len(exifs))), [extract(e) for e in exifs])
+    query = compile_query("iso>=400 time=09:00..18:00 focal>=50 sort:-iso,date")
+    return [
+        ("meta_extract", lambda: [extract(e) for e in exifs], len(exifs)),
+        ("meta_filter_sort", lambda: query.arrange(table), len(exifs)),
+    ]
+
+
+def _qt_cases(files):
+    """表示系（縮小デコード・Fit/Zoom の描画）のケース。PyQt6 が無ければ空"""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    try:
+        from PyQt6.QtCore import QSize
+        from PyQt6.QtWidgets import QApplication
+    except ImportError:
+        return []
+    from virpe_decode import decode_image
+    from virpe_view import ImageView
+
+    app = QApplication.instance() or QApplication([])
+    jpegs = [p for p in files if not p.lower().endswith('.png')][:40]
+    fit_size = QSize(1920, 1080)
+    # 毎回ファイルから読む時間も測るので、読んだ内容は置いておかない
+    decoded = [decode_image(p, fit_size, keep=False) for p in jpegs]
+    view = ImageView()
+    view.resize(1280, 800)
+
+    def paint(zoom):
+        for d in decoded:
+            view.set_image(d.image, d.full_width, d.full_height)
+            if zoom is None:
+                view.set_fit()
+            else:
+                view.set_zoom(zoom)
+            view.grab()
+        app.processEvents()
+
+    return [
+        ("decode_full", lambda: [decode_image(p, keep=False) for p in jpegs], len(jpegs)),
+        ("decode_fit", lambda: [decode_image(p, fit_size, keep=False) for p in jpegs], len(jpegs)),
+        ("paint_fit", lambda: paint(None), len(decoded)),
+        ("paint_zoom_25", lambda: paint(0.25), len(decoded)),
+        ("paint_zoom_100", lambda: paint(1.0), len(decoded)),
+    ]
+
+
+def run_benchmarks(folder, repeat=5, qt=True, progress=None):
+    """folder の画像で各ケースを repeat 回ずつ測り、結果の辞書を返す"""
+    folder = os.path.abspath(folder)
+    files = sorted(
+        os.path.join(folder, n) for n in os.listdir(folder) if is_image_file(n)
+    )
+    if not files:
+        raise RuntimeError(f"画像がありません: {folder}")
+    workdir = tempfile.mkdtemp(prefix="virpe-bench-")
+    try:
+        for path in files:
+            shutil.copy2(path, workdir)
+        cases = _core_cases(files, workdir)
+        if qt:
+            cases += _qt_cases(files)
+        results = {}
+        for name, func, items in cases:
+            func()  # ウォームアップ（ページキャッシュ・遅延 import）
+            results[name] = _result(_measure(func, repeat), items)
+            if progress:
+                progress(name, results[name])
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "corpus": {
+            "folder": folder,
+            "files": len(files),
+            "bytes": sum(os.path.getsize(p) for p in files),
+        },
+        "results": results,
+    }
+
+
+def compare(current, previous, ratio=REGRESSION_RATIO):
+    """
+    2 つの結果（run_benchmarks の戻り値）の min_s を比べる。
+    戻り値: (名前, 以前の秒数, 今回の秒数, 比) のリストと、そのうち ratio 以上遅くなった名前のリスト
+    """
+    rows = []
+    regressions = []
+    for name, now in current["results"].items():
+        before = previous.get("results", {}).get(name)
+        if not before or not before.get("min_s"):
+            continue
+        r = now["min_s"] / before["min_s"]
+        rows.append((name, before["min_s"], now["min_s"], r))
+        if r >= ratio:
+            regressions.append(name)
+    return rows, regressions
+
+
+def save_results(path, results):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+def load_results(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def format_result(name, result):
+    rate = result["items_per_s"]
+    rate = f"{rate:10.1f}/s" if rate else " " * 12
+    return f"{name:<24} {result['min_s'] * 1000:9.2f} ms (median {result['median_s'] * 1000:9.2f} ms) {rate}"
+
@@ -0,0 +1,385 @@
+"""ヘッドレス（PyQt6 を読み込まない）コマンドライン処理
+
+    python ViRPE.py rename-exif <folder> [--recursive] [--jobs N] [--dry-run] [--template T]
+    python ViRPE.py undo-rename [--count N] [--list] [--dry-run]
+    python ViRPE.py bench-exif <folder> [--recursive] [--repeat N]
+    python ViRPE.py make-corpus <folder> [--count N] [--seed S]
+    python ViRPE.py bench <folder> [--repeat N] [--output result.json] [--compare old.json] [--no-qt]
+    python ViRPE.py export-exif <folder> [--recursive] [--format csv|jsonl] [--columns A,B,...] [--output FILE] [--jobs N]
+    python ViRPE.py gazetteer <cities1000.txt> [--output gazetteer.bin] [--min-population N]
+"""
+import argparse
+import itertools
+import multiprocessing
+import os
+import sys
+import time
+from virpe_core import exif_new_path, get_exif, get_exif_many, get_exif_piexif, is_image_file, load_config, uses_exiftool
+from virpe_journal import apply_renames, default_journal
+from virpe_template import compile_template
+import virpe_trace
+
+# rename-exif で exiftool に 1 回で渡す RAW / HEIF の数
+RAW_BATCH = 200
+
+COMMANDS = ('rename-exif', 'undo-rename', 'bench-exif', 'make-corpus', 'bench', 'export-exif', 'gazetteer')
+
+
+def iter_image_files(folder, recursive=False):
+    """folder 以下の画像ファイルパスをファイル名順に列挙する"""
+    try:
+        with os.scandir(folder) as it:
+            entries = sorted(it, key=lambda e: e.name)
+    except OSError:
+        return
+    for entry in entries:
+        try:
+            is_dir = entry.is_dir(follow_symlinks=False)
+        except OSError:
+            continue
+        if is_dir:
+            if recursive:
+                yield from iter_image_files(entry.path, True)
+        elif is_image_file(entry.name):
+            yield entry.path
+
+
+def _new_path_one(args):
+    """ワーカープロセスで 1 ファイル分の Exif リネーム後のパスを求める（リネームは全件そろってから行う）"""
+    path, template = args
+    stats = {}
+    try:
+        exif = get_exif(path, stats)
+        # コンパイル結果はプロセスごとにキャッシュされる
+        new_path = exif_new_path(path, exif, compile_template(template) if template else None)
+        return path, new_path, stats.get('bytes_read', 0), None
+    except Exception as e:
+        return path, None, stats.get('bytes_read', 0), f"{type(e).__name__}: {e}"
+
+
+def _raw_new_paths(paths, template):
+    """
+    RAW / HEIF の変更先を求める（_new_path_one と同じ形で返す）。ワーカーごとに exiftool を起動しないよう、
+    このプロセスの exiftool に RAW_BATCH 件ずつまとめて渡す
+    """
+    compiled = compile_template(template) if template else None
+    for i in range(0, len(paths), RAW_BATCH):
+        chunk = paths[i:i + RAW_BATCH]
+        for path, exif in zip(chunk, get_exif_many(chunk)):
+            try:
+                yield path, exif_new_path(path, exif, compiled), 0, None
+            except Exception as e:
+                yield path, None, 0, f"{type(e).__name__}: {e}"
+
+
+def _format_bytes(n):
+    return f"{n / (1024 * 1024):.1f}MB"
+
+
+def cmd_rename_exif(args):
+    folder = os.path.abspath(args.folder)
+    if not os.path.isdir(folder):
+        print(f"フォルダが見つかりません: {folder}", file=sys.stderr)
+        return 2
+
+    template = args.template if args.template is not None else load_config().get('rename_template')
+    if template:
+        try:
+            compile_template(template)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 2
+
+    files = list(iter_image_files(folder, args.recursive))
+    total = len(files)
+    jobs = args.jobs or os.cpu_count() or 1
+    raw = [path for path in files if uses_exiftool(path)]
+    others = [path for path in files if not uses_exiftool(path)]
+    tasks = ((path, template or None) for path in others)
+
+    renamed = skipped = errors = bytes_read = 0
+    pairs = []
+    start = time.perf_counter()
+    if jobs <= 1 or len(others) <= 1:
+        results = map(_new_path_one, tasks)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(min(jobs, len(others)))
+        results = pool.imap_unordered(_new_path_one, tasks, chunksize=max(1, min(64, len(others) // (jobs * 8))))
+    # RAW はワーカーが JPEG を読んでいる間にこのプロセスで読む
+    results = itertools.chain(_raw_new_paths(raw, template or None), results)
+    try:
+        for done, (path, new_path, size, error) in enumerate(results, 1):
+            bytes_read += size
+            rel = os.path.relpath(path, folder)
+            if error:
+                errors += 1
+                print(f"[{done}/{total}] ERROR {rel}: {error}", file=sys.stderr, flush=True)
+            elif new_path:
+                pairs.append((path, new_path))
+            else:
+                skipped += 1
+                print(f"[{done}/{total}] skip {rel}", flush=True)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    def report(results):
+        nonlocal renamed, errors
+        for path, new_path, error in results:
+            rel = os.path.relpath(path, folder)
+            if error:
+                errors += 1
+                print(f"ERROR {rel}: {error}", file=sys.stderr, flush=True)
+            else:
+                renamed += 1
+                print(f"{rel} -> {os.path.basename(new_path)}", flush=True)
+
+    # 変更先がそろってから、衝突を確認して 1 つのトランザクションとしてリネームする
+    journal = None if args.dry_run else default_journal()
+    if journal is not None:
+        journal.recover()
+    apply_renames(pairs, journal, report=report, dry_run=args.dry_run)
+    elapsed = time.perf_counter() - start
+
+    rate = total / elapsed if elapsed > 0 else 0.0
+    byte_rate = bytes_read / elapsed if elapsed > 0 else 0.0
+    action = "would rename" if args.dry_run else "renamed"
+    print(
+        f"{total} files: {renamed} {action}, {skipped} skipped, {errors} errors "
+        f"in {elapsed:.2f}s ({rate:.1f} files/s, {_format_bytes(bytes_read)} read, {_format_bytes(byte_rate)}/s, jobs={jobs})",
+        file=sys.stderr,
+    )
+    return 1 if errors else 0
+
+
+def cmd_undo_rename(args):
+    """ジャーナルに記録したリネームを新しいものから順に元に戻す"""
+    journal = default_journal()
+    if args.list:
+        for tx in journal.transactions():
+            state = "undo" if tx['undo_of'] else ("undone" if tx['undone'] else "")
+            print(f"{tx['time']}  {tx['id']}  {len(tx['moves'])} files  {state}".rstrip())
+        return 0
+    if not args.dry_run:
+        restored = journal.recover()
+        if restored:
+            print(f"中断されたリネームを {restored} 件元に戻しました", file=sys.stderr)
+    status = 0
+    for _ in range(max(1, args.count)):
+        tx = journal.last_undoable()
+        if tx is None:
+            print("元に戻せるリネームはありません", file=sys.stderr)
+            break
+        failed = []
+
+        def report(results):
+            for old, new, error in results:
+                if error:
+                    failed.append(old)
+                    print(f"ERROR {old}: {error}", file=sys.stderr, flush=True)
+                else:
+                    print(f"{old} -> {os.path.basename(new)}", flush=True)
+
+        print(f"# {tx['time']} ({len(tx['moves'])} files)", flush=True)
+        apply_renames(
+            [(new, old) for old, new in tx['moves']], None if args.dry_run else journal,
+            report=report, undo_of=tx['id'], dry_run=args.dry_run,
+        )
+        if failed:
+            status = 1
+        if args.dry_run:
+            # 取り消しを記録しないので、さらに前へはさかのぼれない
+            break
+    return status
+
+
+def cmd_bench_exif(args):
+    """APP1 のみ読む get_exif と従来の piexif.load(path) を比較する"""
+    folder = os.path.abspath(args.folder)
+    files = list(iter_image_files(folder, args.recursive))
+    if not files:
+        print(f"画像がありません: {folder}", file=sys.stderr)
+        return 2
+    total_size = sum(os.path.getsize(p) for p in files)
+
+    def run(func):
+        best = None
+        for _ in range(max(1, args.repeat)):
+            start = time.perf_counter()
+            results = [func(p) for p in files]
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, results
+
+    # 1 回目は OS のページキャッシュが冷えていて不利なので、APP1 方式は前後 2 回測って良い方を採る
+    stats = {}
+    t_app1, app1 = run(lambda p: get_exif(p, stats))
+    t_piexif, legacy = run(get_exif_piexif)
+    t_app1_2, _ = run(get_exif)
+    t_app1 = max(1e-9, min(t_app1, t_app1_2))
+    t_piexif = max(1e-9, t_piexif)
+    mismatches = sum(1 for a, b in zip(app1, legacy) if a != b)
+    per_pass = stats.get('bytes_read', 0) / max(1, args.repeat)
+
+    n = len(files)
+    print(f"{n} files, {_format_bytes(total_size)} on disk")
+    print(f"piexif.load(path): {t_piexif:.3f}s ({n / t_piexif:.1f} files/s)")
+    print(f"APP1 only        : {t_app1:.3f}s ({n / t_app1:.1f} files/s, {_format_bytes(per_pass)} read)")
+    print(f"speedup x{t_piexif / t_app1:.2f}, mismatches {mismatches}")
+    return 1 if mismatches else 0
+
+
+def cmd_export_exif(args):
+    """フォルダ内の画像の Exif を CSV / JSON Lines で書き出す"""
+    from virpe_export import export, format_for, parse_columns
+    folder = os.path.abspath(args.folder)
+    if not os.path.isdir(folder):
+        print(f"フォルダが見つかりません: {folder}", file=sys.stderr)
+        return 2
+    fmt = args.format or format_for(args.output)
+    columns = parse_columns(args.columns) or parse_columns(load_config().get('export_columns'))
+    start = time.perf_counter()
+    out = None
+    try:
+        if args.output and args.output != '-':
+            # Excel で開いても文字化けしないよう CSV は BOM つき
+            out = open(args.output, 'w', encoding='utf-8-sig' if fmt == 'csv' else 'utf-8', newline='')
+        count = export(
+            iter_image_files(folder, args.recursive), out or sys.stdout, fmt, columns, args.jobs, root=folder,
+        )
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    finally:
+        if out is not None:
+            out.close()
+    print(f"{count} files exported in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+    return 0
+
+
+def cmd_gazetteer(args):
+    """GeoNames の都市一覧から {place} 用の地名辞典（KD 木）を作る"""
+    from virpe_geo import build_gazetteer, default_path, read_geonames
+    dest = args.output or default_path()
+    start = time.perf_counter()
+    try:
+        lats, lons, names = read_geonames(args.source, args.min_population)
+        count = build_gazetteer(lats, lons, names, dest)
+    except (OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 2
+    print(f"{count} places, {_format_bytes(os.path.getsize(dest))} in {time.perf_counter() - start:.1f}s -> {dest}", file=sys.stderr)
+    return 0
+
+
+def cmd_make_corpus(args):
+    """ベンチマーク用の合成画像フォルダを作る"""
+    from virpe_bench import make_corpus
+    start = time.perf_counter()
+    try:
+        paths = make_corpus(args.folder, args.count, args.seed)
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 2
+    size = sum(os.path.getsize(p) for p in paths)
+    print(f"{len(paths)} files, {_format_bytes(size)} in {time.perf_counter() - start:.1f}s -> {args.folder}", file=sys.stderr)
+    return 0
+
+
+def cmd_bench(args):
+    """各処理のベンチマークを実行し、結果を JSON に保存する"""
+    from virpe_bench import compare, format_result, load_results, run_benchmarks, save_results
+    try:
+        results = run_benchmarks(
+            args.folder, args.repeat, qt=not args.no_qt,
+            progress=lambda name, r: print(format_result(name, r), file=sys.stderr),
+        )
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 2
+    if args.label:
+        results["label"] = args.label
+    if args.output:
+        save_results(args.output, results)
+        print(f"saved: {args.output}", file=sys.stderr)
+    if not args.compare:
+        return 0
+
+    rows, regressions = compare(results, load_results(args.compare))
+    for name, before, now, ratio in rows:
+        mark = "  <-- slower" if name in regressions else ""
+        print(f"{name:<24} {before * 1000:9.2f} ms -> {now * 1000:9.2f} ms  x{ratio:.2f}{mark}")
+    return 1 if regressions else 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="ViRPE.py", description="ViRPE ヘッドレスモード")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("rename-exif", help="Exif 情報をファイル名に付与する")
+    p.add_argument("folder")
+    p.add_argument("--recursive", "-r", action="store_true", help="サブフォルダも処理する")
+    p.add_argument("--jobs", "-j", type=int, default=0, help="ワーカープロセス数（既定: CPU 数）")
+    p.add_argument("--dry-run", "-n", action="store_true", help="リネームせず結果だけ表示する")
+    p.add_argument("--template", "-t", default=None, help="ファイル名テンプレート（既定: config.yaml の rename_template）")
+    p.set_defaults(func=cmd_rename_exif)
+
+    p = sub.add_parser("undo-rename", help="GUI / rename-exif で行ったリネームを元に戻す")
+    p.add_argument("--count", "-c", type=int, default=1, help="さかのぼる回数")
+    p.add_argument("--list", "-l", action="store_true", help="記録されているリネームを一覧表示する")
+    p.add_argument("--dry-run", "-n", action="store_true", help="元に戻さず結果だけ表示する")
+    p.set_defaults(func=cmd_undo_rename)
+
+    p = sub.add_parser("bench-exif", help="Exif 読み込みの速度を従来方式と比較する")
+    p.add_argument("folder")
+    p.add_argument("--recursive", "-r", action="store_true", help="サブフォルダも対象にする")
+    p.add_argument("--repeat", type=int, default=3, help="計測回数（最良値を採用）")
+    p.set_defaults(func=cmd_bench_exif)
+
+    p = sub.add_parser("export-exif", help="フォルダ内の画像の Exif を CSV / JSON Lines で書き出す")
+    p.add_argument("folder")
+    p.add_argument("--recursive", "-r", action="store_true", help="サブフォルダも対象にする")
+    p.add_argument("--format", "-f", choices=("csv", "jsonl"), default=None, help="形式（既定: 出力ファイルの拡張子、無ければ csv）")
+    p.add_argument("--columns", "-c", default=None, help="列（カンマ区切り、Exif タグ名か shutter / iso などの組み込みフィールド）")
+    p.add_argument("--output", "-o", default=None, help="出力ファイル（既定: 標準出力）")
+    p.add_argument("--jobs", "-j", type=int, default=0, help="ワーカープロセス数（既定: CPU 数）")
+    p.set_defaults(func=cmd_export_exif)
+
+    p = sub.add_parser("gazetteer", help="GeoNames の都市一覧（cities1000.txt など）から {place} 用の地名辞典を作る")
+    p.add_argument("source")
+    p.add_argument("--output", "-o", default=None, help="出力ファイル（既定: config.yaml の gazetteer_path、無ければ実行ファイルの隣の gazetteer.bin）")
+    p.add_argument("--min-population", type=int, default=0, help="これより人口の少ない地名は含めない")
+    p.set_defaults(func=cmd_gazetteer)
+
+    p = sub.add_parser("make-corpus", help="ベンチマーク用の合成画像フォルダを作る（Pillow が必要）")
+    p.add_argument("folder")
+    p.add_argument("--count", type=int, default=200, help="枚数")
+    p.add_argument("--seed", type=int, default=0, help="乱数の種（同じ値なら同じフォルダになる）")
+    p.set_defaults(func=cmd_make_corpus)
+
+    p = sub.add_parser("bench", help="Exif・リネーム・一覧・表示のベンチマーク")
+    p.add_argument("folder")
+    p.add_argument("--repeat", type=int, default=5, help="計測回数")
+    p.add_argument("--output", "-o", default=None, help="結果を保存する JSON ファイル")
+    p.add_argument("--compare", "-c", default=None, help="比較する以前の結果（遅くなったケースがあれば終了コード 1）")
+    p.add_argument("--label", default=None, help="結果に付けるラベル（バージョン名など）")
+    p.add_argument("--no-qt", action="store_true", help="表示系（PyQt6）のケースを省く")
+    p.set_defaults(func=cmd_bench)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    status = args.func(args)
+    if virpe_trace.enabled():
+        # ワーカープロセス内のスパンは含まれない（--jobs 1 なら全件）
+        print(f"trace: {virpe_trace.dump()}", file=sys.stderr)
+        print(virpe_trace.format_summary(), file=sys.stderr)
+    return status
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main(sys.argv[1:]))
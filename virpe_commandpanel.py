@@ -0,0 +1,136 @@
+"""カスタムコマンドの並列実行（virpe_commands）を GUI から行い、進み具合と結果を表示するパネル"""
+import logging
+import os
+import threading
+from PyQt6.QtCore import QObject, Qt, pyqtSignal
+from PyQt6.QtWidgets import (
+    QDialog, QHBoxLayout, QHeaderView, QLabel, QProgressBar, QPushButton, QTableWidget, QTableWidgetItem,
+    QTextEdit, QVBoxLayout,
+)
+from virpe_commands import CANCELLED, TIMED_OUT, CommandRunner
+
+logger = logging.getLogger(__name__)
+
+
+class CommandJob(QObject):
+    """CommandRunner を別スレッドで回し、1 件終わるごとに result で知らせる"""
+
+    # CommandResult
+    result = pyqtSignal(object)
+    # 成功件数, 失敗件数
+    finished = pyqtSignal(int, int)
+
+    def __init__(self, runner: CommandRunner, paths, parent=None):
+        super().__init__(parent)
+        self.runner = runner
+        self.paths = list(paths)
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="custom-command", daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        self.runner.cancel()
+
+    def _run(self):
+        ok = failed = 0
+        try:
+            for result in self.runner.run(self.paths):
+                if result.ok:
+                    ok += 1
+                else:
+                    failed += 1
+                self.result.emit(result)
+        except Exception as e:
+            logger.warning("カスタムコマンドの実行に失敗しました: %s", e)
+        self.finished.emit(ok, failed)
+
+
+class CommandPanel(QDialog):
+    """
+    実行中・実行済みのファイルの一覧（終了コード・時間）と、選んだ行のコマンドと出力を表示する。
+    閉じても実行は止まらない（中止ボタンで止める）。
+    """
+
+    def __init__(self, title, job: CommandJob, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(title)
+        self.resize(720, 420)
+        self.job = job
+        self._results = []
+
+        self.status = QLabel()
+        self.progress = QProgressBar()
+        self.progress.setRange(0, len(job.paths))
+        self.btn_cancel = QPushButton("中止")
+        self.btn_cancel.clicked.connect(job.cancel)
+        top = QHBoxLayout()
+        top.addWidget(self.status)
+        top.addWidget(self.progress, 1)
+        top.addWidget(self.btn_cancel)
+
+        self.table = QTableWidget(0, 3)
+        self.table.setHorizontalHeaderLabels(["ファイル", "結果", "時間"])
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
+        self.table.currentCellChanged.connect(lambda row, *_: self._show_output(row))
+        self.output = QTextEdit()
+        self.output.setReadOnly(True)
+        self.output.setLineWrapMode(QTextEdit.LineWrapMode.NoWrap)
+
+        layout = QVBoxLayout(self)
+        layout.addLayout(top)
+        layout.addWidget(self.table, 2)
+        layout.addWidget(self.output, 1)
+
+        job.result.connect(self._on_result)
+        job.finished.connect(self._on_finished)
+        self._update_status()
+
+    def _on_result(self, result):
+        self._results.append(result)
+        row = self.table.rowCount()
+        self.table.insertRow(row)
+        self.table.setItem(row, 0, QTableWidgetItem(os.path.basename(result.path)))
+        if result.error == TIMED_OUT:
+            text = "タイムアウト"
+        elif result.error == CANCELLED:
+            text = "中止"
+        elif result.error:
+            text = "起動できません"
+        else:
+            text = "成功" if result.returncode == 0 else f"終了コード {result.returncode}"
+        item = QTableWidgetItem(text)
+        if not result.ok:
+            item.setForeground(Qt.GlobalColor.red)
+        self.table.setItem(row, 1, item)
+        self.table.setItem(row, 2, QTableWidgetItem(f"{result.elapsed:.1f}秒"))
+        self.progress.setValue(len(self._results))
+        self._update_status()
+
+    def _update_status(self):
+        failed = sum(1 for r in self._results if not r.ok)
+        self.status.setText(f"{len(self._results)} / {len(self.job.paths)} 件" + (f"（失敗 {failed}）" if failed else ""))
+
+    def _show_output(self, row):
+        if not 0 <= row < len(self._results):
+            return
+        result = self._results[row]
+        command = result.command if isinstance(result.command, str) else " ".join(result.command or ())
+        lines = [f"> {command}" if command else ""]
+        if result.error and result.error not in (TIMED_OUT, CANCELLED):
+            lines.append(result.error)
+        lines.append(result.output)
+        self.output.setPlainText("\n".join(lines))
+
+    def _on_finished(self, ok, failed):
+        self.btn_cancel.setEnabled(False)
+        self._update_status()
+        self.status.setText(self.status.text() + " 完了")
@@ -0,0 +1,214 @@
+"""カスタムコマンド（config.yaml の custom_command1 / 2）の展開と並列実行
+
+    custom_command1 : magick "{path}" -resize 50% "{dir}/small/{stem}.jpg"
+    custom_command2 : exiftool -overwrite_original -Artist=me {path}
+
+{path} {dir} {name} {stem} {ext} はファイル、それ以外の {名前} / {名前:書式} はリネーム用テンプレートと同じ
+Exif タグ名・組み込みフィールド（shutter, iso など）。プレースホルダーのあるコマンドは選択中のファイルごとに、
+同時に jobs 個までのプロセスで実行する（無いコマンドは従来どおり 1 回起動するだけ）。
+"""
+import os
+import re
+import shlex
+import signal
+import subprocess
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from virpe_template import compile_template
+
+# ファイルのパスから作るフィールド
+FILE_FIELDS = ('path', 'dir', 'name', 'stem', 'ext')
+# 1 つのコマンドの出力を覚えておく上限（末尾を残す）
+OUTPUT_LIMIT = 64 * 1024
+TIMED_OUT = "timeout"
+CANCELLED = "cancelled"
+
+_PLACEHOLDER = re.compile(r'\{([A-Za-z_][A-Za-z0-9_]*)(?::([^{}]*))?\}')
+
+
+def _file_field(name, path):
+    if name == 'path':
+        return path
+    if name == 'dir':
+        return os.path.dirname(path)
+    if name == 'name':
+        return os.path.basename(path)
+    stem, ext = os.path.splitext(os.path.basename(path))
+    return stem if name == 'stem' else ext
+
+
+class CommandTemplate:
+    """
+    プレースホルダー入りのコマンド。Windows ではコマンド文字列に値をそのまま埋め込む（空白を含むパスは
+    "{path}" のように引用符で囲んで書く）。それ以外では先に shlex で引数に分けてから埋め込むので、
+    値に空白や記号があっても 1 つの引数のまま渡る。
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        self.fields = [m.group(1) for m in _PLACEHOLDER.finditer(source)]
+        self.uses_exif = any(f not in FILE_FIELDS for f in self.fields)
+        for m in _PLACEHOLDER.finditer(source):
+            if m.group(1) not in FILE_FIELDS:
+                compile_template(m.group(0))  # 書けない書式はここで ValueError にする
+        self._args = None if os.name == 'nt' else shlex.split(source)
+
+    @property
+    def per_file(self) -> bool:
+        """ファイルごとに実行するコマンドか"""
+        return bool(self.fields)
+
+    def _expand(self, text, path, exif):
+        def field(m):
+            if m.group(1) in FILE_FIELDS:
+                return _file_field(m.group(1), path)
+            return compile_template(m.group(0)).render(exif or {}, os.path.splitext(os.path.basename(path))[0])
+        return _PLACEHOLDER.sub(field, text)
+
+    def command(self, path=None, exif=None):
+        """path 用に展開したコマンド（Windows は文字列、それ以外は引数のリスト）"""
+        if self._args is None:
+            return self._expand(self.source, path, exif) if path is not None else self.source
+        if path is None:
+            return list(self._args)
+        return [self._expand(arg, path, exif) for arg in self._args]
+
+
+class CommandResult:
+    """1 ファイル分の実行結果。error はタイムアウト・キャンセル・起動できなかった理由（正常終了なら空）"""
+
+    __slots__ = ('path', 'command', 'returncode', 'output', 'elapsed', 'error')
+
+    def __init__(self, path, command, returncode=None, output="", elapsed=0.0, error=""):
+        self.path = path
+        self.command = command
+        self.returncode = returncode
+        self.output = output
+        self.elapsed = elapsed
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return not self.error and self.returncode == 0
+
+
+def _decode(data: bytes) -> str:
+    if len(data) > OUTPUT_LIMIT:
+        data = b"...\n" + data[-OUTPUT_LIMIT:]
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        # Windows のコンソールプログラムは ANSI コードページで出力する
+        return data.decode('mbcs' if os.name == 'nt' else 'latin-1', errors='replace')
+
+
+def _kill(proc):
+    """proc と、その子プロセス（シェル経由で起動したものなど）をまとめて終了させる"""
+    if proc.poll() is not None:
+        return
+    try:
+        if os.name == 'nt':
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(proc.pid)], capture_output=True,
+                           creationflags=subprocess.CREATE_NO_WINDOW)
+        else:
+            os.killpg(proc.pid, signal.SIGKILL)
+    except OSError:
+        pass
+    try:
+        proc.kill()
+    except OSError:
+        pass
+
+
+class CommandRunner:
+    """
+    CommandTemplate を複数のファイルに対して、同時に jobs 個までのプロセスで実行する。
+    run() は終わった順に CommandResult を返すジェネレータ。cancel() は別スレッドから呼んでよく、
+    未着手のものは実行せず、実行中のプロセスは終了させる。
+    """
+
+    def __init__(self, template: CommandTemplate, jobs: int = 0, timeout: float = None, exif_for=None):
+        self.template = template
+        self.jobs = max(1, jobs or os.cpu_count() or 1)
+        self.timeout = timeout or None
+        # path → Exif 辞書（Exif のフィールドを使うときだけ呼ぶ。ワーカースレッドから呼ばれる）
+        self.exif_for = exif_for
+        self._cancel = threading.Event()
+        self._procs = set()
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        self._cancel.set()
+        with self._lock:
+            procs = list(self._procs)
+        for proc in procs:
+            _kill(proc)
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def run(self, paths):
+        paths = list(paths)
+        it = iter(paths)
+        with ThreadPoolExecutor(self.jobs, thread_name_prefix="custom-command") as pool:
+            # 待ち行列に積むのは jobs 個分だけ（キャンセルしたときに積み残しを捨てやすくする）
+            pending = set()
+            while True:
+                while len(pending) < self.jobs and not self.cancelled:
+                    path = next(it, None)
+                    if path is None:
+                        break
+                    pending.add(pool.submit(self.run_one, path))
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        if self.cancelled:
+            for path in it:
+                yield CommandResult(path, None, error=CANCELLED)
+
+    def run_one(self, path) -> CommandResult:
+        if self.cancelled:
+            return CommandResult(path, None, error=CANCELLED)
+        start = time.perf_counter()
+        try:
+            exif = self.exif_for(path) if self.template.uses_exif and self.exif_for is not None else None
+            command = self.template.command(path, exif)
+        except Exception as e:
+            return CommandResult(path, None, error=f"展開できません: {e}")
+        flags = subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+        try:
+            proc = subprocess.Popen(
+                command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                cwd=os.path.dirname(path) or None, creationflags=flags,
+                # 子プロセスごと終了させられるよう、別のプロセスグループで起動する
+                start_new_session=os.name != 'nt',
+            )
+        except OSError as e:
+            return CommandResult(path, command, error=str(e), elapsed=time.perf_counter() - start)
+        with self._lock:
+            self._procs.add(proc)
+        if self.cancelled:
+            _kill(proc)
+        error = ""
+        try:
+            out, _ = proc.communicate(timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            _kill(proc)
+            out, _ = proc.communicate()
+            error = TIMED_OUT
+        finally:
+            with self._lock:
+                self._procs.discard(proc)
+        if self.cancelled and not error and proc.returncode != 0:
+            error = CANCELLED
+        return CommandResult(path, command, proc.returncode, _decode(out or b""),
+                             time.perf_counter() - start, error)
+
+
+def launch(template: CommandTemplate):
+    """プレースホルダーの無いコマンドを 1 回起動する（終了は待たない）"""
+    return subprocess.Popen(template.command())
@@ -0,0 +1,429 @@
+"""GUI に依存しない処理（Exif 取得・リネーム・設定読み込み）"""
+import os
+import re
+import sys
+from fractions import Fraction
+from virpe_exif import ExifTags
+from virpe_fileio import shared as file_buffers
+from virpe_journal import rename_file
+from virpe_template import compile_template
+from virpe_trace import span
+
+# 一覧に表示する画像の拡張子
+IMAGE_EXTS = ('.png','.jpg','jpeg','bmp','gif')
+# メタデータとプレビューを exiftool で読む形式（RAW と HEIF）
+RAW_EXTS = ('.cr2','.cr3','.nef','.arw','.raf','.orf','.rw2','.dng')
+HEIF_EXTS = ('.heic','.heif')
+
+
+def is_image_file(name: str) -> bool:
+    return name.lower().endswith(IMAGE_EXTS + RAW_EXTS + HEIF_EXTS)
+
+
+def uses_exiftool(name: str) -> bool:
+    return name.lower().endswith(RAW_EXTS + HEIF_EXTS)
+
+
+def user_cache_dir(*parts) -> str:
+    """ユーザーごとのキャッシュディレクトリ（無ければ作成）"""
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~\\AppData\\Local')
+        root = os.path.join(base, 'ViRPE', 'cache')
+    elif sys.platform == 'darwin':
+        root = os.path.expanduser('~/Library/Caches/ViRPE')
+    else:
+        root = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'virpe')
+    path = os.path.join(root, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+# Exif 読み込み時に最初に読むバイト数（APP1 はほぼこの範囲に収まる）
+EXIF_READ_SIZE = 64 * 1024
+
+
+def read_exif_segment(file_path, stats=None):
+    """
+    JPEG のマーカーをたどり、APP1(Exif) セグメントだけを読み込む関数。
+    戻り値: TIFF 部分の bytes / Exif を持たない JPEG なら b"" / JPEG でない・想定外の構造なら None
+    stats に辞書を渡すと 'bytes_read' に実際に読んだバイト数を加算する。
+    デコーダーが読んだばかりのファイル（virpe_fileio）なら、読み直さずにその内容から取り出す。
+    """
+    data = file_buffers.peek(file_path)
+    if data is not None:
+        return exif_segment_of(data)
+    nread = 0
+    try:
+        with open(file_path, 'rb') as f:
+            buf = f.read(EXIF_READ_SIZE)
+            nread += len(buf)
+            if buf[:2] != b"\xff\xd8":
+                return None
+            base = 0  # buf[0] のファイル上の位置
+            pos = 2
+            while True:
+                off = pos - base
+                if off + 4 > len(buf):
+                    # 先頭の読み込み範囲を超えたら、次のセグメント位置から読み直す
+                    f.seek(pos)
+                    buf = f.read(EXIF_READ_SIZE)
+                    nread += len(buf)
+                    base, off = pos, 0
+                    if len(buf) < 4:
+                        return None
+                if buf[off] != 0xFF:
+                    return None
+                marker = buf[off + 1]
+                if marker == 0xFF:  # フィルバイト
+                    pos += 1
+                    continue
+                if marker == 0x01 or 0xD0 <= marker <= 0xD8:  # 長さを持たないマーカー
+                    pos += 2
+                    continue
+                if marker in (0xDA, 0xD9):  # 画像データ(SOS)/EOI まで Exif が無かった
+                    return b""
+                length = int.from_bytes(buf[off + 2:off + 4], 'big')
+                if length < 2:
+                    return None
+                if marker == 0xE1:
+                    end = off + 2 + length
+                    if end > len(buf):
+                        f.seek(base + len(buf))
+                        rest = f.read(end - len(buf))
+                        nread += len(rest)
+                        buf = buf + rest
+                    segment = buf[off + 4:end]
+                    if segment[:4] == b"Exif":
+                        return segment[6:]
+                pos += 2 + length
+    except OSError:
+        return None
+    finally:
+        if stats is not None:
+            stats['bytes_read'] = stats.get('bytes_read', 0) + nread
+
+
+def exif_segment_of(data):
+    """read_exif_segment と同じことを、メモリ上のファイルの内容（bytes / memoryview）に対して行う"""
+    if data[:2] != b"\xff\xd8":
+        return None
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:  # フィルバイト
+            pos += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:  # 長さを持たないマーカー
+            pos += 2
+            continue
+        if marker in (0xDA, 0xD9):  # 画像データ(SOS)/EOI まで Exif が無かった
+            return b""
+        length = int.from_bytes(data[pos + 2:pos + 4], 'big')
+        if length < 2:
+            return None
+        if marker == 0xE1 and data[pos + 4:pos + 8] == b"Exif":
+            # piexif は bytes しか受け付けないので、ここで APP1 の分だけコピーする
+            return bytes(data[pos + 10:pos + 2 + length])
+        pos += 2 + length
+    return None
+
+
+def _load_exif_data(file_path, stats=None):
+    """APP1 だけを読んで piexif に渡す。JPEG 以外や想定外の構造は piexif.load(file_path) に任せる"""
+    import piexif  # 起動を速くするため、piexif / yaml は使うときに読み込む
+    tiff = read_exif_segment(file_path, stats)
+    if tiff is None:
+        data = file_buffers.peek(file_path)
+        if data is not None:
+            return piexif.load(bytes(data))
+        if stats is not None:
+            stats['bytes_read'] = stats.get('bytes_read', 0) + os.path.getsize(file_path)
+        return piexif.load(file_path)
+    if not tiff:
+        # Exif を持たない JPEG（piexif.load と同じく空の IFD を返す）
+        return {"0th": {}, "Exif": {}, "GPS": {}, "Interop": {}, "1st": {}, "thumbnail": None}
+    return piexif.load(tiff)
+
+
+def _exif_to_dict(exif_data):
+    """piexif の IFD 辞書をタグ名 → 値の辞書に変換（全タグを変換する従来の方法。get_exif は ExifTags を返す）"""
+    import piexif
+    # Exif情報を辞書として登録
+    exif_dict ={}
+
+    # 各IFD（Exif情報のカテゴリ）を走査
+    for ifd_name in exif_data:
+        if isinstance(exif_data[ifd_name], dict):  # items() を使うため辞書かチェック
+            for tag, value in exif_data[ifd_name].items():
+                tag_name = piexif.TAGS[ifd_name].get(tag, {"name": tag})["name"]
+
+                # `bytes` 型ならデコード（例: メーカー名など）
+                if isinstance(value, bytes):
+                    try:
+                        value = value.decode("utf-8",errors="replace").replace('\x00','')
+                    except UnicodeDecodeError:
+                        value = value.hex()  # デコードできなければ16進数に変換
+
+                # `Rational`（分数表記）を処理
+                if isinstance(value, tuple) and len(value) == 2:
+                    value = Fraction(value[0], value[1])  # 分子/分母 → Fractionに変換
+
+                exif_dict[tag_name] = value
+
+    return exif_dict
+
+
+def get_exif(file_path, stats=None):
+    """Exif情報を取得する関数"""
+    if uses_exiftool(file_path):
+        return get_exif_many([file_path])[0]
+    with span("exif", path=file_path):
+        try:
+            exif_data=_load_exif_data(file_path, stats)
+        except Exception:
+            return
+        if not exif_data:return
+        # タグ名の解決と値の変換は参照されたときに行う
+        return ExifTags(exif_data)
+
+
+def get_exif_many(paths):
+    """
+    複数ファイルの get_exif。RAW / HEIF は exiftool に 1 回のやり取りでまとめて渡す。
+    戻り値は paths と同じ順のリスト
+    """
+    paths = list(paths)
+    result = [None] * len(paths)
+    raw = [i for i, p in enumerate(paths) if uses_exiftool(p)]
+    if raw:
+        from virpe_exiftool import read_metadata
+        with span("exif", files=len(raw), exiftool=True):
+            for i, exif in zip(raw, read_metadata(paths[i] for i in raw)):
+                result[i] = exif
+    for i, path in enumerate(paths):
+        if not uses_exiftool(path):
+            result[i] = get_exif(path)
+    return result
+
+
+def get_exif_piexif(file_path):
+    """ファイル全体を piexif.load に渡す従来の取得方法（比較・ベンチマーク用）"""
+    import piexif
+    try:
+        exif_data=piexif.load(file_path)
+    except Exception:
+        return
+    if not exif_data:return
+    return _exif_to_dict(exif_data)
+
+
+def read_exif_thumbnail(file_path):
+    """APP1 に埋め込まれたサムネイル JPEG と Orientation を返す（無ければ (None, 1)）"""
+    import piexif
+    try:
+        tiff = read_exif_segment(file_path)
+        if not tiff:
+            return None, 1
+        exif_data = piexif.load(tiff)
+    except Exception:
+        return None, 1
+    orientation = exif_data.get("0th", {}).get(piexif.ImageIFD.Orientation, 1)
+    return exif_data.get("thumbnail") or None, orientation
+
+def exif_new_path(file_path, exif_info=None, template=None):
+    """
+    Exif情報から付与後のファイルパスを組み立てる関数（リネームはしない）。付与不要なら None
+    template（compile_template の結果）を渡すとその書式で、無ければ従来の書式で付与する。
+    """
+    if exif_info is None:
+        exif_info = get_exif(file_path)
+    if not exif_info:
+        return None
+    if template is not None:
+        return _template_new_path(file_path, exif_info, template)
+    if "ISO" in os.path.basename(file_path):
+        return None
+
+    # Exifの撮影日時を取得
+    datetime_str = exif_info.get('DateTimeOriginal', "")
+    match = re.search(r"\d{4}:\d{2}:\d{2} \d{2}:\d{2}:\d{2}", datetime_str)
+    if not match:
+        return None
+
+    # Exif情報を取得
+    shutter_speed = exif_info.get('ExposureTime')
+    f_number = exif_info.get('FNumber')
+    iso = exif_info.get('ISOSpeedRatings') or exif_info.get('PhotographicSensitivity')
+    focal_length_actual = exif_info.get('FocalLength') # 実際のレンズ焦点距離
+    focal_length_35mm = exif_info.get('FocalLengthIn35mmFilm') # 35mm換算焦点距離
+    focal_length_multiplier = focal_length_35mm/focal_length_actual if focal_length_actual and focal_length_35mm else None # 焦点距離倍率
+    is_apsc = focal_length_multiplier and focal_length_multiplier == 1.5     #APSCサイズ
+    is_fullframe = focal_length_multiplier and focal_length_multiplier == 1 #フルサイズ
+
+    # シャッタースピードの整形
+    if isinstance(shutter_speed, Fraction):
+        shutter_speed_str = f" {shutter_speed.numerator}／{shutter_speed.denominator}秒"
+    elif isinstance(shutter_speed, (int, float)):
+        shutter_speed_str = f" {shutter_speed:.1f}秒"
+    else:
+        shutter_speed_str = ""
+
+    # F値の整形
+    f_number_str_o = f" F{float(f_number)}" if f_number else ""
+    f_number_str=f_number_str_o.replace("/","／")
+
+    # ISOの整形
+    iso_str = f" ISO{iso}" if iso else ""
+
+    # 焦点距離の整形
+    if is_apsc:
+        focal_length_str = f" {int(focal_length_actual)}mm(35:{int(focal_length_35mm)})" if focal_length_actual else ""
+    elif is_fullframe:
+        focal_length_str = f" {int(focal_length_actual)}mm(f)" if focal_length_actual else ""
+    elif focal_length_35mm:
+        focal_length_str = f" {int(focal_length_actual)}mm(35:{int(focal_length_35mm)} mul:{focal_length_multiplier} apsc:{is_apsc} full:{is_fullframe})" if focal_length_actual else ""
+    else:
+        # 35mm換算が無い（スマホなど）
+        focal_length_str = f" {int(focal_length_actual)}mm" if focal_length_actual else ""
+
+    # 新しいファイル名を作成
+    new_name = os.path.splitext(file_path)[0]
+    new_name += replace_invalid_chars(f"{shutter_speed_str}{f_number_str}{iso_str}{focal_length_str}")
+    new_name += os.path.splitext(file_path)[1]  # 拡張子を追加
+
+    return new_name
+
+
+def exif_rename_pairs(paths, get_exif_func=None, template=None):
+    """
+    paths それぞれの付与後のパスを求める。戻り値は ([(old, new)], [(path, エラー文)])。
+    1 ファイルの失敗（Exif が読めない・値の型が合わないなど）は errors に入れて続ける。
+    """
+    get_exif_func = get_exif_func or get_exif
+    exifs, errors = [], []
+    for path in paths:
+        try:
+            exifs.append(get_exif_func(path))
+        except Exception as e:
+            exifs.append(None)
+            errors.append((path, f"{type(e).__name__}: {e}"))
+    if template is not None:
+        try:
+            # {place} などは全ファイル分をまとめて引く
+            template.prepare(exifs)
+        except Exception as e:
+            errors.append((None, f"{type(e).__name__}: {e}"))
+    pairs = []
+    for path, exif in zip(paths, exifs):
+        if exif is None:
+            continue
+        try:
+            new_path = exif_new_path(path, exif, template)
+        except Exception as e:
+            errors.append((path, f"{type(e).__name__}: {e}"))
+            continue
+        if new_path is not None:
+            pairs.append((path, new_path))
+    return pairs, errors
+
+
+def _template_new_path(file_path, exif_info, template):
+    stem, ext = os.path.splitext(file_path)
+    folder, stem = os.path.split(stem)
+    new_stem = replace_invalid_chars(template.render(exif_info, stem).strip())
+    if not new_stem or new_stem == stem:
+        return None
+    # {stem} を含むテンプレートは、付与済みのファイルに二重に付けない
+    if template.uses_stem and new_stem.startswith(stem):
+        added = new_stem[len(stem):].strip()
+        if added and added in stem:
+            return None
+    return os.path.join(folder, new_stem + ext)
+
+
+def rename_template(config: dict):
+    """設定の rename_template をコンパイルして返す（未設定なら None = 従来の書式）"""
+    source = config.get('rename_template')
+    if not source:
+        return None
+    return compile_template(str(source))
+
+
+def rename_exif(file_path, exif_info=None, template=None):
+    """
+    Exif情報を使って画像ファイル名をリネームする関数（変更先が既にあれば FileExistsError）。
+    ジャーナルには記録しないので、取り消せるようにするには virpe_journal.apply_renames を使う。
+    """
+    new_path = exif_new_path(file_path, exif_info, template)
+    if new_path is None:
+        return file_path  # Exif情報がなければ変更しない
+
+    # ファイルをリネーム（POSIX でも上書きしない）
+    rename_file(file_path, new_path)
+    return new_path
+
+
+def replace_invalid_chars(filename: str) -> str:
+    # 置換用のマッピング（半角→全角）
+    replacement_table = {
+        '\\': '￥',   # バックスラッシュ → 全角円記号
+        '/':  '／',   # スラッシュ → 全角スラッシュ
+        ':':  '：',   # コロン → 全角コロン
+        '*':  '＊',   # アスタリスク → 全角アスタリスク
+        '?':  '？',   # クエスチョンマーク → 全角クエスチョンマーク
+        '"':  '”',   # ダブルクォート → 全角ダブルクォート（例）
+        '<':  '＜',   # 小なり → 全角小なり
+        '>':  '＞',   # 大なり → 全角大なり
+        '|':  '｜'    # パイプ → 全角パイプ
+    }
+    
+    # マッピングに従って文字を置換
+    for char, replacement in replacement_table.items():
+        filename = filename.replace(char, replacement)
+    
+    return filename
+
+
+def app_dir() -> str:
+    """実行ファイル（PyInstaller 版なら exe、それ以外は ViRPE.py）のあるフォルダ"""
+    if getattr(sys, 'frozen', False):
+        return os.path.dirname(sys.executable)
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+def config_path() -> str:
+    """実行ファイルの隣の `config.yaml`。無ければ従来どおりカレントディレクトリのもの"""
+    path = os.path.join(app_dir(), 'config.yaml')
+    if os.path.exists(path):
+        return path
+    return os.path.abspath('config.yaml')
+
+
+# (パス, 更新時刻, 内容)
+_config_cache = (None, None, {})
+
+
+def load_config() -> dict:
+    """`config.yaml` を読み込み、辞書を返す。存在しないか読み込み失敗なら空辞書を返す。
+    更新時刻が変わっていなければ前回読み込んだ内容をそのまま返す。"""
+    global _config_cache
+    path = config_path()
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return {}
+    cached_path, cached_mtime, cached = _config_cache
+    if cached_path == path and cached_mtime == mtime:
+        return cached
+    import yaml
+    try:
+        with span("config", path=path), open(path, 'r', encoding='utf-8') as f:
+            data = yaml.safe_load(f) or {}
+    except Exception:
+        return {}
+    if not isinstance(data, dict):
+        data = {}
+    _config_cache = (path, mtime, data)
+    return data
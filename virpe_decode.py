@@ -0,0 +1,341 @@
+"""画像デコードのワーカープールとデコード済み画像キャッシュ"""
+import logging
+from collections import OrderedDict
+from typing import NamedTuple
+from PyQt6.QtCore import QBuffer, QByteArray, QIODevice, QObject, QRunnable, QSize, QThreadPool, Qt, pyqtSignal
+from PyQt6.QtGui import QImage, QImageIOHandler, QImageReader, QTransform
+from virpe_core import HEIF_EXTS, read_exif_thumbnail, uses_exiftool
+from virpe_fileio import shared as file_buffers
+from virpe_trace import span
+
+logger = logging.getLogger(__name__)
+
+
+class Decoded(NamedTuple):
+    """デコード結果。image は縮小されていることがあり、full_* は向き補正後の元の大きさ"""
+    image: QImage
+    full_width: int
+    full_height: int
+
+    @property
+    def is_full(self) -> bool:
+        return self.image.width() >= self.full_width and self.image.height() >= self.full_height
+
+
+class ImageCache:
+    """
+    バイト数上限つきの LRU キャッシュ（キーは (ファイルパス, 原寸か)、値は Decoded）。
+    budget（virpe_memory.MemoryBudget）を渡すと上限はそちらで管理し、超えたときは古いものから
+    原寸の画像を fit_size に縮小して持ち直し、それでも足りなければ捨てる。
+    """
+
+    def __init__(self, max_bytes: int, budget=None, fit_size: QSize = None):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._items = OrderedDict()
+        self.budget = budget
+        self.fit_size = fit_size
+        if budget is not None:
+            budget.register("cache", self, priority=0)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        item = self._items.get(key)
+        if item is not None:
+            self._items.move_to_end(key)
+        return item
+
+    def put(self, key, item: Decoded):
+        self.discard(key)
+        size = item.image.sizeInBytes()
+        if size > self.max_bytes:
+            # 1枚で上限を超える画像はキャッシュしない
+            return
+        self._items[key] = item
+        self.bytes += size
+        if self.budget is not None:
+            self.budget.enforce()
+            return
+        while self.bytes > self.max_bytes and self._items:
+            _, old = self._items.popitem(last=False)
+            self.bytes -= old.image.sizeInBytes()
+
+    def images(self):
+        return [item.image for item in self._items.values()]
+
+    def shrink(self) -> bool:
+        """
+        最も古いものを 1 つ減らす（MemoryBudget から呼ばれる）。原寸の画像は画面の大きさに縮小して
+        （まだ無ければ）縮小版として持ち直し、それ以外は捨てる。減らすものが無ければ False。
+        """
+        if not self._items:
+            return False
+        (path, full), item = next(iter(self._items.items()))
+        self.discard((path, full))
+        fit = self.fit_size
+        # 表示中の画像と共有しているものは、縮小版を作っても減らない
+        if full and fit is not None and (path, False) not in self._items and not self.budget.held_elsewhere(item.image, self):
+            image = item.image
+            if image.width() > fit.width() or image.height() > fit.height():
+                with span("scale", path=path, budget=True):
+                    image = image.scaled(fit, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
+                small = Decoded(image, item.full_width, item.full_height)
+                # 縮小版も古い順の先頭に置く（次に減らすときはこれが捨てられる）
+                self._items[(path, False)] = small
+                self._items.move_to_end((path, False), last=False)
+                self.bytes += image.sizeInBytes()
+        return True
+
+    def discard(self, key):
+        item = self._items.pop(key, None)
+        if item is not None:
+            self.bytes -= item.image.sizeInBytes()
+
+    def rename(self, old_path, new_path):
+        """リネーム後もデコード結果を使い回せるようキーだけ付け替える"""
+        for full in (False, True):
+            item = self._items.pop((old_path, full), None)
+            if item is not None:
+                self._items[(new_path, full)] = item
+        if self.budget is not None and self.budget.changed is not None:
+            self.budget.changed()
+
+    def clear(self):
+        self._items.clear()
+        self.bytes = 0
+
+
+def apply_orientation(image: QImage, orientation: int) -> QImage:
+    """Exif の Orientation(1〜8) に従って向きを補正する"""
+    if orientation in (2, 4):
+        return image.mirrored(orientation == 2, orientation == 4)
+    if orientation == 3:
+        return image.transformed(QTransform().rotate(180))
+    if orientation in (5, 6, 7, 8):
+        image = image.transformed(QTransform().rotate(270 if orientation == 8 else 90))
+        if orientation == 5:
+            return image.mirrored(True, False)
+        if orientation == 7:
+            return image.mirrored(False, True)
+    return image
+
+
+def decode_image(path: str, fit_size: QSize = None, keep: bool = True) -> Decoded:
+    """
+    path をデコードする。fit_size を渡すと、その大きさに収まる解像度で直接デコードする
+    （JPEG は DCT 段階での縮小になるので原寸デコード + 縮小よりずっと速い）。向きの補正も同時に行う。
+    RAW（と Qt で読めない HEIF）は埋め込みプレビューを exiftool で取り出して表示する。
+    ファイルは virpe_fileio で 1 回だけ読み、keep なら続く Exif の解析・リネームのためにしばらく置いておく。
+    """
+    if uses_exiftool(path):
+        reader = QImageReader(path)
+        if not (path.lower().endswith(HEIF_EXTS) and reader.canRead()):
+            return _decode_preview(path, fit_size)
+    else:
+        try:
+            data = file_buffers.read(path, keep)
+        except OSError as e:
+            logger.debug("read failed: %s (%s)", path, e)
+            return Decoded(QImage(), 0, 0)
+        # QBuffer は QByteArray を参照するだけなので、reader を使い終わるまで buffer を持っておく
+        buffer = QBuffer()
+        buffer.setData(QByteArray(data))
+        buffer.open(QIODevice.OpenModeFlag.ReadOnly)
+        reader = QImageReader(buffer)
+    reader.setAutoTransform(True)
+    return _read(reader, fit_size, path)
+
+
+def _decode_preview(path: str, fit_size: QSize = None) -> Decoded:
+    from virpe_exiftool import read_preview
+    data, orientation = read_preview(path)
+    if not data:
+        logger.debug("no embedded preview: %s", path)
+        return Decoded(QImage(), 0, 0)
+    buffer = QBuffer()
+    buffer.setData(data)
+    buffer.open(QIODevice.OpenModeFlag.ReadOnly)
+    reader = QImageReader(buffer)
+    # プレビュー JPEG 自体は向きの情報を持たないことが多いので、RAW 側の Orientation で補正する
+    reader.setAutoTransform(False)
+    decoded = _read(reader, fit_size, path, rotated=orientation in (5, 6, 7, 8))
+    if decoded.image.isNull():
+        return decoded
+    return Decoded(apply_orientation(decoded.image, orientation), decoded.full_width, decoded.full_height)
+
+
+def _read(reader: QImageReader, fit_size: QSize, path: str, rotated: bool = None) -> Decoded:
+    size = reader.size()
+    if rotated is None:
+        rotated = bool(reader.transformation() & QImageIOHandler.Transformation.TransformationRotate90)
+    full_w, full_h = (size.height(), size.width()) if rotated else (size.width(), size.height())
+    if fit_size is not None and size.isValid():
+        # scaledSize は向き補正前の大きさで指定する
+        fw, fh = (fit_size.height(), fit_size.width()) if rotated else (fit_size.width(), fit_size.height())
+        if size.width() > fw or size.height() > fh:
+            reader.setScaledSize(size.scaled(fw, fh, Qt.AspectRatioMode.KeepAspectRatio))
+    with span("decode", path=path, scaled=reader.scaledSize().isValid()):
+        image = reader.read()
+    if image.isNull():
+        logger.debug("decode failed: %s (%s)", path, reader.errorString())
+    elif not size.isValid():
+        full_w, full_h = image.width(), image.height()
+    return Decoded(image, full_w, full_h)
+
+
+def decode_thumbnail(path: str) -> QImage:
+    """Exif に埋め込まれたサムネイルを向き補正して返す（無ければ null）"""
+    with span("thumbnail", path=path):
+        data, orientation = read_exif_thumbnail(path)
+        if not data:
+            return QImage()
+        image = QImage.fromData(data)
+    if image.isNull():
+        return image
+    return apply_orientation(image, orientation)
+
+
+class _DecodeSignals(QObject):
+    # path, full, Decoded（失敗時は image が null）
+    finished = pyqtSignal(str, bool, object)
+    # path, サムネイル
+    preview = pyqtSignal(str, QImage)
+
+
+class _DecodeTask(QRunnable):
+    def __init__(self, owner, path: str, full: bool):
+        super().__init__()
+        self._owner = owner
+        self.path = path
+        self.full = full
+
+    def run(self):
+        key = (self.path, self.full)
+        # キューで待っている間にユーザーが先へ進んでいたら読まずに捨てる
+        if self._owner._is_stale(key):
+            return
+        self._owner._running.add(key)
+        result = Decoded(QImage(), 0, 0)
+        try:
+            result = decode_image(self.path, None if self.full else self._owner.fit_size)
+        except Exception as e:
+            logger.debug("decode error: %s (%s)", self.path, e)
+        self._owner._signals.finished.emit(self.path, self.full, result)
+
+
+class _ThumbnailTask(QRunnable):
+    def __init__(self, owner, path: str):
+        super().__init__()
+        self._owner = owner
+        self.path = path
+
+    def run(self):
+        if self._owner._is_stale((self.path, False)):
+            return
+        try:
+            image = decode_thumbnail(self.path)
+        except Exception as e:
+            logger.debug("thumbnail error: %s (%s)", self.path, e)
+            return
+        if not image.isNull():
+            self._owner._signals.preview.emit(self.path, image)
+
+
+class DecodePool(QObject):
+    """
+    画像をワーカースレッドで QImage にデコードし、GUI スレッドへ返す。
+    request() のたびに未着手のタスクを取り消し、最新の要求だけを積み直す（latest-wins）。
+    通常は fit_size（画面の大きさ）に収まる解像度でデコードし、原寸は full=True で要求されたときだけ読む。
+    """
+
+    image_ready = pyqtSignal(str, object)
+    # 本デコードが終わるまでの仮表示用（Exif 埋め込みサムネイル）
+    preview_ready = pyqtSignal(str, QImage)
+    # 表示用に要求した画像を読めなかった（image_ready の代わりに発行する）
+    decode_failed = pyqtSignal(str)
+
+    def __init__(self, max_threads: int = 2, cache_bytes: int = 512 * 1024 * 1024, fit_size: QSize = None,
+                 budget=None, parent=None):
+        super().__init__(parent)
+        self.cache = ImageCache(cache_bytes, budget, fit_size)
+        self.fit_size = fit_size
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(max(1, max_threads))
+        self._signals = _DecodeSignals()
+        self._signals.finished.connect(self._on_finished)
+        self._signals.preview.connect(self._on_preview)
+        self._wanted = frozenset()
+        self._current = None
+        # 実行中（キューから取り出された）キー。ワーカーが add し、GUI スレッドが discard する
+        self._running = set()
+
+    def lookup(self, path: str, full: bool = False):
+        """キャッシュ済みの Decoded（原寸要求なら原寸のもの）を返す"""
+        item = self.cache.get((path, full))
+        if item is None:
+            other = self.cache.get((path, not full))
+            if other is not None and (not full or other.is_full):
+                item = other
+        return item
+
+    def request(self, path: str, neighbors=(), full: bool = False):
+        """
+        path を表示用に要求し、neighbors を先読みする。
+        キャッシュ済みならその Decoded を返す（未デコードなら None を返し、後で image_ready を発行）。
+        """
+        key = (path, full)
+        self._current = key
+        self._wanted = frozenset([key, (path, False), *((p, False) for p in neighbors)])
+
+        # 未着手のタスクは全部捨てて、今欲しいものだけ積み直す
+        self._pool.clear()
+        in_flight = set(self._running)
+
+        cached = self.lookup(path, full)
+        targets = [] if cached is not None else [key]
+        targets += [(p, False) for p in neighbors if self.lookup(p) is None]
+        for priority, k in enumerate(reversed(targets)):
+            if k in in_flight:
+                continue
+            in_flight.add(k)
+            self._pool.start(_DecodeTask(self, *k), priority)
+        if cached is None and not full:
+            # 本デコードより先にサムネイルを出す
+            self._pool.start(_ThumbnailTask(self, path), len(targets))
+        return cached
+
+    def _is_stale(self, key) -> bool:
+        # ワーカースレッドから呼ばれる（frozenset の参照読みなので GIL 下で安全）
+        return key not in self._wanted
+
+    def _on_finished(self, path: str, full: bool, result: Decoded):
+        key = (path, full)
+        self._running.discard(key)
+        if result.image.isNull():
+            if key == self._current:
+                self.decode_failed.emit(path)
+            return
+        if key not in self._wanted:
+            # 追い越された要求の結果は保持しない
+            return
+        self.cache.put(key, result)
+        if key == self._current or ((path, True) == self._current and result.is_full):
+            self.image_ready.emit(path, result)
+
+    def _on_preview(self, path: str, image: QImage):
+        if self._current == (path, False) and self.cache.get((path, False)) is None:
+            self.preview_ready.emit(path, image)
+
+    def forget(self, path: str):
+        self.cache.discard((path, False))
+        self.cache.discard((path, True))
+
+    def shutdown(self):
+        self._wanted = frozenset()
+        self._pool.clear()
+        self._pool.waitForDone(1000)
@@ -0,0 +1,115 @@
+"""Exif のタグ名 → 値の読み取り専用マッピング（値は参照されたときに変換する）"""
+from collections.abc import Mapping
+from fractions import Fraction
+
+# piexif.load が返す IFD の順（同じ名前のタグは後の IFD の値が優先される）
+IFD_ORDER = ("0th", "Exif", "GPS", "Interop", "1st")
+
+# (IFD 名, タグ番号) → タグ名 と、タグ名 → (IFD 名, タグ番号) の並び。最初に使うときに 1 度だけ作る
+_NAMES = None
+_KEYS = None
+
+
+def _tables():
+    global _NAMES, _KEYS
+    if _NAMES is None:
+        import piexif
+        names = {}
+        keys = {}
+        for ifd in IFD_ORDER:
+            for tag, info in piexif.TAGS.get(ifd, {}).items():
+                names[(ifd, tag)] = info["name"]
+                keys.setdefault(info["name"], []).append((ifd, tag))
+        _NAMES, _KEYS = names, {name: tuple(reversed(k)) for name, k in keys.items()}
+    return _NAMES, _KEYS
+
+
+def tag_names():
+    """タグ名の集合（piexif が知っているもの。テンプレートのフィールド名の確認に使う）"""
+    return _tables()[1].keys()
+
+
+def decode_value(value):
+    """piexif の生の値を表示・リネーム用の値にする（bytes → str、有理数 → Fraction）"""
+    # `bytes` 型ならデコード（例: メーカー名など）
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace").replace('\x00', '')
+    # `Rational`（分数表記）を処理
+    if isinstance(value, tuple) and len(value) == 2:
+        try:
+            return Fraction(value[0], value[1])  # 分子/分母 → Fractionに変換
+        except (ZeroDivisionError, TypeError):
+            return value
+    return value
+
+
+class ExifTags(Mapping):
+    """
+    get_exif の戻り値。piexif の IFD 辞書をそのまま持ち、タグ名の解決と値の変換は参照されたときだけ行う。
+    リネームやタイトル表示のように数個のタグしか見ない場合、MakerNote などの大きな値には触れない。
+    名前が未知のタグはタグ番号（int）がキーになる。
+    """
+
+    __slots__ = ('_ifds', '_decoded', '_order')
+
+    def __init__(self, ifds):
+        # thumbnail（bytes）など辞書でない要素は持たない
+        self._ifds = {name: tags for name, tags in ifds.items() if isinstance(tags, dict) and tags}
+        self._decoded = {}
+        self._order = None
+
+    def _raw_key(self, key):
+        """key に対応する (IFD 名, タグ番号) を返す（無ければ None）"""
+        names, keys = _tables()
+        ifds = self._ifds
+        for ifd, tag in keys.get(key, ()):
+            tags = ifds.get(ifd)
+            if tags is not None and tag in tags:
+                return ifd, tag
+        if isinstance(key, int):
+            for ifd in reversed(IFD_ORDER):
+                tags = ifds.get(ifd)
+                if tags is not None and key in tags and (ifd, key) not in names:
+                    return ifd, key
+        return None
+
+    def __getitem__(self, key):
+        try:
+            return self._decoded[key]
+        except KeyError:
+            pass
+        raw = self._raw_key(key)
+        if raw is None:
+            raise KeyError(key)
+        value = decode_value(self._ifds[raw[0]][raw[1]])
+        self._decoded[key] = value
+        return value
+
+    def __contains__(self, key):
+        return key in self._decoded or self._raw_key(key) is not None
+
+    def _names(self):
+        # 全件を列挙するとき（クリップボードへのコピーなど）だけ作る
+        if self._order is None:
+            names, _ = _tables()
+            order = {}
+            for ifd in IFD_ORDER:
+                for tag in self._ifds.get(ifd, ()):
+                    order.setdefault(names.get((ifd, tag), tag), None)
+            self._order = tuple(order)
+        return self._order
+
+    def __iter__(self):
+        return iter(self._names())
+
+    def __len__(self):
+        if self._order is None and not self._ifds:
+            return 0
+        return len(self._names())
+
+    def __reduce__(self):
+        # ExifIndex に保存するのは生の IFD だけ
+        return (ExifTags, (self._ifds,))
+
+    def __repr__(self):
+        return f"ExifTags({dict(self.items())!r})"
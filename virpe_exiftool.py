@@ -0,0 +1,255 @@
+"""RAW / HEIC 用の ExifTool ワーカー（`-stay_open` で起動したままのプロセスを使い回す）
+
+1 回のやり取りで複数ファイルのメタデータをまとめて読み、表示には RAW に埋め込まれた JPEG プレビューを使う
+（RAW 現像はしない）。exiftool が見つからなければ RAW / HEIC のメタデータとプレビューは無しになる。
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import shutil
+import subprocess
+import threading
+from contextlib import contextmanager
+from fractions import Fraction
+
+logger = logging.getLogger(__name__)
+
+# 同時に起動しておくプロセス数
+POOL_SIZE = 2
+# 1 回のやり取りで渡すファイル数の上限
+BATCH_SIZE = 200
+# 大きいものから順に探すプレビュー
+PREVIEW_TAGS = ("JpgFromRaw", "PreviewImage", "ThumbnailImage")
+
+# get_exif（piexif）とタグ名が違うもの
+_RENAMED_TAGS = {"ISO": "ISOSpeedRatings", "ExposureCompensation": "ExposureBiasValue"}
+# piexif では有理数（Fraction）で返るタグ
+_RATIONAL_TAGS = frozenset((
+    "ExposureTime", "FNumber", "FocalLength", "ApertureValue", "MaxApertureValue",
+    "ShutterSpeedValue", "BrightnessValue", "ExposureBiasValue", "XResolution", "YResolution",
+))
+
+
+class ExifToolError(RuntimeError):
+    pass
+
+
+def _to_fraction(value):
+    try:
+        return Fraction(str(value)).limit_denominator(10000)
+    except (ValueError, ZeroDivisionError):
+        return value
+
+
+def normalize_tags(record):
+    """exiftool -j -n の 1 ファイル分を、get_exif と同じタグ名・値の形の辞書にする"""
+    exif = {}
+    for name, value in record.items():
+        if name == "SourceFile":
+            continue
+        name = _RENAMED_TAGS.get(name, name)
+        if name in _RATIONAL_TAGS and isinstance(value, (int, float)):
+            value = _to_fraction(value)
+        elif isinstance(value, list):
+            value = " ".join(str(v) for v in value)
+        exif[name] = value
+    return exif
+
+
+class ExifToolProcess:
+    """`exiftool -stay_open True -@ -` の 1 プロセス。1 度に 1 つのスレッドからだけ使う"""
+
+    def __init__(self, executable):
+        flags = subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+        self._proc = subprocess.Popen(
+            [executable, "-stay_open", "True", "-@", "-", "-common_args", "-charset", "filename=utf8", "-q", "-q"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            creationflags=flags,
+        )
+        self._seq = 0
+
+    @property
+    def alive(self) -> bool:
+        return self._proc.poll() is None
+
+    def execute(self, *args) -> bytes:
+        """引数を 1 行ずつ渡して実行し、標準出力をそのまま返す"""
+        self._seq += 1
+        marker = b"{ready%d}" % self._seq
+        lines = [str(a) for a in args] + [f"-execute{self._seq}"]
+        try:
+            self._proc.stdin.write(("\n".join(lines) + "\n").encode("utf-8"))
+            self._proc.stdin.flush()
+        except OSError as e:
+            raise ExifToolError(f"exiftool に書き込めません: {e}")
+        fd = self._proc.stdout.fileno()
+        chunks = []
+        tail = b""
+        while True:
+            data = os.read(fd, 65536)
+            if not data:
+                raise ExifToolError("exiftool が終了しました")
+            chunks.append(data)
+            # 終了の印は出力の最後に "{readyN}\n"（Windows は \r\n）として出る
+            tail = (tail + data)[-(len(marker) + 2):]
+            if tail.rstrip(b"\r\n").endswith(marker):
+                break
+        out = b"".join(chunks).rstrip(b"\r\n")
+        return out[:-len(marker)]
+
+    def close(self):
+        if not self.alive:
+            return
+        try:
+            self._proc.stdin.write(b"-stay_open\nFalse\n")
+            self._proc.stdin.flush()
+            self._proc.wait(2)
+        except (OSError, subprocess.TimeoutExpired):
+            self.kill()
+
+    def kill(self):
+        """応答の途中で失敗したときに使う（残りの出力が次のやり取りに混ざらないよう、使い回さない）"""
+        try:
+            self._proc.kill()
+            self._proc.wait(2)
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+
+
+class ExifToolPool:
+    """ExifToolProcess を size 個まで起動しておき、空いているものを貸し出す"""
+
+    def __init__(self, executable="exiftool", size=POOL_SIZE):
+        self.executable = executable
+        self.size = max(1, size)
+        self._idle = queue.LifoQueue()
+        self._started = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @contextmanager
+    def process(self):
+        proc = None
+        with self._lock:
+            if self._closed:
+                raise ExifToolError("exiftool pool is closed")
+            if self._idle.empty() and self._started < self.size:
+                self._started += 1
+                try:
+                    proc = ExifToolProcess(self.executable)
+                except OSError:
+                    self._started -= 1
+                    raise
+        if proc is None:
+            proc = self._idle.get()
+        try:
+            yield proc
+        except BaseException:
+            # やり取りの途中で失敗したプロセスは出力の区切りがずれているので、プールに戻さず終了させる
+            proc.kill()
+            raise
+        finally:
+            if proc.alive:
+                self._idle.put(proc)
+            else:
+                with self._lock:
+                    self._started -= 1
+
+    def metadata(self, paths):
+        """paths のメタデータを get_exif と同じ形の辞書のリストで返す（読めなければ None）"""
+        paths = list(paths)
+        result = {}
+        for i in range(0, len(paths), BATCH_SIZE):
+            batch = paths[i:i + BATCH_SIZE]
+            with self.process() as proc:
+                out = proc.execute("-j", "-n", "-EXIF:all", *batch)
+            try:
+                records = json.loads(out.decode("utf-8", errors="replace") or "[]")
+            except ValueError:
+                records = []
+            for record in records:
+                source = record.get("SourceFile")
+                if source is not None:
+                    result[os.path.normcase(os.path.abspath(source))] = normalize_tags(record)
+        return [result.get(os.path.normcase(os.path.abspath(p))) or None for p in paths]
+
+    def preview(self, path):
+        """埋め込みプレビュー JPEG と Orientation を返す（無ければ (None, 1)）"""
+        with self.process() as proc:
+            out = proc.execute("-j", "-n", "-Orientation", path)
+            try:
+                records = json.loads(out.decode("utf-8", errors="replace") or "[]")
+                orientation = int(records[0].get("Orientation", 1)) if records else 1
+            except (ValueError, TypeError):
+                orientation = 1
+            for tag in PREVIEW_TAGS:
+                data = proc.execute("-b", f"-{tag}", path)
+                if data[:2] == b"\xff\xd8":
+                    return data, orientation
+        return None, 1
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        while not self._idle.empty():
+            self._idle.get_nowait().close()
+
+
+_default = None
+_default_lock = threading.Lock()
+_unavailable = False
+
+
+def find_executable(configured=None):
+    """設定の exiftool_path、実行ファイルの隣の exiftool(.exe)、PATH の順に探す"""
+    from virpe_core import app_dir
+    candidates = [configured] if configured else []
+    candidates.append(os.path.join(app_dir(), "exiftool.exe" if os.name == 'nt' else "exiftool"))
+    for candidate in candidates:
+        if candidate and os.path.isfile(candidate):
+            return candidate
+    return shutil.which("exiftool")
+
+
+def default_pool():
+    """プロセス内で共有するプール（exiftool が無ければ None）"""
+    global _default, _unavailable
+    if _default is not None or _unavailable:
+        return _default
+    with _default_lock:
+        if _default is None and not _unavailable:
+            from virpe_core import load_config
+            executable = find_executable(load_config().get('exiftool_path'))
+            if executable is None:
+                logger.info("exiftool が見つからないため RAW / HEIC のメタデータは読めません")
+                _unavailable = True
+                return None
+            _default = ExifToolPool(executable)
+            atexit.register(_default.close)
+    return _default
+
+
+def read_metadata(paths):
+    """default_pool() でメタデータを読む。exiftool が無い・失敗したときは None の並び"""
+    pool = default_pool()
+    paths = list(paths)
+    if pool is None:
+        return [None] * len(paths)
+    try:
+        return pool.metadata(paths)
+    except (OSError, ExifToolError) as e:
+        logger.debug("exiftool metadata error: %s", e)
+        return [None] * len(paths)
+
+
+def read_preview(path):
+    pool = default_pool()
+    if pool is None:
+        return None, 1
+    try:
+        return pool.preview(path)
+    except (OSError, ExifToolError) as e:
+        logger.debug("exiftool preview error: %s (%s)", path, e)
+        return None, 1
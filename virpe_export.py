@@ -0,0 +1,145 @@
+"""フォルダ内の画像の Exif を CSV / JSON Lines に書き出す
+
+ファイルの列挙 → Exif の読み込み（プロセスプール）→ 1 行ずつ書き出し、をジェネレータでつなぐ。
+一度に扱うのは WINDOW 件分だけなので、フォルダの大きさによらずメモリ使用量は一定。
+"""
+import csv
+import json
+import multiprocessing
+import os
+from itertools import islice
+from virpe_core import get_exif, get_exif_many, uses_exiftool
+from virpe_template import compile_template, format_value
+
+# 列を指定しないときの CSV の列（JSON Lines は全タグ）
+DEFAULT_COLUMNS = (
+    "DateTimeOriginal", "Make", "Model", "LensModel", "ExposureTime", "FNumber",
+    "ISOSpeedRatings", "FocalLength", "FocalLengthIn35mmFilm",
+)
+FORMATS = ('csv', 'jsonl')
+# 全タグを書き出すときに除くタグ
+SKIPPED_TAGS = frozenset(("MakerNote", "UserComment", "PrintImageMatching"))
+# プロセスプールへ一度に渡すファイル数
+WINDOW = 1024
+
+
+def parse_columns(text):
+    """"A,B, C" → ('A', 'B', 'C')（空なら None）"""
+    if not text:
+        return None
+    if isinstance(text, (list, tuple)):
+        return tuple(str(c).strip() for c in text if str(c).strip()) or None
+    return tuple(c.strip() for c in text.split(',') if c.strip()) or None
+
+
+def read_row(args):
+    """
+    ワーカープロセスで 1 ファイル分の行を作る。columns は Exif タグ名かテンプレートの組み込みフィールド
+    （shutter, iso など）。None なら全タグ。値はすべて文字列にして返す（大きな Exif をプロセス間で送らない）
+    """
+    path, columns = args
+    return _row(path, get_exif(path), columns)
+
+
+def _row(path, exif, columns):
+    exif = exif or {}
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if columns is None:
+        # MakerNote はメーカー独自のバイナリなので書き出さない
+        return path, {str(k): format_value(v) for k, v in exif.items() if k not in SKIPPED_TAGS}
+    return path, {c: compile_template("{%s}" % c).render(exif, stem) for c in columns}
+
+
+def iter_rows(paths, columns=None, jobs=0, mp_context=None):
+    """
+    paths の順に (path, {列: 値}) を返すジェネレータ。jobs>1 ならプロセスプール（mp_context があればそれで作る）で読む。
+    RAW / HEIF はワーカーごとに exiftool を起動しないよう、このプロセスで WINDOW 件ずつまとめて読む
+    """
+    jobs = jobs or os.cpu_count() or 1
+    it = iter(paths)
+    pool = (mp_context or multiprocessing).Pool(jobs) if jobs > 1 else None
+    try:
+        while True:
+            window = list(islice(it, WINDOW))
+            if not window:
+                return
+            # RAW / HEIF かどうかは 1 度だけ調べ、並びを戻すときにも使う
+            is_raw = [uses_exiftool(path) for path in window]
+            raw = [path for path, r in zip(window, is_raw) if r]
+            raw_rows = iter([_row(path, exif, columns) for path, exif in zip(raw, get_exif_many(raw))])
+            tasks = [(path, columns) for path, r in zip(window, is_raw) if not r]
+            if pool is None:
+                rows = map(read_row, tasks)
+            else:
+                rows = pool.imap(read_row, tasks, chunksize=max(1, len(tasks) // (jobs * 4)))
+            for r in is_raw:
+                yield next(raw_rows) if r else next(rows)
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+
+def write_csv(rows, fp, columns, root=None):
+    """rows（iter_rows の結果）を CSV で書き、書いた行数を返す"""
+    writer = csv.writer(fp)
+    writer.writerow(("file",) + tuple(columns))
+    count = 0
+    for path, values in rows:
+        writer.writerow([_relative(path, root)] + [values.get(c, "") for c in columns])
+        count += 1
+    return count
+
+
+def write_jsonl(rows, fp, root=None):
+    """rows を JSON Lines（1 行 1 ファイル）で書き、書いた行数を返す"""
+    count = 0
+    for path, values in rows:
+        fp.write(json.dumps({"file": _relative(path, root), **values}, ensure_ascii=False))
+        fp.write("\n")
+        count += 1
+    return count
+
+
+def _relative(path, root):
+    return os.path.relpath(path, root) if root else path
+
+
+def format_for(path, default='csv'):
+    """出力ファイル名の拡張子から形式を決める"""
+    ext = os.path.splitext(path or "")[1].lower()
+    if ext in ('.jsonl', '.ndjson', '.json'):
+        return 'jsonl'
+    if ext == '.csv':
+        return 'csv'
+    return default
+
+
+def export(paths, fp, fmt='csv', columns=None, jobs=0, root=None, progress=None, cancelled=None, mp_context=None):
+    """
+    paths の Exif を fp（テキストファイル）へ書き出し、行数を返す。
+    CSV で columns を省略すると DEFAULT_COLUMNS。progress(件数) は 1 行ごとに呼ばれ、
+    cancelled() が True を返したらそこで打ち切る。mp_context はプロセスプールを作る multiprocessing のコンテキスト。
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown format: {fmt}")
+    if fmt == 'csv' and columns is None:
+        columns = DEFAULT_COLUMNS
+    for column in columns or ():
+        compile_template("{%s}" % column)  # 書けない列名はここで ValueError にする
+    rows = iter_rows(paths, columns, jobs, mp_context)
+    if progress is not None or cancelled is not None:
+        rows = _counting(rows, progress, cancelled)
+    if fmt == 'csv':
+        return write_csv(rows, fp, columns, root)
+    return write_jsonl(rows, fp, root)
+
+
+def _counting(rows, progress, cancelled):
+    for i, row in enumerate(rows, 1):
+        if cancelled is not None and cancelled():
+            # ジェネレータを閉じるとプロセスプールも止まる
+            rows.close()
+            return
+        yield row
+        if progress is not None:
+            progress(i)
@@ -0,0 +1,84 @@
+"""Exif の書き出し（virpe_export）を GUI からバックグラウンドで実行する"""
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+from PyQt6.QtCore import QObject, pyqtSignal
+from virpe_export import export
+
+logger = logging.getLogger(__name__)
+
+# progress を送る間隔（件数）
+PROGRESS_STEP = 100
+# 書き出し中のファイル名に付ける連番
+_runs = itertools.count(1)
+
+
+class ExifExporter(QObject):
+    """
+    start() で渡した画像の Exif を別スレッドで書き出す。書き出し中は実行ごとに別の output + ".N.part" に書き、
+    終わってから置き換えるので、キャンセル・失敗したときに中途半端なファイルは残らない
+    （キャンセルした前の書き出しがまだ止まっていなくても、次の書き出しとファイルを取り合わない）。
+    プロセスプールは spawn で作る（Qt のスレッドを持つプロセスを fork しない）。
+    """
+
+    # 書き出した件数
+    progress = pyqtSignal(int)
+    # 件数, 出力先, エラーメッセージ（成功なら空、キャンセルなら CANCELLED）
+    finished = pyqtSignal(int, str, str)
+
+    CANCELLED = "cancelled"
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._thread = None
+        self._cancel = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, paths, output, fmt, columns=None, jobs=0, root=None):
+        self.cancel()
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, args=(list(paths), output, fmt, columns, jobs, root, self._cancel),
+            name="exif-export", daemon=True,
+        )
+        self._thread.start()
+
+    def cancel(self):
+        if self._thread is not None:
+            self._cancel.set()
+            self._thread = None
+
+    def _run(self, paths, output, fmt, columns, jobs, root, cancel):
+        part = f"{output}.{os.getpid()}-{next(_runs)}.part"
+        count = 0
+        error = ""
+
+        def progress(n):
+            if n % PROGRESS_STEP == 0:
+                self.progress.emit(n)
+
+        try:
+            with open(part, 'w', encoding='utf-8-sig' if fmt == 'csv' else 'utf-8', newline='') as fp:
+                count = export(paths, fp, fmt, columns, jobs, root, progress, cancel.is_set,
+                               mp_context=multiprocessing.get_context('spawn'))
+            if cancel.is_set():
+                error = self.CANCELLED
+            else:
+                os.replace(part, output)
+        except (OSError, ValueError) as e:
+            logger.warning("Exif の書き出しに失敗しました: %s", e)
+            error = str(e)
+        if error and os.path.exists(part):
+            try:
+                os.remove(part)
+            except OSError:
+                pass
+        if error == self.CANCELLED and cancel is not self._cancel:
+            # 次の書き出しが始まっている（その finished と取り違えないよう知らせない）
+            return
+        self.finished.emit(count, output, error)
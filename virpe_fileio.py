@@ -0,0 +1,162 @@
+"""画像ファイルの読み込みを 1 回にまとめるための、読んだ内容の短期キャッシュ
+
+選択した画像はデコーダー（virpe_decode）がファイル全体を 1 回だけ読み、その bytes をここに置く。
+Exif の解析（virpe_core.read_exif_segment）・埋め込みサムネイル・続くリネームなどは、数秒のあいだ
+ファイルを開き直さずにこの内容（memoryview）を使う。ネットワーク共有では 1 枚あたりの転送量が減る。
+
+mmap は使わない（Windows ではマップ中のファイルをリネームできない）。内容はサイズと更新時刻が
+変わっていないときだけ使い、変わっていれば読み直す。
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from virpe_trace import span
+
+# 読んだ内容を置いておく時間（秒）と上限（バイト）
+WINDOW = 10.0
+MAX_BYTES = 64 * 1024 * 1024
+
+
+def _stat_key(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+class FileBuffers:
+    """
+    path → ファイルの内容（bytes）。WINDOW 秒使われなかったものと、max_bytes を超えた古いものは捨てる。
+    ワーカースレッドと GUI スレッドの両方から使う。同じファイルを同時に read() したときは 1 回だけ読む。
+    """
+
+    def __init__(self, max_bytes: int = MAX_BYTES, window: float = WINDOW):
+        self.max_bytes = max_bytes
+        self.window = window
+        self.bytes = 0
+        # path → (size, mtime_ns, data, 最後に使った時刻)
+        self._items = OrderedDict()
+        # 読み込み中の path → 読み終わりを知らせる Event
+        self._loading = {}
+        self._lock = threading.Lock()
+        self.bytes_read = 0  # 実際にディスク（共有）から読んだバイト数
+
+    def __contains__(self, path):
+        with self._lock:
+            return path in self._items
+
+    def peek(self, path):
+        """置いてある内容の memoryview（無いか、ファイルが変わっていれば None）。ファイルは読まない"""
+        with self._lock:
+            if path not in self._items:
+                return None
+        try:
+            key = _stat_key(path)
+        except OSError:
+            self.discard(path)
+            return None
+        return self._get(path, key)
+
+    def read(self, path, keep: bool = True):
+        """
+        ファイル全体の memoryview。置いてあればそれを返し、無ければ読んで置いておく
+        （keep=False なら置かない。一覧のサムネイル作成のように、すぐには使い回さないもの用）。
+        読めなければ OSError。
+        """
+        key = _stat_key(path)
+        while True:
+            view = self._get(path, key)
+            if view is not None:
+                return view
+            with self._lock:
+                loading = self._loading.get(path)
+                if loading is None:
+                    loading = self._loading[path] = threading.Event()
+                    break
+            # 別のスレッドが読んでいるものは、読み終わるのを待ってそれを使う
+            loading.wait()
+        try:
+            with span("read", path=path, size=key[0]), open(path, 'rb') as f:
+                data = f.read()
+            self.bytes_read += len(data)
+            if keep and len(data) == key[0]:
+                self._put(path, key, data)
+            return memoryview(data)
+        finally:
+            with self._lock:
+                del self._loading[path]
+            loading.set()
+
+    def head(self, path, size: int):
+        """先頭 size バイト（置いてあればそこから、無ければファイルの先頭だけを読む）"""
+        view = self.peek(path)
+        if view is not None:
+            return view[:size]
+        with open(path, 'rb') as f:
+            data = f.read(size)
+        self.bytes_read += len(data)
+        return memoryview(data)
+
+    def _get(self, path, key):
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            item = self._items.get(path)
+            if item is None:
+                return None
+            if item[:2] != key:
+                self._drop(path)
+                return None
+            self._items[path] = (*item[:3], now)
+            self._items.move_to_end(path)
+            return memoryview(item[2])
+
+    def _put(self, path, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            self._drop(path)
+            self._items[path] = (*key, data, time.monotonic())
+            self.bytes += len(data)
+            while self.bytes > self.max_bytes:
+                self._drop(next(iter(self._items)))
+
+    def _expire(self, now):
+        # 古い順に並んでいるので、期限内のものに当たったら終わり
+        while self._items:
+            path, item = next(iter(self._items.items()))
+            if now - item[3] < self.window:
+                break
+            self._drop(path)
+
+    def _drop(self, path):
+        item = self._items.pop(path, None)
+        if item is not None:
+            self.bytes -= len(item[2])
+
+    def discard(self, path):
+        with self._lock:
+            self._drop(path)
+
+    def rename(self, old_path, new_path):
+        """リネーム後も内容を使い回す（サイズ・更新時刻はリネームで変わらない）"""
+        with self._lock:
+            self._drop(new_path)
+            item = self._items.pop(old_path, None)
+            if item is not None:
+                self._items[new_path] = (*item[:3], time.monotonic())
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.bytes = 0
+
+
+# デコーダーと Exif の解析で共有するもの
+shared = FileBuffers()
+
+
+def configure(config: dict):
+    """config の file_buffer_mb（0 で置かない）を shared に反映する"""
+    shared.max_bytes = int(config.get('file_buffer_mb', MAX_BYTES // (1024 * 1024))) * 1024 * 1024
+    if shared.max_bytes <= 0:
+        shared.clear()
@@ -0,0 +1,220 @@
+"""フォルダ内の画像一覧（名前 → 行の辞書と表示順の名前リスト）"""
+import os
+import re
+from array import array
+from virpe_core import is_image_file
+from virpe_trace import span
+
+# 一覧の並び順
+SORT_KEYS = ('name', 'natural', 'mtime')
+
+_DIGITS = re.compile(r'(\d+)')
+
+
+def _natural_key(name):
+    # 数字部分を数値として比較する（IMG_2.jpg < IMG_10.jpg）
+    return [int(t) if t.isdigit() else t.casefold() for t in _DIGITS.split(name)]
+
+
+def scan_images(folder, chunk_size=512):
+    """
+    os.scandir でフォルダを読み、画像ファイルだけを (name, size, mtime_ns) のリストで
+    chunk_size 件ずつ返すジェネレータ。最初の数百件はディレクトリ全体を読み終える前に返る。
+    """
+    chunk = []
+    with os.scandir(folder) as it:
+        for entry in it:
+            if not is_image_file(entry.name):
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+                st = entry.stat()
+            except OSError:
+                continue
+            chunk.append((entry.name, st.st_size, st.st_mtime_ns))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+class FolderModel:
+    """
+    表示順の名前リスト names と、名前 → 行番号の辞書を持つ。
+    サイズ・更新時刻は行に揃えた array で持ち、並べ替えにディレクトリの再読込は不要。
+    リネームは同じ行の名前を差し替えるだけなので O(1)。
+    """
+
+    def __init__(self, folder=None):
+        self.folder = folder
+        self.names = []
+        self.sizes = array('q')
+        self.mtimes = array('q')
+        self.sort_key = 'name'
+        self._rows = {}
+        if folder:
+            self.load(folder)
+
+    def reset(self, folder):
+        self.folder = folder
+        self.names = []
+        self.sizes = array('q')
+        self.mtimes = array('q')
+        self._rows = {}
+
+    def load(self, folder):
+        """フォルダ全体を同期的に読み込む"""
+        self.reset(folder)
+        for chunk in scan_images(folder):
+            self.extend(chunk)
+        self.sort(self.sort_key)
+
+    def extend(self, entries):
+        """(name, size, mtime_ns) の並びを末尾に追加し、追加した行範囲 (first, last) を返す"""
+        first = len(self.names)
+        for name, size, mtime_ns in entries:
+            if name in self._rows:
+                continue
+            self._rows[name] = len(self.names)
+            self.names.append(name)
+            self.sizes.append(size)
+            self.mtimes.append(mtime_ns)
+        return first, len(self.names) - 1
+
+    def _reindex(self, start=0):
+        for i in range(start, len(self.names)):
+            self._rows[self.names[i]] = i
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self._rows
+
+    def row(self, name):
+        """name の行番号（無ければ -1）"""
+        return self._rows.get(name, -1)
+
+    def path(self, row):
+        return os.path.join(self.folder, self.names[row])
+
+    def path_of(self, name):
+        """name のフルパス（一覧に無ければ None）"""
+        if name not in self._rows:
+            return None
+        return os.path.join(self.folder, name)
+
+    def sort_order(self, key=None, reverse=False):
+        """key で並べたときの元の行番号の並び"""
+        key = key or self.sort_key
+        names = self.names
+        if key == 'mtime':
+            mtimes = self.mtimes
+            keyfunc = lambda i: (mtimes[i], names[i])
+        elif key == 'natural':
+            keyfunc = lambda i: _natural_key(names[i])
+        else:
+            keyfunc = lambda i: names[i].casefold()
+        return sorted(range(len(names)), key=keyfunc, reverse=reverse)
+
+    def sort(self, key=None, reverse=False):
+        """
+        保持している名前・サイズ・更新時刻だけで並べ替える。
+        戻り値: 並び替え後の各位置に来た元の行番号のリスト
+        """
+        if key:
+            self.sort_key = key
+        order = self.sort_order(self.sort_key, reverse)
+        self.reorder(order)
+        return order
+
+    def reorder(self, order):
+        """行を order（元の行番号の並び）の順に並べ替える"""
+        self.names = list(map(self.names.__getitem__, order))
+        self.sizes = array('q', map(self.sizes.__getitem__, order))
+        self.mtimes = array('q', map(self.mtimes.__getitem__, order))
+        self._reindex()
+
+    def rename(self, old_name, new_name):
+        """一覧上の old_name を new_name に差し替え、その行番号を返す（new_name が一覧の別のファイルなら差し替えない）"""
+        if new_name != old_name and new_name in self._rows:
+            return self._rows.get(old_name, -1)
+        row = self._rows.pop(old_name, -1)
+        if row < 0:
+            return self.add(new_name)
+        self.names[row] = new_name
+        self._rows[new_name] = row
+        return row
+
+    def rename_many(self, pairs):
+        """
+        一覧にある (old_name, new_name) をまとめて差し替え、差し替えた (行番号, old_name, new_name) のリストを返す。
+        a→b, b→a のような入れ替えも、先に全部の行を外してから付け直すので崩れない。
+        変更先が一覧の別のファイル（またはこの中の別の変更先）と重なるものは差し替えずに元の名前のまま残す。
+        """
+        pairs = [(old_name, new_name) for old_name, new_name in pairs if old_name in self._rows]
+        rows = {old_name: self._rows.pop(old_name) for old_name, _ in pairs}
+        # 差し替えない名前は元の行に残るので、それを変更先にしていたものも差し替えられなくなる
+        refused = set()
+        while True:
+            taken = set()
+            for old_name, new_name in pairs:
+                if old_name in refused:
+                    continue
+                if new_name in self._rows or new_name in refused or new_name in taken:
+                    refused.add(old_name)
+                    break
+                taken.add(new_name)
+            else:
+                break
+        for old_name in refused:
+            self._rows[old_name] = rows[old_name]
+        result = []
+        for old_name, new_name in pairs:
+            if old_name in refused:
+                continue
+            row = rows[old_name]
+            self.names[row] = new_name
+            self._rows[new_name] = row
+            result.append((row, old_name, new_name))
+        return result
+
+    def add(self, name):
+        if name in self._rows:
+            return self._rows[name]
+        try:
+            st = os.stat(os.path.join(self.folder, name))
+            size, mtime_ns = st.st_size, st.st_mtime_ns
+        except OSError:
+            size = mtime_ns = 0
+        return self.extend([(name, size, mtime_ns)])[1]
+
+    def remove(self, name):
+        """name を一覧から外し、外した行番号を返す（無ければ -1）"""
+        row = self._rows.pop(name, -1)
+        if row < 0:
+            return -1
+        del self.names[row]
+        del self.sizes[row]
+        del self.mtimes[row]
+        self._reindex(row)
+        return row
+
+    def sync(self):
+        """
+        ディレクトリを読み直し、一覧との差分を返す（一覧自体はまだ変更しない）。
+        戻り値: (削除された名前のリスト, 追加された (name, size, mtime_ns) のリスト)
+        """
+        on_disk = {}
+        try:
+            with span("list_dir", path=self.folder, sync=True):
+                for chunk in scan_images(self.folder):
+                    for entry in chunk:
+                        on_disk[entry[0]] = entry
+        except OSError:
+            pass
+        removed = [name for name in self.names if name not in on_disk]
+        added = [on_disk[name] for name in sorted(on_disk.keys() - self._rows.keys())]
+        return removed, added
@@ -0,0 +1,397 @@
+"""GPS 座標 → 地名（オフラインの地名辞典を KD 木で引く）
+
+    python ViRPE.py gazetteer cities1000.txt        （GeoNames の都市一覧から gazetteer.bin を作る）
+    rename_template : "{DateTimeOriginal:%Y%m%d}[ {place}]"
+
+地名辞典は GeoNames の cities500 / cities1000 / cities15000（タブ区切り）から 1 度だけ作り、
+実行ファイルの隣の gazetteer.bin（config の gazetteer_path で変更可）に置く。読むときは mmap するだけで、
+点の座標・KD 木の節の範囲とバウンディングボックス・地名をそのまま NumPy の配列として使う。
+
+座標は単位球面上の (x, y, z)。球面上の距離と弦の長さは単調なので、3 次元のユークリッド距離で最近傍を求める。
+KD 木はすべての葉が同じ深さになる平衡木で、節 i の子は 2i+1 / 2i+2（点は葉の順に並べてある）。
+まとめて検索するときは (問い合わせ, 節) の組を配列演算でたどり、1 件だけのときは節を Python でたどる。
+
+    ヘッダ  magic(8) count depth leaf_size names_size（uint32 ×4）
+    points  float32 [count, 3]
+    lo, hi  uint32 [nodes]（節が持つ点の範囲）
+    boxes   float32 [nodes, 6]（min xyz, max xyz）
+    offsets uint32 [count + 1]（names の中の位置）
+    names   UTF-8 の "地名\\t国コード" を並べたもの
+"""
+import logging
+import math
+import mmap
+import os
+import struct
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"VIRPEGZ1"
+_HEADER = struct.Struct("<8sIIII")
+LEAF_SIZE = 32
+# これより遠い地名は付けない（海上・山奥で 1 番近い町が遠すぎるとき）
+MAX_DISTANCE_KM = 100.0
+EARTH_RADIUS_KM = 6371.0
+# 1 度に検索する問い合わせの数（作業用の配列の大きさを抑える）
+CHUNK = 4096
+# 同じ場所の写真を何度も検索しないよう、座標（約 1m 単位）→ 地名の番号を覚えておく上限
+MEMO_ITEMS = 100_000
+
+
+def to_xyz(lat, lon):
+    """緯度・経度（度、配列可）→ 単位球面上の (x, y, z) を並べた [n, 3] の配列"""
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)), axis=-1).reshape(-1, 3)
+
+
+def _chord(km):
+    """地表の距離 km → 単位球面上の弦の長さの 2 乗"""
+    return (2.0 * math.sin(min(km / EARTH_RADIUS_KM, math.pi) / 2.0)) ** 2
+
+
+def _degrees(value, ref):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        # exiftool の値（-n なら数値だが、リストは空白区切りの文字列になる）
+        try:
+            parts = [float(v) for v in value.replace(',', ' ').split()]
+        except ValueError:
+            return None
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        parts = [float(value)]
+    elif isinstance(value, tuple):
+        # piexif: ((度, 1), (分, 1), (秒, 100)) / Fraction の並び
+        parts = []
+        for v in value:
+            if isinstance(v, tuple) and len(v) == 2:
+                if not v[1]:
+                    return None
+                parts.append(v[0] / v[1])
+            else:
+                try:
+                    parts.append(float(v))
+                except (TypeError, ValueError):
+                    return None
+    else:
+        try:
+            parts = [float(value)]
+        except (TypeError, ValueError):
+            return None
+    if not parts:
+        return None
+    degrees = sum(p / 60 ** i for i, p in enumerate(parts[:3]))
+    if isinstance(ref, bytes):
+        ref = ref.decode('ascii', errors='replace')
+    if isinstance(ref, str) and ref.strip().upper() in ('S', 'W'):
+        degrees = -degrees
+    return degrees
+
+
+def gps_coordinates(exif):
+    """get_exif の結果 → (緯度, 経度)（度、南緯・西経は負）。GPS が無ければ None"""
+    if not exif:
+        return None
+    lat = _degrees(exif.get('GPSLatitude'), exif.get('GPSLatitudeRef'))
+    lon = _degrees(exif.get('GPSLongitude'), exif.get('GPSLongitudeRef'))
+    if lat is None or lon is None or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    # 測位できなかったときに 0, 0 を書くカメラがある
+    if lat == 0 and lon == 0:
+        return None
+    return lat, lon
+
+
+def read_geonames(path, min_population=0):
+    """GeoNames のタブ区切り（cities*.txt）→ (緯度の配列, 経度の配列, "地名\\t国コード" の並び)"""
+    lats, lons, names = [], [], []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            cols = line.rstrip('\n').split('\t')
+            if len(cols) < 15:
+                continue
+            try:
+                lat, lon = float(cols[4]), float(cols[5])
+                population = int(cols[14] or 0)
+            except ValueError:
+                continue
+            if population < min_population:
+                continue
+            lats.append(lat)
+            lons.append(lon)
+            names.append(f"{cols[1]}\t{cols[8]}")
+    return np.array(lats), np.array(lons), names
+
+
+def build_gazetteer(lats, lons, names, dest, leaf_size=LEAF_SIZE):
+    """地名の一覧から KD 木を作り、dest に書く（一時ファイルに書いてから置き換える）"""
+    count = len(names)
+    if count == 0:
+        raise ValueError("地名がありません")
+    points = to_xyz(lats, lons)
+    depth = max(0, math.ceil(math.log2(count / leaf_size))) if count > leaf_size else 0
+    nodes = (1 << (depth + 1)) - 1
+    order = np.arange(count)
+    lo = np.zeros(nodes, dtype=np.uint32)
+    hi = np.zeros(nodes, dtype=np.uint32)
+    boxes = np.zeros((nodes, 6), dtype=np.float32)
+    lo[0], hi[0] = 0, count
+    # 節ごとに、範囲内の点をいちばん広がっている軸の中央値で左右に分ける
+    for node in range((1 << depth) - 1):
+        a, b = int(lo[node]), int(hi[node])
+        mid = (a + b) // 2
+        if b - a > 1:
+            part = points[order[a:b]]
+            axis = int(np.argmax(part.max(axis=0) - part.min(axis=0)))
+            order[a:b] = order[a:b][np.argpartition(part[:, axis], mid - a)]
+        lo[2 * node + 1], hi[2 * node + 1] = a, mid
+        lo[2 * node + 2], hi[2 * node + 2] = mid, b
+    points = points[order].astype(np.float32)
+    for node in range(nodes):
+        a, b = int(lo[node]), int(hi[node])
+        if a < b:
+            boxes[node, :3] = points[a:b].min(axis=0)
+            boxes[node, 3:] = points[a:b].max(axis=0)
+        else:
+            # 空の節はどの問い合わせからも選ばれないようにする
+            boxes[node, :3], boxes[node, 3:] = 2.0, -2.0
+    encoded = [names[i].encode('utf-8') for i in order]
+    offsets = np.zeros(count + 1, dtype=np.uint32)
+    offsets[1:] = np.cumsum([len(n) for n in encoded])
+    blob = b"".join(encoded)
+
+    folder = os.path.dirname(os.path.abspath(dest))
+    os.makedirs(folder, exist_ok=True)
+    temp = dest + ".tmp"
+    with open(temp, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, count, depth, leaf_size, len(blob)))
+        for array in (points, lo, hi, boxes, offsets):
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.write(blob)
+    os.replace(temp, dest)
+    return count
+
+
+class Gazetteer:
+    """build_gazetteer で作ったファイルを mmap して引く。複数のスレッドから同時に使ってよい"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < _HEADER.size:
+            self._map.close()
+            raise ValueError(f"地名辞典が壊れています: {path}")
+        magic, count, depth, leaf_size, names_size = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(f"地名辞典の形式が違います: {path}")
+        nodes = (1 << (depth + 1)) - 1
+        offset = _HEADER.size
+
+        def array(dtype, n, shape=None):
+            nonlocal offset
+            a = np.frombuffer(self._map, dtype=dtype, count=n, offset=offset)
+            offset += a.nbytes
+            return a if shape is None else a.reshape(shape)
+
+        self.count = count
+        self.depth = depth
+        self.leaf_size = leaf_size
+        self.points = array(np.float32, count * 3, (count, 3))
+        self.lo = array(np.uint32, nodes)
+        self.hi = array(np.uint32, nodes)
+        self.boxes = array(np.float32, nodes * 6, (nodes, 6))
+        self.offsets = array(np.uint32, count + 1)
+        self._names_offset = offset
+        self._box_list = None
+        if offset + names_size > len(self._map):
+            raise ValueError(f"地名辞典が壊れています: {path}")
+
+    def __len__(self):
+        return self.count
+
+    def name(self, index: int):
+        """index の (地名, 国コード)"""
+        a = self._names_offset + int(self.offsets[index])
+        b = self._names_offset + int(self.offsets[index + 1])
+        place, _, country = self._map[a:b].decode('utf-8').partition('\t')
+        return place, country
+
+    def _box_distance(self, q, nodes):
+        # q[i] から nodes[i] のバウンディングボックスまでの距離の 2 乗（中にあれば 0）
+        box = self.boxes[nodes]
+        d = np.maximum(box[:, :3] - q, 0) + np.maximum(q - box[:, 3:], 0)
+        return np.einsum('ij,ij->i', d, d)
+
+    def _leaf_nearest(self, q, leaves):
+        """q[i] に最も近い leaves[i] 内の点 → (番号, 距離の 2 乗)。葉は leaf_size 個分まとめて見る"""
+        offsets = np.arange(self.leaf_size)
+        index = self.lo[leaves].astype(np.int64)[:, None] + offsets
+        valid = index < self.hi[leaves][:, None]
+        index = np.where(valid, index, 0)
+        diff = self.points[index] - q[:, None, :]
+        dist = np.einsum('ijk,ijk->ij', diff, diff)
+        dist[~valid] = np.inf
+        best = np.argmin(dist, axis=1)
+        rows = np.arange(len(leaves))
+        return index[rows, best], dist[rows, best]
+
+    def nearest_xyz(self, q):
+        """q（[n, 3] の単位ベクトル）それぞれに最も近い点の (番号, 弦の長さの 2 乗)"""
+        q = np.asarray(q, dtype=np.float32).reshape(-1, 3)
+        if len(q) > CHUNK:
+            parts = [self.nearest_xyz(q[i:i + CHUNK]) for i in range(0, len(q), CHUNK)]
+            return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+        n = len(q)
+        # 1) ボックスの近い方の子をたどって葉まで降り、その葉の最近傍を暫定の答えにする
+        node = np.zeros(n, dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * node + 1
+            go_right = self._box_distance(q, left + 1) < self._box_distance(q, left)
+            node = left + go_right
+        best, best_d = self._leaf_nearest(q, node)
+        # 2) 暫定の距離より近いボックスを持つ節だけを (問い合わせ, 節) の組でたどる
+        pair_q = np.arange(n)
+        pair_node = np.zeros(n, dtype=np.int64)
+        for _ in range(self.depth):
+            pair_q = np.repeat(pair_q, 2)
+            pair_node = (2 * np.repeat(pair_node, 2) + 1) + np.tile([0, 1], len(pair_node))
+            keep = self._box_distance(q[pair_q], pair_node) < best_d[pair_q]
+            pair_q, pair_node = pair_q[keep], pair_node[keep]
+        if len(pair_q):
+            index, dist = self._leaf_nearest(q[pair_q], pair_node)
+            # 同じ問い合わせの組のうち最も近いもの（距離の順に並べて、問い合わせごとの先頭）
+            order = np.lexsort((dist, pair_q))
+            first = np.unique(pair_q[order], return_index=True)[1]
+            hit = order[first]
+            better = dist[hit] < best_d[pair_q[hit]]
+            targets = pair_q[hit][better]
+            best[targets] = index[hit][better]
+            best_d[targets] = dist[hit][better]
+        return best, best_d
+
+    def _nearest_one(self, q):
+        """1 件だけの検索（配列演算の呼び出し回数が多いと遅いので、節は Python のループでたどる）"""
+        if self._box_list is None:
+            # 節のボックスだけを Python の値にしておく（点の座標は mmap のまま）
+            self._box_list = self.boxes.tolist()
+        boxes = self._box_list
+        first_leaf = (1 << self.depth) - 1
+        x, y, z = q
+        best, best_d = 0, math.inf
+        stack = [(0.0, 0)]
+        while stack:
+            d, node = stack.pop()
+            if d >= best_d:
+                continue
+            if node >= first_leaf:
+                a, b = int(self.lo[node]), int(self.hi[node])
+                diff = self.points[a:b] - np.asarray(q, dtype=np.float32)
+                dist = np.einsum('ij,ij->i', diff, diff)
+                i = int(np.argmin(dist))
+                if dist[i] < best_d:
+                    best, best_d = a + i, float(dist[i])
+                continue
+            children = []
+            for child in (2 * node + 1, 2 * node + 2):
+                x0, y0, z0, x1, y1, z1 = boxes[child]
+                dx = x0 - x if x < x0 else x - x1 if x > x1 else 0.0
+                dy = y0 - y if y < y0 else y - y1 if y > y1 else 0.0
+                dz = z0 - z if z < z0 else z - z1 if z > z1 else 0.0
+                children.append((dx * dx + dy * dy + dz * dz, child))
+            # 近い方を先に調べる（スタックなので後に積む）
+            children.sort(reverse=True)
+            stack.extend(children)
+        return best, best_d
+
+    def nearest(self, coords, max_km=MAX_DISTANCE_KM):
+        """(緯度, 経度) の並び → 最も近い地名の番号の配列（max_km より遠ければ -1）"""
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        if not len(coords):
+            return np.empty(0, dtype=np.int64)
+        q = to_xyz(coords[:, 0], coords[:, 1])
+        if len(q) == 1:
+            one = self._nearest_one(q[0].tolist())
+            best, dist = np.array([one[0]]), np.array([one[1]])
+        else:
+            best, dist = self.nearest_xyz(q)
+        best = best.astype(np.int64)
+        if max_km is not None:
+            best[dist > _chord(max_km)] = -1
+        return best
+
+    def close(self):
+        # mmap を指している配列を先に手放す（残っていると close が BufferError になる）
+        self.points = self.lo = self.hi = self.boxes = self.offsets = None
+        self._map.close()
+
+
+def default_path(config=None):
+    """config の gazetteer_path、無ければ実行ファイルの隣の gazetteer.bin"""
+    from virpe_core import app_dir, load_config
+    config = load_config() if config is None else config
+    return config.get('gazetteer_path') or os.path.join(app_dir(), 'gazetteer.bin')
+
+
+# 最初に {place} を使うときに開く（開けなければ False）
+_gazetteer = None
+_memo = {}
+_lock = threading.Lock()
+
+
+def default_gazetteer():
+    global _gazetteer
+    with _lock:
+        if _gazetteer is None:
+            path = default_path()
+            try:
+                _gazetteer = Gazetteer(path)
+            except (OSError, ValueError) as e:
+                logger.warning("地名辞典を開けないため {place} は空になります: %s (%s)", path, e)
+                _gazetteer = False
+        return _gazetteer or None
+
+
+def _memo_key(coords):
+    return round(coords[0], 5), round(coords[1], 5)
+
+
+def prefetch_places(exifs):
+    """
+    exifs の GPS 座標をまとめて 1 回で検索し、place_of が引けるようにしておく
+    （1 件ずつ検索するより速い。リネームの前に呼ぶ）
+    """
+    gazetteer = default_gazetteer()
+    if gazetteer is None:
+        return
+    keys = list({_memo_key(c) for c in map(gps_coordinates, exifs) if c is not None} - _memo.keys())
+    if not keys:
+        return
+    if len(_memo) + len(keys) > MEMO_ITEMS:
+        _memo.clear()
+    _memo.update(zip(keys, gazetteer.nearest(keys).tolist()))
+
+
+def place_of(exif, field='place'):
+    """exif の撮影地に最も近い地名（field='country' なら国コード）。GPS・地名辞典が無ければ None"""
+    coords = gps_coordinates(exif)
+    if coords is None:
+        return None
+    key = _memo_key(coords)
+    index = _memo.get(key)
+    if index is None:
+        gazetteer = default_gazetteer()
+        if gazetteer is None:
+            return None
+        if len(_memo) >= MEMO_ITEMS:
+            _memo.clear()
+        index = _memo[key] = int(gazetteer.nearest([key])[0])
+    if index < 0:
+        return None
+    place, country = default_gazetteer().name(index)
+    return country if field == 'country' else place
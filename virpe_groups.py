@@ -0,0 +1,88 @@
+"""フォルダ内の画像を知覚ハッシュでグループ分けする（バックグラウンドで実行）"""
+import logging
+import multiprocessing
+import os
+import threading
+from PyQt6.QtCore import QObject, pyqtSignal
+from virpe_phash import CHUNK_SIZE, default_jobs, exif_timestamp, group_images, hash_files
+from virpe_trace import span
+
+logger = logging.getLogger(__name__)
+
+
+class HashGrouper(QObject):
+    """
+    start() で渡した画像のハッシュを求め（保存済みのものは ExifIndex から読む）、
+    撮影時刻と合わせてグループ分けした結果を finished で返す。
+    """
+
+    # 完了数, 全体数
+    progress = pyqtSignal(int, int)
+    # name → グループ番号
+    finished = pyqtSignal(object)
+
+    def __init__(self, exif_index, jobs=0, parent=None):
+        super().__init__(parent)
+        self.exif_index = exif_index
+        self.jobs = jobs or default_jobs()
+        self._thread = None
+        self._cancel = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, entries):
+        """entries: 一覧の順の (path, size, mtime_ns)"""
+        self.cancel()
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, args=(list(entries), self._cancel), name="phash-group", daemon=True
+        )
+        self._thread.start()
+
+    def cancel(self):
+        if self._thread is not None:
+            self._cancel.set()
+            self._thread = None
+
+    def _run(self, entries, cancel):
+        try:
+            groups = self._group(entries, cancel)
+        except Exception as e:
+            logger.warning("グループ分けに失敗しました: %s", e)
+            return
+        if groups is not None and not cancel.is_set():
+            self.finished.emit(groups)
+
+    def _group(self, entries, cancel):
+        hashes = self.exif_index.hashes(entries)
+        missing = [path for path, _, _ in entries if path not in hashes]
+        total = len(entries)
+        done = total - len(missing)
+        self.progress.emit(done, total)
+        if missing:
+            stat = {path: (size, mtime_ns) for path, size, mtime_ns in entries}
+            chunks = [missing[i:i + CHUNK_SIZE] for i in range(0, len(missing), CHUNK_SIZE)]
+            rows = []
+            # Qt のスレッドを持つこのプロセスは fork せず、spawn で起動する
+            context = multiprocessing.get_context('spawn')
+            with span("phash", files=len(missing)), context.Pool(min(self.jobs, len(chunks))) as pool:
+                for result in pool.imap_unordered(hash_files, chunks):
+                    if cancel.is_set():
+                        pool.terminate()
+                        return None
+                    for path, h in result:
+                        if h is not None:
+                            hashes[path] = h
+                            rows.append((path, *stat[path], h))
+                    done += len(result)
+                    self.progress.emit(done, total)
+            self.exif_index.store_hashes(rows)
+
+        items = []
+        for path, _, _ in entries:
+            if cancel.is_set():
+                return None
+            items.append((os.path.basename(path), hashes.get(path), exif_timestamp(self.exif_index.get(path))))
+        return group_images(items)
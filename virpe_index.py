@@ -0,0 +1,271 @@
+"""get_exif の結果をファイルごとに保存する SQLite のインデックス"""
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+from virpe_core import get_exif, get_exif_many, user_cache_dir
+from virpe_trace import span
+
+logger = logging.getLogger(__name__)
+
+# Exif を持たないファイルも「解析済み」として覚えておくための印
+_NO_EXIF = b""
+# 一括登録時に 1 トランザクションへまとめる件数
+BATCH_SIZE = 500
+# 解析中に取り消しを確かめる間隔（件数）。フォルダを切り替えたときに待たせないよう小さく
+PARSE_CHUNK = 32
+
+
+def _stat_key(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+class ExifIndex:
+    """
+    (フォルダ, ファイル名) → get_exif の結果。サイズと更新時刻が一致するときだけ再利用する。
+    GUI スレッドと先読みスレッドの両方から使うので、接続は 1 本をロックで共有する。
+    """
+
+    def __init__(self, db_path=None):
+        if db_path is None:
+            db_path = os.path.join(user_cache_dir(), 'exif_index.sqlite3')
+        try:
+            self._db = self._open(db_path)
+        except sqlite3.Error as e:
+            logger.warning("exif index を開けないためメモリ上で動作します: %s (%s)", db_path, e)
+            self._db = self._open(':memory:')
+        self._lock = threading.Lock()
+        # 今開いているフォルダ分の結果（path → (size, mtime_ns, exif)）。warm のたびに作り直し、
+        # 先読みスレッドにはその回の辞書を渡す（取り消した古いスレッドが新しい辞書へ書かないように）
+        self._mem = {}
+        self._warm_thread = None
+        self._warm_cancel = threading.Event()
+        self._parsed_lock = threading.Lock()
+        self.parsed = 0  # このセッションで実際に Exif を解析した回数
+
+    @staticmethod
+    def _open(db_path):
+        db = sqlite3.connect(db_path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS exif ("
+            " dir TEXT NOT NULL, name TEXT NOT NULL,"
+            " size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, data BLOB,"
+            " PRIMARY KEY (dir, name))"
+        )
+        # 知覚ハッシュ（virpe_phash）。64 ビットは符号つきで保存する
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS dhash ("
+            " dir TEXT NOT NULL, name TEXT NOT NULL,"
+            " size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, hash INTEGER NOT NULL,"
+            " PRIMARY KEY (dir, name))"
+        )
+        db.commit()
+        return db
+
+    def get(self, path):
+        """path の Exif 辞書（get_exif と同じ形、無ければ None）を返す"""
+        try:
+            key = _stat_key(path)
+        except OSError:
+            return None
+        hit = self._mem.get(path)
+        if hit is not None and hit[:2] == key:
+            return hit[2]
+
+        folder, name = os.path.split(path)
+        with span("exif_index", path=path), self._lock:
+            row = self._db.execute(
+                "SELECT size, mtime_ns, data FROM exif WHERE dir=? AND name=?", (folder, name)
+            ).fetchone()
+        if row is not None and tuple(row[:2]) == key:
+            exif = self._decode(row[2])
+        else:
+            exif = self._parse(path)
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO exif VALUES (?, ?, ?, ?, ?)",
+                    (folder, name, key[0], key[1], self._encode(exif)),
+                )
+                self._db.commit()
+        self._mem[path] = (key[0], key[1], exif)
+        return exif
+
+    def cached(self, path) -> bool:
+        """path の解析結果を（ファイルを読まずに）メモリ上に持っているか"""
+        hit = self._mem.get(path)
+        if hit is None:
+            return False
+        try:
+            return hit[:2] == _stat_key(path)
+        except OSError:
+            return False
+
+    def warm(self, paths, on_batch=None):
+        """
+        フォルダを開いたときに呼ぶ。保存済みの行を 1 クエリで読み込み、
+        未登録・更新されたファイルだけをバックグラウンドで解析してまとめて登録する。
+        on_batch(paths, exifs) は読み終えた分ごとにワーカースレッドから呼ばれる。
+        """
+        self.cancel_warm()
+        mem = self._mem = {}
+        self._warm_cancel = threading.Event()
+        self._warm_thread = threading.Thread(
+            target=self._warm, args=(list(paths), mem, self._warm_cancel, on_batch), name="exif-index-warm", daemon=True
+        )
+        self._warm_thread.start()
+
+    def cancel_warm(self, wait: bool = False):
+        """
+        先読みを止める。GUI スレッドを止めないよう、既定では終わりを待たない
+        （解析中の PARSE_CHUNK 件を終えたところで止まり、その後は on_batch を呼ばない）。
+        """
+        if self._warm_thread is not None:
+            self._warm_cancel.set()
+            if wait:
+                self._warm_thread.join()
+            self._warm_thread = None
+
+    def _warm(self, paths, mem, cancel, on_batch=None):
+        stored = {}
+        for folder in {os.path.dirname(p) for p in paths}:
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT name, size, mtime_ns, data FROM exif WHERE dir=?", (folder,)
+                ).fetchall()
+            for name, size, mtime_ns, data in rows:
+                stored[os.path.join(folder, name)] = (size, mtime_ns, data)
+
+        todo = []
+        hits = []
+        for path in paths:
+            if cancel.is_set():
+                return
+            try:
+                key = _stat_key(path)
+            except OSError:
+                continue
+            row = stored.get(path)
+            if row is not None and row[:2] == key:
+                exif = self._decode(row[2])
+                mem[path] = (key[0], key[1], exif)
+                hits.append((path, exif))
+                if on_batch is not None and len(hits) >= BATCH_SIZE:
+                    on_batch(*zip(*hits))
+                    hits = []
+                continue
+            todo.append((path, key))
+            if len(todo) >= BATCH_SIZE:
+                self._parse_batch(todo, mem, on_batch, cancel)
+                todo = []
+        if cancel.is_set():
+            return
+        if on_batch is not None and hits:
+            on_batch(*zip(*hits))
+        self._parse_batch(todo, mem, on_batch, cancel)
+
+    def _parse_batch(self, todo, mem, on_batch=None, cancel=None):
+        # RAW / HEIF は exiftool へまとめて渡される。PARSE_CHUNK 件ごとに取り消しを確かめる
+        if not todo:
+            return
+        pending = []
+        paths = []
+        exifs = []
+        for start in range(0, len(todo), PARSE_CHUNK):
+            if cancel is not None and cancel.is_set():
+                break
+            chunk = todo[start:start + PARSE_CHUNK]
+            self._count_parsed(len(chunk))
+            for (path, key), exif in zip(chunk, get_exif_many(path for path, _ in chunk)):
+                mem[path] = (key[0], key[1], exif)
+                folder, name = os.path.split(path)
+                pending.append((folder, name, key[0], key[1], self._encode(exif)))
+                paths.append(path)
+                exifs.append(exif)
+        # 取り消されても、解析済みの分は保存しておく
+        self._flush(pending)
+        if on_batch is not None and paths and not (cancel is not None and cancel.is_set()):
+            on_batch(paths, exifs)
+
+    def _flush(self, rows):
+        if not rows:
+            return
+        with self._lock:
+            with self._db:
+                self._db.executemany("INSERT OR REPLACE INTO exif VALUES (?, ?, ?, ?, ?)", rows)
+
+    def hashes(self, entries):
+        """(path, size, mtime_ns) の並びのうち、ハッシュ保存済みで更新されていないもの → {path: hash}"""
+        wanted = {}
+        for path, size, mtime_ns in entries:
+            wanted.setdefault(os.path.dirname(path), {})[os.path.basename(path)] = (size, mtime_ns)
+        found = {}
+        for folder, names in wanted.items():
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT name, size, mtime_ns, hash FROM dhash WHERE dir=?", (folder,)
+                ).fetchall()
+            for name, size, mtime_ns, h in rows:
+                if names.get(name) == (size, mtime_ns):
+                    found[os.path.join(folder, name)] = h & 0xFFFFFFFFFFFFFFFF
+        return found
+
+    def store_hashes(self, rows):
+        """(path, size, mtime_ns, hash) の並びをまとめて保存する"""
+        values = []
+        for path, size, mtime_ns, h in rows:
+            folder, name = os.path.split(path)
+            values.append((folder, name, size, mtime_ns, h - (1 << 64) if h >= 1 << 63 else h))
+        if not values:
+            return
+        with self._lock:
+            with self._db:
+                self._db.executemany("INSERT OR REPLACE INTO dhash VALUES (?, ?, ?, ?, ?)", values)
+
+    def rename(self, old_path, new_path):
+        """リネーム後も解析結果を引き継ぐ（サイズ・更新時刻はリネームで変わらない）"""
+        if old_path == new_path:
+            return
+        old_dir, old_name = os.path.split(old_path)
+        new_dir, new_name = os.path.split(new_path)
+        with self._lock:
+            with self._db:
+                for table in ("exif", "dhash"):
+                    self._db.execute(f"DELETE FROM {table} WHERE dir=? AND name=?", (new_dir, new_name))
+                    self._db.execute(
+                        f"UPDATE {table} SET dir=?, name=? WHERE dir=? AND name=?",
+                        (new_dir, new_name, old_dir, old_name),
+                    )
+        hit = self._mem.pop(old_path, None)
+        if hit is not None:
+            self._mem[new_path] = hit
+
+    def close(self):
+        self.cancel_warm(wait=True)
+        with self._lock:
+            self._db.close()
+
+    def _parse(self, path):
+        self._count_parsed(1)
+        return get_exif(path)
+
+    def _count_parsed(self, count):
+        # GUI スレッドの get と先読みスレッドの両方から数える
+        with self._parsed_lock:
+            self.parsed += count
+
+    @staticmethod
+    def _encode(exif):
+        return _NO_EXIF if exif is None else pickle.dumps(exif, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _decode(data):
+        if not data:
+            return None
+        try:
+            return pickle.loads(data)
+        except Exception:
+            return None
@@ -0,0 +1,136 @@
+"""多重起動の抑止（2 回目以降の起動は、起動済みの ViRPE に引数を渡して終わる）
+
+    python ViRPE.py <フォルダまたはファイル>
+
+起動済みのプロセスは QLocalServer（virpe_server、Windows は名前付きパイプ、それ以外は Unix ソケット）で
+待ち受ける。渡す側（このモジュール）は PyQt6 を読み込まずに標準ライブラリだけで接続し、1 行送って "ok" を待つ。
+2 回目以降の起動はこのモジュールだけを読み込んで終わるので、読み込みの重いモジュール（json, re など）は使わない。
+
+    OPEN\0<パス>\0<パス>...\n   パスを開く（パスが無ければウィンドウを前に出すだけ）
+    PING\n                       待ち受けているかの確認
+"""
+import os
+import socket
+import sys
+import time
+
+# これを付けて起動すると、起動済みのものがあっても新しいウィンドウを開く
+NEW_INSTANCE = '--new-instance'
+# 起動計測はプロセスを新しく立てないと意味が無い
+_LOCAL_ONLY = (NEW_INSTANCE, '--profile-startup', '--startup-budget')
+CONNECT_TIMEOUT = 0.5
+REPLY_TIMEOUT = 3.0
+
+
+def server_name():
+    """QLocalServer.listen に渡す名前（Windows はパイプ名、それ以外はソケットのフルパス）"""
+    # ターミナルから起動してもエクスプローラーから起動しても同じ名前になるもの
+    user = os.environ.get('USERNAME', '') if os.name == 'nt' else str(os.getuid())
+    name = f"virpe-{user}"
+    if os.name == 'nt':
+        return name
+    # tempfile は読み込みが重いので使わない
+    folder = os.environ.get('XDG_RUNTIME_DIR') or os.environ.get('TMPDIR') or '/tmp'
+    return os.path.join(folder, name + ".sock")
+
+
+def path_args(argv):
+    """argv（プログラム名を除く）のうちフォルダ・ファイルの引数を絶対パスにして返す"""
+    return [os.path.abspath(a) for a in argv if not a.startswith('-')]
+
+
+def forwardable(argv) -> bool:
+    """
+    起動済みのものへ渡してよい引数か。フォルダ・ファイル以外（サブコマンドなど）や起動計測のオプションが
+    あれば False。single_instance の設定は待ち受ける側が見る（無効なら待ち受けない）ので、ここでは読まない
+    """
+    for arg in argv:
+        if arg.startswith('-'):
+            if arg.split('=', 1)[0] in _LOCAL_ONLY:
+                return False
+        elif not os.path.exists(arg):
+            return False
+    return True
+
+
+def forward(paths, name=None, reply_timeout=REPLY_TIMEOUT) -> bool:
+    """
+    起動済みのプロセスに paths を渡す。渡せたら True、待ち受けているものが無ければ False。
+    送ったあと返事が遅いだけなら（GUI が処理中）True とする（二重にウィンドウを開かない）。
+    paths が None なら待ち受けているかどうかの確認だけ（ウィンドウは前に出ない）。
+    """
+    name = name or server_name()
+    message = encode_message(paths)
+    try:
+        if os.name == 'nt':
+            return _forward_pipe(name, message, reply_timeout)
+        return _forward_socket(name, message, reply_timeout)
+    except OSError:
+        return False
+
+
+def encode_message(paths) -> bytes:
+    if paths is None:
+        return b"PING\n"
+    # パスに NUL と改行は入らない（改行は Windows では使えず、Unix でもまず使われない）
+    return "\0".join(["OPEN"] + [p for p in paths if "\n" not in p]).encode('utf-8', 'surrogateescape') + b"\n"
+
+
+def decode_message(line: bytes):
+    """encode_message の 1 行（改行を除く）→ パスのリスト（PING なら None）。読めなければ ValueError"""
+    parts = line.decode('utf-8', 'surrogateescape').split("\0")
+    if parts[0] == "PING":
+        return None
+    if parts[0] != "OPEN":
+        raise ValueError(f"unknown message: {line[:40]!r}")
+    return [p for p in parts[1:] if p]
+
+
+def _forward_socket(path, message, reply_timeout):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(CONNECT_TIMEOUT)
+        sock.connect(path)
+        sock.sendall(message)
+        sock.settimeout(reply_timeout)
+        try:
+            # 受け取った側が処理を終えるまで待つ（すぐ終了すると前面に出る前に戻ってしまう）
+            sock.recv(16)
+        except socket.timeout:
+            pass
+    return True
+
+
+def _forward_pipe(name, message, reply_timeout):
+    import ctypes
+    pipe = rf"\\.\pipe\{name}"
+    kernel32 = ctypes.windll.kernel32
+    # 起動済みのウィンドウが前面に出られるようにする（ASFW_ANY）
+    ctypes.windll.user32.AllowSetForegroundWindow(-1)
+    deadline = time.monotonic() + CONNECT_TIMEOUT
+    while True:
+        try:
+            f = open(pipe, 'r+b', buffering=0)
+            break
+        except FileNotFoundError:
+            raise
+        except OSError:
+            # ERROR_PIPE_BUSY: 別の接続を処理中なので少し待つ
+            if time.monotonic() > deadline or not kernel32.WaitNamedPipeW(pipe, 100):
+                raise
+    with f:
+        f.write(message)
+        # パイプの読み込みにはタイムアウトが無いので、返事は待たない
+    return True
+
+
+def forward_to_running(argv) -> bool:
+    """
+    ViRPE.py の起動直後（PyQt6 を読み込む前）に呼ぶ。起動済みのプロセスへ argv のパスを渡せたら True
+    （呼び出し側はそのまま終了する）。argv はプログラム名を除いた引数。
+    """
+    return forwardable(argv) and forward(path_args(argv))
+
+
+if __name__ == "__main__":
+    # 起動済みの ViRPE に引数を渡すだけの確認用
+    sys.exit(0 if forward(path_args(sys.argv[1:])) else 1)
@@ -0,0 +1,461 @@
+"""リネームの計画（衝突・入れ替えの解決）と、追記専用のジャーナルによる適用・復旧・取り消し
+
+1 回のリネーム（1 トランザクション）は次の順で行う。
+
+1. plan_renames: 変更先をすべて先に決め、既存ファイルとの衝突や重複を除き、
+   a→b, b→a のような入れ替え（循環）は一時的な名前を経由する手順にする（件数に比例する時間）
+2. 手順をまとめてジャーナルに書き、fsync してから順に os.rename する（1 件ごとの記録はしない）
+3. 終わったら失敗したものをジャーナルに書いて fsync する
+
+2 と 3 の間で落ちた場合は、次に起動したとき recover() が手順を逆順にたどって元の名前に戻す。
+完了したトランザクションは新しいものから順に何段でも取り消せる。
+"""
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from virpe_trace import span
+
+logger = logging.getLogger(__name__)
+
+CANCELLED = "キャンセルしました"
+_VISITING = "visiting"
+
+# ジャーナルがこの大きさを超えたら、古いトランザクションを捨てて書き直す
+COMPACT_BYTES = 4 * 1024 * 1024
+# 書き直すときに残すトランザクション数（取り消せる段数の上限）
+KEEP_TRANSACTIONS = 100
+
+
+def _name_key(name):
+    # Windows（SMB 共有を含む）はファイル名の大文字小文字を区別しない
+    return name.casefold() if os.name == 'nt' else name
+
+
+class RenamePlan:
+    """
+    plan_renames の結果。
+    moves: 受け付けた (old_path, new_path)、rejected: (old_path, new_path, エラー)、
+    units: (手順 (src, dst, moves の添字) のリスト, 一時的な名前 または None)。
+    一時的な名前のある unit は循環で、最初の手順が一時的な名前へ逃がし、最後の手順がそこから戻す。
+    キャンセルは unit の間でだけ行う（入れ替えの途中で一時的な名前のまま止まらないように）。
+    """
+
+    __slots__ = ('moves', 'rejected', 'units')
+
+    def __init__(self):
+        self.moves = []
+        self.rejected = []
+        self.units = []
+
+    @property
+    def steps(self):
+        return [step for unit, _ in self.units for step in unit]
+
+
+def plan_renames(pairs, existing, token="0"):
+    """
+    同じフォルダ内の (old_path, new_path) の並びから RenamePlan を作る。
+    existing はフォルダ内の名前（_name_key 済み）の集合。読めなかったときは None（衝突は適用時に確認する）。
+    token は一時的な名前に使う文字列（トランザクションごとに変える）。
+    """
+    plan = RenamePlan()
+    by_src = {}
+    by_dst = {}
+    for old, new in pairs:
+        src_key = _name_key(os.path.basename(old))
+        dst_key = _name_key(os.path.basename(new))
+        if not new or old == new or src_key in by_src:
+            continue
+        if dst_key in by_dst:
+            plan.rejected.append((old, new, f"変更先が重複しています: {os.path.basename(new)}"))
+            continue
+        by_src[src_key] = len(plan.moves)
+        by_dst[dst_key] = len(plan.moves)
+        plan.moves.append((old, new))
+
+    moves = plan.moves
+    n = len(moves)
+    keys = [(_name_key(os.path.basename(old)), _name_key(os.path.basename(new))) for old, new in moves]
+    # next_[i]: i の変更先を今使っている（先に動かす必要がある）移動。大文字小文字だけの変更は自分自身なので除く
+    next_ = [by_src.get(dst) if dst != src else None for src, dst in keys]
+    prev = [None] * n
+    for i, j in enumerate(next_):
+        if j is not None:
+            prev[j] = i
+
+    # 変更先が空くかどうか: 鎖の終点が空いている名前なら鎖全体が通り、既存ファイルなら鎖全体が通らない
+    # 変更先は重複させていないので、各移動を待つ移動は高々 1 つ（鎖か循環にしかならない）
+    ok = [None] * n
+    for i in range(n):
+        if ok[i] is not None:
+            continue
+        chain = []
+        j = i
+        while j is not None and ok[j] is None:
+            ok[j] = _VISITING
+            chain.append(j)
+            j = next_[j]
+        if j is None:
+            src, dst = keys[chain[-1]]
+            result = existing is None or dst == src or dst not in existing
+        elif ok[j] is _VISITING:
+            result = True  # 循環（一時的な名前で解決できる）
+        else:
+            result = ok[j]
+        for k in chain:
+            ok[k] = result
+
+    done = [False] * n
+    index = [None] * n
+    accepted = []
+    for i in range(n):
+        if ok[i]:
+            index[i] = len(accepted)
+            accepted.append(moves[i])
+        else:
+            old, new = moves[i]
+            plan.rejected.append((old, new, f"同名のファイルがあります: {os.path.basename(new)}"))
+            done[i] = True
+
+    def walk_back(j, unit, stop=None):
+        # 変更先が空いた移動から、その名前を待っていた移動へさかのぼる
+        while j is not None and j != stop and not done[j]:
+            done[j] = True
+            unit.append((moves[j][0], moves[j][1], index[j]))
+            j = prev[j]
+
+    # 鎖: 終点（変更先が空いている移動）から順に
+    for i in range(n):
+        if not done[i] and next_[i] is None:
+            unit = []
+            walk_back(i, unit)
+            plan.units.append((unit, None))
+    # 残りは循環: 1 つを一時的な名前へ逃がし、循環をさかのぼってから最後に戻す
+    for i in range(n):
+        if done[i]:
+            continue
+        old, new = moves[i]
+        temp = os.path.join(os.path.dirname(old), f".virpe-{token}-{i}.tmp")
+        done[i] = True
+        unit = [(old, temp, index[i])]
+        walk_back(prev[i], unit, stop=i)
+        unit.append((temp, new, index[i]))
+        plan.units.append((unit, temp))
+    plan.moves = accepted
+    return plan
+
+
+class RenameJournal:
+    """
+    リネームのトランザクションを 1 行 1 レコードの JSON で追記するファイル。
+    begin（移動と手順）→ commit（失敗した移動）の組で 1 トランザクション。recover で巻き戻したものは abort。
+    複数プロセス（GUI と CLI）から使えるよう、書き込みと適用はロックファイルで排他する。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock_path = path + ".lock"
+        self._thread_lock = threading.RLock()
+
+    @contextmanager
+    def locked(self):
+        with self._thread_lock:
+            fd = os.open(self._lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                _lock_file(fd)
+                try:
+                    yield
+                finally:
+                    _unlock_file(fd)
+            finally:
+                os.close(fd)
+
+    def _append(self, record):
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode('utf-8')
+        with open(self.path, 'a+b') as fp:
+            # 書きかけの行で落ちていたら、その行とつながらないよう改行してから書く
+            if fp.seek(0, os.SEEK_END) > 0:
+                fp.seek(-1, os.SEEK_END)
+                if fp.read(1) != b"\n":
+                    line = b"\n" + line
+            fp.write(line)
+            fp.flush()
+            os.fsync(fp.fileno())
+
+    def records(self):
+        """レコードを古い順に返す（書きかけで落ちた最後の行などは読み飛ばす）"""
+        try:
+            with open(self.path, encoding='utf-8') as fp:
+                lines = fp.readlines()
+        except FileNotFoundError:
+            return []
+        records = []
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and 'id' in record:
+                records.append(record)
+        return records
+
+    def begin(self, moves, steps, undo_of=None):
+        record = {
+            'op': 'begin', 'id': new_transaction_id(), 'time': time.strftime("%Y-%m-%d %H:%M:%S"),
+            'moves': [list(m) for m in moves], 'steps': [[src, dst] for src, dst, _ in steps],
+        }
+        if undo_of is not None:
+            record['undo_of'] = undo_of
+        self._append(record)
+        return record['id']
+
+    def commit(self, txid, failed=()):
+        self._append({'op': 'commit', 'id': txid, 'failed': sorted(failed)})
+        self._compact_if_needed()
+
+    def transactions(self):
+        """完了したトランザクションを新しい順に返す（{'id', 'time', 'moves'（成功したもの）, 'undo_of', 'undone'}）"""
+        begins = {}
+        committed = []
+        undone = set()
+        for record in self.records():
+            op = record.get('op')
+            if op == 'begin':
+                begins[record['id']] = record
+            elif op == 'commit' and record['id'] in begins:
+                begin = begins[record['id']]
+                failed = set(record.get('failed') or ())
+                moves = [tuple(m) for k, m in enumerate(begin.get('moves') or ()) if k not in failed]
+                committed.append({
+                    'id': begin['id'], 'time': begin.get('time', ""), 'moves': moves,
+                    'undo_of': begin.get('undo_of'), 'undone': False,
+                })
+                if begin.get('undo_of') is not None:
+                    undone.add(begin['undo_of'])
+        for tx in committed:
+            tx['undone'] = tx['id'] in undone
+        return committed[::-1]
+
+    def last_undoable(self):
+        """まだ取り消していない最新のトランザクション（取り消しそのものは除く。無ければ None）"""
+        for tx in self.transactions():
+            if tx['undo_of'] is None and not tx['undone'] and tx['moves']:
+                return tx
+        return None
+
+    def pending(self):
+        """begin だけ書かれて commit / abort の無いトランザクション（途中で落ちたもの）"""
+        open_ = {}
+        for record in self.records():
+            op = record.get('op')
+            if op == 'begin':
+                open_[record['id']] = record
+            elif op in ('commit', 'abort'):
+                open_.pop(record['id'], None)
+        return list(open_.values())
+
+    def recover(self):
+        """途中で落ちたトランザクションを元の名前に戻し、戻したファイル数を返す"""
+        restored = 0
+        with self.locked():
+            for record in self.pending():
+                # 手順は前から順に行われるので、逆順にたどって済んだものだけ戻す
+                for src, dst in reversed(record.get('steps') or ()):
+                    if os.path.lexists(src) or not os.path.lexists(dst):
+                        continue
+                    try:
+                        os.rename(dst, src)
+                        restored += 1
+                    except OSError as e:
+                        logger.warning("リネームを元に戻せません: %s -> %s (%s)", dst, src, e)
+                self._append({'op': 'abort', 'id': record['id']})
+                logger.info("中断されたリネームを元に戻しました: %s", record['id'])
+        return restored
+
+    def _compact_if_needed(self):
+        try:
+            if os.path.getsize(self.path) < COMPACT_BYTES:
+                return
+        except OSError:
+            return
+        records = self.records()
+        ids = []
+        for record in records:
+            if record.get('op') == 'begin':
+                ids.append(record['id'])
+        keep = set(ids[-KEEP_TRANSACTIONS:])
+        temp = self.path + ".tmp"
+        with open(temp, 'w', encoding='utf-8', newline='\n') as fp:
+            for record in records:
+                if record['id'] in keep:
+                    fp.write(json.dumps(record, ensure_ascii=False) + "\n")
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(temp, self.path)
+
+
+if os.name == 'nt':
+    import msvcrt
+
+    def _lock_file(fd):
+        while True:
+            try:
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                # LK_LOCK は約 10 秒で諦めるので、取れるまで繰り返す
+                continue
+
+    def _unlock_file(fd):
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _lock_file(fd):
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+    def _unlock_file(fd):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+def new_transaction_id():
+    return f"{time.time_ns():x}-{os.getpid():x}"
+
+
+def _list_names(folder):
+    try:
+        with span("list_dir", path=folder):
+            return {_name_key(name) for name in os.listdir(folder)}
+    except OSError:
+        return None
+
+
+def apply_renames(pairs, journal=None, cancelled=None, report=None, undo_of=None, moved=None, dry_run=False):
+    """
+    (old_path, new_path) の並びを計画してからまとめてリネームし、成功した (old, new) のリストを返す。
+    フォルダは 1 度ずつだけ読み、ジャーナルへの書き込み（fsync）はトランザクションの前後の 2 回だけ。
+    report([(old, new, error), ...]) は入れ替えの単位ごとに呼ばれる（成功なら error は None）。
+    moved(src, dst) はディスク上のリネーム 1 回ごとに実行順で呼ばれる（入れ替え用の一時的な名前を含む）。
+    journal が None ならジャーナルは書かない（取り消し・復旧はできない）。
+    dry_run なら計画だけ行い、受け付けた移動を成功として report する。
+    """
+    by_dir = {}
+    for old, new in pairs:
+        by_dir.setdefault(os.path.dirname(old), []).append((old, new))
+
+    renamed = []
+    failed = set()
+    # 計画からコミットまでをロックの中で行う（別プロセスのリネームと混ざらないように）
+    with journal.locked() if journal is not None else nullcontext():
+        token = new_transaction_id()
+        plans = []
+        for folder, batch in by_dir.items():
+            names = _list_names(folder)
+            plans.append((plan_renames(batch, names, token), names))
+        rejected = [r for plan, _ in plans for r in plan.rejected]
+        if rejected and report is not None:
+            report(rejected)
+        moves = [move for plan, _ in plans for move in plan.moves]
+        if not moves:
+            return renamed
+        if dry_run:
+            if report is not None:
+                report([(old, new, None) for old, new in moves])
+            return moves
+
+        txid = None
+        if journal is not None:
+            steps = [step for plan, _ in plans for step in plan.steps]
+            txid = journal.begin(moves, steps, undo_of)
+        offset = 0
+        for plan, names in plans:
+            for unit in _apply_plan(plan, names, cancelled, moved):
+                results = []
+                for i, error in unit:
+                    old, new = plan.moves[i]
+                    if error:
+                        failed.add(offset + i)
+                    else:
+                        renamed.append((old, new))
+                    results.append((old, new, error))
+                if report is not None:
+                    report(results)
+            offset += len(plan.moves)
+        if journal is not None:
+            journal.commit(txid, failed)
+    return renamed
+
+
+def _apply_plan(plan, names, cancelled, moved):
+    """plan の手順を実行し、unit ごとに [(moves の添字, エラー または None)] を返すジェネレータ"""
+    def rename(src, dst):
+        error = _rename(src, dst, names)
+        if error is None and moved is not None:
+            moved(src, dst)
+        return error
+
+    for unit, temp in plan.units:
+        if cancelled is not None and cancelled.is_set():
+            yield [(i, CANCELLED) for i in dict.fromkeys(i for _, _, i in unit)]
+            continue
+        if temp is None:
+            yield [(i, rename(src, dst)) for src, dst, i in unit]
+            continue
+        # 循環: 一時的な名前へ逃がせなければ何も動かさない
+        old, _, first = unit[0]
+        error = rename(old, temp)
+        if error:
+            yield [(i, error) for i in dict.fromkeys(i for _, _, i in unit)]
+            continue
+        results = [(i, rename(src, dst)) for src, dst, i in unit[1:-1]]
+        error = rename(temp, plan.moves[first][1])
+        if error and rename(temp, old) is not None:
+            error = f"{error}（{os.path.basename(temp)} のまま残っています）"
+        yield results + [(first, error)]
+
+
+def _rename(src, dst, names):
+    """src を dst へリネームする（既存のファイルは上書きしない）。エラーメッセージか None を返す"""
+    src_key = _name_key(os.path.basename(src))
+    dst_key = _name_key(os.path.basename(dst))
+    if dst_key != src_key:
+        # POSIX の os.rename は上書きしてしまうので先に確認する（大文字小文字だけの変更は許す）
+        exists = dst_key in names if names is not None else os.path.lexists(dst)
+        if exists:
+            return f"同名のファイルがあります: {os.path.basename(dst)}"
+    try:
+        with span("rename", path=dst):
+            os.rename(src, dst)
+    except OSError as e:
+        return e.strerror or str(e)
+    if names is not None:
+        names.discard(src_key)
+        names.add(dst_key)
+    return None
+
+
+def rename_file(src, dst):
+    """1 ファイルをジャーナル無しでリネームする（dst が既にあれば FileExistsError）"""
+    if _name_key(os.path.basename(dst)) != _name_key(os.path.basename(src)) and os.path.lexists(dst):
+        raise FileExistsError(dst)
+    with span("rename", path=dst):
+        os.rename(src, dst)
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_journal():
+    """プロセス内で共有するジャーナル（設定の rename_journal_path、無ければキャッシュディレクトリ）"""
+    global _default
+    with _default_lock:
+        if _default is None:
+            from virpe_core import load_config, user_cache_dir
+            path = load_config().get('rename_journal_path') or os.path.join(user_cache_dir(), 'rename_journal.jsonl')
+            _default = RenameJournal(path)
+    return _default
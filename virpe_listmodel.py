@@ -0,0 +1,349 @@
+"""画像一覧の Qt モデル（QListView 用、フォルダはバックグラウンドで読み込む）"""
+import logging
+import os
+from PyQt6.QtCore import QAbstractListModel, QModelIndex, Qt, QThread, pyqtSignal
+from PyQt6.QtGui import QColor
+from virpe_folder import FolderModel, scan_images
+from virpe_trace import span
+
+logger = logging.getLogger(__name__)
+
+# グループに入っている行の背景（隣り合うグループを見分けられるよう 2 色を交互に使う）
+GROUP_COLORS = (QColor(255, 236, 200), QColor(210, 232, 255))
+
+
+class _ScanThread(QThread):
+    """scan_images の結果をチャンクごとに GUI スレッドへ送る"""
+
+    chunk = pyqtSignal(object, list)
+    done = pyqtSignal(object)
+
+    def __init__(self, folder, parent=None):
+        super().__init__(parent)
+        self.folder = folder
+
+    def run(self):
+        try:
+            with span("list_dir", path=self.folder):
+                for chunk in scan_images(self.folder):
+                    if self.isInterruptionRequested():
+                        return
+                    self.chunk.emit(self, chunk)
+        except OSError as e:
+            logger.warning("フォルダを読み込めません: %s (%s)", self.folder, e)
+        self.done.emit(self)
+
+
+class ImageListModel(QAbstractListModel):
+    """
+    FolderModel を QListView に見せるモデル。表示する行の分しか data() が呼ばれないので、
+    数万件のフォルダでも一覧の構築コストは件数に比例しない。
+    """
+
+    scan_finished = pyqtSignal()
+    # Exif の項目（MetadataTable）が増えた
+    metadata_changed = pyqtSignal()
+    # ワーカースレッド → GUI スレッド: (フォルダ, [(name, extract の結果)])
+    _metadata_rows = pyqtSignal(str, list)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.folder_model = FolderModel()
+        # name → グループ番号（連写・類似画像）
+        self.groups = {}
+        # サムネイル表示のときの ThumbnailCache（name → QImage、テキスト表示なら None）
+        self.thumbnails = None
+        # 絞り込み・並べ替え用の Exif の表（virpe_metatable.MetadataTable、最初に Exif が届いたときに作る）
+        self.meta = None
+        # 絞り込みの条件式（MetaQuery）。絞り込み中は条件を満たす行を先頭に集め、先頭 visible 行だけを見せる
+        self.query = None
+        self.visible = None
+        self._metadata_rows.connect(self._on_metadata_rows)
+        self._scanner = None
+        self._old_scanners = set()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.folder_model) if self.visible is None else self.visible
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= self.rowCount():
+            return None
+        if role == Qt.ItemDataRole.DisplayRole:
+            return self.folder_model.names[index.row()]
+        if role == Qt.ItemDataRole.DecorationRole and self.thumbnails is not None:
+            # まだ無いものは None（ThumbnailLoader が作り終えたら thumbnail_ready() で通知する）
+            image = self.thumbnails.get(self.folder_model.names[index.row()])
+            return None if image is None or image.isNull() else image
+        if role == Qt.ItemDataRole.BackgroundRole and self.groups:
+            group = self.groups.get(self.folder_model.names[index.row()])
+            return None if group is None else GROUP_COLORS[group % 2]
+        if role == Qt.ItemDataRole.ToolTipRole and self.groups:
+            group = self.groups.get(self.folder_model.names[index.row()])
+            return None if group is None else f"グループ {group + 1}"
+        return None
+
+    def index_of(self, name):
+        row = self.folder_model.row(name)
+        return self.index(row) if 0 <= row < self.rowCount() else QModelIndex()
+
+    def open_folder(self, folder):
+        """一覧を空にしてから、フォルダの中身を少しずつ追加していく"""
+        self._stop_scanner()
+        self.beginResetModel()
+        self.folder_model.reset(folder)
+        self.groups = {}
+        if self.thumbnails is not None:
+            self.thumbnails.clear()
+        self.meta = None
+        # 絞り込み中なら、Exif が届いて apply_query() し直すまでは何も見せない
+        self.visible = 0 if self.query is not None and self.query.conditions else None
+        self.endResetModel()
+
+        scanner = _ScanThread(folder, self)
+        scanner.chunk.connect(self._on_chunk)
+        scanner.done.connect(self._on_scan_done)
+        self._scanner = scanner
+        scanner.start()
+
+    def _stop_scanner(self):
+        scanner, self._scanner = self._scanner, None
+        if scanner is None or scanner.isFinished():
+            return
+        # ネットワークドライブで待たされないよう、止めるよう伝えるだけで待たない
+        scanner.requestInterruption()
+        self._old_scanners.add(scanner)
+        scanner.finished.connect(lambda: self._old_scanners.discard(scanner))
+
+    def _on_chunk(self, scanner, chunk):
+        if scanner is not self._scanner:
+            return
+        self._insert(chunk)
+
+    def _on_scan_done(self, scanner):
+        if scanner is not self._scanner:
+            return
+        self.sort_by(self.folder_model.sort_key)
+        self.scan_finished.emit()
+
+    def _insert(self, entries):
+        entries = [e for e in entries if e[0] not in self.folder_model]
+        if not entries:
+            return
+        if self.meta is not None:
+            self.meta.extend(len(entries))
+        if self.visible is not None:
+            # 絞り込み中は見えない末尾に足しておく（Exif が届いてから apply_query() で振り分ける）
+            self.folder_model.extend(entries)
+            return
+        first = len(self.folder_model)
+        self.beginInsertRows(QModelIndex(), first, first + len(entries) - 1)
+        self.folder_model.extend(entries)
+        self.endInsertRows()
+
+    def sort_by(self, key, reverse=False):
+        """保持している情報だけで並べ替え、選択中の行は並べ替え後の位置へ付け替える"""
+        if self.query is not None:
+            # 条件式の並べ替え・絞り込みは、名前順などの基本の並びの上に掛け直す（行は apply_query でまとめて動かす）
+            if key:
+                self.folder_model.sort_key = key
+            self._ensure_meta().set_base_order(self.folder_model.sort_order(key, reverse))
+            self.apply_query(self.query)
+            return
+        self.layoutAboutToBeChanged.emit()
+        order = self._sort_base(key, reverse)
+        new_rows = [0] * len(order)
+        for new_row, old_row in enumerate(order):
+            new_rows[old_row] = new_row
+        old_indexes = self.persistentIndexList()
+        self.changePersistentIndexList(old_indexes, [self.index(new_rows[i.row()]) for i in old_indexes])
+        self.layoutChanged.emit()
+
+    def _sort_base(self, key, reverse):
+        order = self.folder_model.sort(key, reverse)
+        if self.meta is not None:
+            self.meta.take(order)
+            self.meta.reset_rank()
+        return order
+
+    def _ensure_meta(self):
+        if self.meta is None:
+            from virpe_metatable import MetadataTable
+            self.meta = MetadataTable(len(self.folder_model))
+        return self.meta
+
+    def metadata_sink(self):
+        """
+        ExifIndex.warm の on_batch に渡す関数。ワーカースレッドで Exif から項目を取り出し、
+        GUI スレッドで表に入れる（フォルダを移った後に届いた分は捨てる）
+        """
+        folder = self.folder_model.folder
+
+        def sink(paths, exifs):
+            from virpe_metatable import extract
+            self._metadata_rows.emit(folder, [(os.path.basename(p), extract(e)) for p, e in zip(paths, exifs)])
+        return sink
+
+    def _on_metadata_rows(self, folder, rows):
+        if folder != self.folder_model.folder:
+            return
+        fm = self.folder_model
+        rows = [(fm.row(name), values) for name, values in rows if name in fm]
+        if not rows:
+            return
+        self._ensure_meta().set_rows([row for row, _ in rows], [values for _, values in rows])
+        self.metadata_changed.emit()
+
+    def apply_query(self, query):
+        """
+        条件式（virpe_metatable.MetaQuery、None で解除）で絞り込み・並べ替える。
+        評価は MetadataTable の配列演算だけで行う。並びも見せる行数も変わらなければ何も通知せず、
+        変わったときも一覧は作り直さずに行の移動と末尾の行の増減として伝える（選択・スクロール位置は残る）
+        """
+        self.query = query
+        if query is None:
+            order = self.meta.base_order() if self.meta is not None else None
+            visible = None
+        else:
+            order, visible = query.arrange(self._ensure_meta())
+            if not query.conditions:
+                visible = None
+        self._rearrange(order, visible)
+
+    def _rearrange(self, order, visible):
+        """行を order（元の行番号の NumPy 配列、None なら今のまま）の順にし、先頭 visible 行（None なら全部）を見せる"""
+        import numpy as np
+        old_count = self.rowCount()
+        new_count = len(self.folder_model) if visible is None else visible
+        if order is not None and np.array_equal(order, np.arange(len(order))):
+            order = None
+        if new_count > old_count:
+            self.beginInsertRows(QModelIndex(), old_count, new_count - 1)
+            self.visible = new_count
+            self.endInsertRows()
+        if order is not None:
+            # 見えている行数は max(old_count, new_count) のまま動かし、減る分は後で末尾から消す
+            shown = self.rowCount()
+            self.layoutAboutToBeChanged.emit()
+            new_rows = np.empty(len(order), dtype=np.intp)
+            new_rows[order] = np.arange(len(order))
+            self.folder_model.reorder(order.tolist())
+            self.meta.take(order)
+            old_indexes = self.persistentIndexList()
+            rows = new_rows[[i.row() for i in old_indexes]].tolist() if old_indexes else []
+            self.changePersistentIndexList(old_indexes, [self.index(r) if r < shown else QModelIndex() for r in rows])
+            self.layoutChanged.emit()
+        if new_count < old_count:
+            self.beginRemoveRows(QModelIndex(), new_count, old_count - 1)
+            self.visible = new_count
+            self.endRemoveRows()
+        self.visible = visible
+
+    def set_groups(self, groups):
+        """name → グループ番号を設定し、一覧の色分けを更新する"""
+        self.groups = dict(groups)
+        if self.rowCount():
+            self.dataChanged.emit(self.index(0), self.index(self.rowCount() - 1),
+                                  [Qt.ItemDataRole.BackgroundRole, Qt.ItemDataRole.ToolTipRole])
+
+    def group_rows(self, name):
+        """name と同じグループの行番号（グループに入っていなければ name の行だけ）"""
+        group = self.groups.get(name)
+        if group is None:
+            row = self.folder_model.row(name)
+            return [row] if 0 <= row < self.rowCount() else []
+        rows = (self.folder_model.row(n) for n, g in self.groups.items() if g == group and n in self.folder_model)
+        return sorted(row for row in rows if row < self.rowCount())
+
+    def set_thumbnails(self, thumbnails):
+        """サムネイル表示の切り替え（thumbnails は ThumbnailCache、None でテキストのみ）"""
+        self.thumbnails = thumbnails
+        if self.rowCount():
+            self.dataChanged.emit(self.index(0), self.index(self.rowCount() - 1), [Qt.ItemDataRole.DecorationRole])
+
+    def missing_thumbnails(self, first, last):
+        """first〜last 行のうちサムネイルがまだ無いものの (path, mtime_ns)"""
+        if self.thumbnails is None:
+            return []
+        fm = self.folder_model
+        last = min(last, self.rowCount() - 1)
+        return [(fm.path(row), fm.mtimes[row]) for row in range(max(0, first), last + 1) if fm.names[row] not in self.thumbnails]
+
+    def thumbnail_ready(self, path, image):
+        if self.thumbnails is None:
+            return
+        name = os.path.basename(path)
+        # 作っている間にフォルダを移った・リネームされたものは捨てる
+        if self.folder_model.path_of(name) != path:
+            return
+        self.thumbnails.put(name, image)
+        row = self.folder_model.row(name)
+        if row >= self.rowCount():
+            return
+        index = self.index(row)
+        self.dataChanged.emit(index, index, [Qt.ItemDataRole.DecorationRole])
+
+    def rename(self, old_name, new_name):
+        """一覧の名前を差し替えて行番号を返す（その 1 行分の変更通知のみ）"""
+        if old_name in self.groups:
+            self.groups[new_name] = self.groups.pop(old_name)
+        if self.thumbnails is not None:
+            self.thumbnails.rename_many([(old_name, new_name)])
+        if old_name not in self.folder_model:
+            if new_name in self.folder_model:
+                return self.folder_model.row(new_name)
+            row = len(self.folder_model)
+            if self.meta is not None:
+                self.meta.extend(1)
+            if self.visible is not None:
+                self.folder_model.add(new_name)
+                return row
+            self.beginInsertRows(QModelIndex(), row, row)
+            self.folder_model.add(new_name)
+            self.endInsertRows()
+            return row
+        row = self.folder_model.rename(old_name, new_name)
+        if row < self.rowCount():
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.ItemDataRole.DisplayRole])
+        return row
+
+    def rename_many(self, pairs):
+        """(old_name, new_name) をまとめて差し替える（入れ替えを含んでよい）"""
+        pairs = [(old, new) for old, new in pairs if old != new]
+        present = [(old, new) for old, new in pairs if old in self.folder_model]
+        others = [(old, new) for old, new in pairs if old not in self.folder_model and new not in self.folder_model]
+        # 一覧の別のファイルと名前が重なって差し替えなかったものは、グループ・サムネイルも付け替えない
+        applied = []
+        for row, old, new in self.folder_model.rename_many(present):
+            applied.append((old, new))
+            if row >= self.rowCount():
+                continue
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.ItemDataRole.DisplayRole])
+        moved = [(new, self.groups.pop(old)) for old, new in applied if old in self.groups]
+        self.groups.update(moved)
+        if self.thumbnails is not None:
+            self.thumbnails.rename_many(applied)
+        for old, new in others:
+            self.rename(old, new)
+
+    def apply_sync(self):
+        """ディスクとの差分（削除・追加）だけを行単位で反映する"""
+        removed, added = self.folder_model.sync()
+        rows = sorted((self.folder_model.row(name) for name in removed), reverse=True)
+        for row in rows:
+            shown = row < self.rowCount()
+            if shown:
+                self.beginRemoveRows(QModelIndex(), row, row)
+            self.folder_model.remove(self.folder_model.names[row])
+            if self.meta is not None:
+                self.meta.delete(row)
+            if shown:
+                if self.visible is not None:
+                    self.visible -= 1
+                self.endRemoveRows()
+        self._insert(added)
+        if removed or added:
+            logger.debug("folder sync: -%d +%d", len(removed), len(added))
@@ -0,0 +1,129 @@
+"""画像バッファのメモリ予算（デコードキャッシュ・表示中の画像・サムネイルを 1 つの上限で管理する）"""
+import logging
+import os
+import sys
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBudget:
+    """
+    register したプールが持つ画像の合計バイト数を limit 以下に保つ。
+    プールは images()（持っている QImage の並び）と shrink()（1 段だけ減らし、減らせたら True）を持つ。
+    読み込んだファイルの内容（virpe_fileio、file_buffer_mb）は画像ではないので含めない。
+    超えたら priority の小さいプールから順に shrink する。同じ画像を複数のプールが持っていても
+    （QImage の暗黙共有）cacheKey で 1 回だけ数える。GUI スレッドからだけ使う。
+    """
+
+    def __init__(self, limit_bytes: int):
+        self.limit = limit_bytes
+        self._pools = []
+        self._enforcing = False
+        # 使用量が変わったときに呼ぶ（デバッグ表示用）
+        self.changed = None
+
+    def register(self, name: str, pool, priority: int = 0):
+        self._pools.append((priority, name, pool))
+        self._pools.sort(key=lambda p: p[0])
+
+    def held_elsewhere(self, image, owner) -> bool:
+        """image（と同じデータ）を owner 以外のプールも持っているか"""
+        key = image.cacheKey()
+        return any(pool is not owner and any(i.cacheKey() == key for i in pool.images()) for _, _, pool in self._pools)
+
+    def usage(self):
+        """(合計バイト数, {プール名: バイト数}) を返す"""
+        seen = set()
+        by_pool = {}
+        total = 0
+        for _, name, pool in self._pools:
+            size = 0
+            for image in pool.images():
+                key = image.cacheKey()
+                if key in seen:
+                    continue
+                seen.add(key)
+                size += image.sizeInBytes()
+            by_pool[name] = size
+            total += size
+        return total, by_pool
+
+    def enforce(self):
+        """
+        上限を超えていれば、優先度の低いプールから減らしていく。
+        それより優先度の高いプールだけで上限を超えているときは、減らしても上限に収まらないので減らさない
+        （大きな画像の表示中に、デコードキャッシュやサムネイルを無駄に捨てない）
+        """
+        if self._enforcing:
+            return
+        self._enforcing = True
+        try:
+            total, by_pool = self.usage()
+            if total > self.limit:
+                # 優先度の高いものから、そのプールと上位のプールだけで上限を超える分は先に減らす
+                for i in range(len(self._pools) - 1, -1, -1):
+                    pool = self._pools[i][2]
+                    while self._sum(by_pool, i) > self.limit and pool.shrink():
+                        total, by_pool = self.usage()
+                for i, (_, _, pool) in enumerate(self._pools):
+                    if self._sum(by_pool, i + 1) > self.limit:
+                        continue
+                    while total > self.limit and pool.shrink():
+                        total, by_pool = self.usage()
+            if total > self.limit:
+                # 表示中の画像だけで上限を超えている（それ以上は減らせない）
+                logger.debug("memory budget exceeded: %s", self.format_usage())
+        finally:
+            self._enforcing = False
+        if self.changed is not None:
+            self.changed()
+
+    def _sum(self, by_pool, start):
+        """優先度の順で start 番目以降のプールのバイト数"""
+        return sum(by_pool[name] for _, name, _ in self._pools[start:])
+
+    def format_usage(self) -> str:
+        total, by_pool = self.usage()
+        parts = " ".join(f"{name} {_mb(size)}" for name, size in by_pool.items())
+        text = f"mem {_mb(total)} / {_mb(self.limit)} MB ({parts})"
+        rss = process_rss()
+        if rss is not None:
+            text += f" rss {_mb(rss)} MB"
+        return text
+
+
+def _mb(n):
+    return f"{n / (1024 * 1024):.0f}"
+
+
+def process_rss():
+    """このプロセスの常駐メモリ（バイト、取れなければ None）"""
+    if sys.platform.startswith('linux'):
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError, IndexError):
+            return None
+    if os.name == 'nt':
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [
+                ("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        try:
+            process = ctypes.windll.kernel32.GetCurrentProcess()
+            if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+                return counters.WorkingSetSize
+        except (AttributeError, OSError):
+            pass
+        return None
+    return None
@@ -0,0 +1,305 @@
+"""一覧の絞り込み・並べ替え用に、Exif の主な項目を列ごとの NumPy 配列で持つ表
+
+FolderModel の行と同じ並びで持ち、条件式の評価と並べ替えは配列演算だけで行う（ファイルごとのループなし）。
+条件式（空白区切りはすべて満たすもの）:
+
+    iso>=3200  f<=2.8  shutter<=1/250  focal=70..200  focal35>=200
+    date>=2024-05-01  date=2024-05-01T14:00..2024-05-01T15:30  time=14:00..15:00
+    model=EOS  model!=iPhone  sort:-iso,date
+
+date / time は撮影日時（DateTimeOriginal、タイムゾーンは見ない）。値の無いファイルは数値の条件に一致しない。
+"""
+import calendar
+import re
+from fractions import Fraction
+import numpy as np
+
+# 数値の列（無い値は NaN）。datetime は DateTimeOriginal を UTC とみなしたエポック秒
+NUMERIC = ('datetime', 'exposure', 'fnumber', 'iso', 'focal', 'focal35')
+# 列 → タグ（前のものが無ければ次のもの。ISO は Exif 2.3 で PhotographicSensitivity に改名された）
+_TAGS = (
+    ('exposure', ('ExposureTime',)), ('fnumber', ('FNumber',)),
+    ('iso', ('ISOSpeedRatings', 'PhotographicSensitivity')),
+    ('focal', ('FocalLength',)), ('focal35', ('FocalLengthIn35mmFilm',)),
+)
+# 条件式の項目名 → 列
+FIELDS = {
+    'date': 'datetime', 'time': 'datetime', 'shutter': 'exposure', 'f': 'fnumber',
+    'iso': 'iso', 'focal': 'focal', 'focal35': 'focal35', 'model': 'model',
+}
+_DATETIME = re.compile(r"(\d{4}):(\d{2}):(\d{2})[ T](\d{2}):(\d{2}):(\d{2})")
+_CONDITION = re.compile(r"^([a-z0-9]+)(>=|<=|!=|=|>|<)(.*)$")
+_DATE_VALUE = re.compile(r"^(\d{4})-(\d{1,2})-(\d{1,2})(?:[T ](\d{1,2}):(\d{2})(?::(\d{2}))?)?$")
+_TIME_VALUE = re.compile(r"^(\d{1,2}):(\d{2})(?::(\d{2}))?$")
+_DAY = 86400
+
+
+def _number(value):
+    if isinstance(value, tuple):
+        value = value[0] if value else None
+    if isinstance(value, Fraction):
+        return float(value) if value.denominator else np.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(Fraction(value.strip()))
+        except (ValueError, ZeroDivisionError):
+            return np.nan
+    return np.nan
+
+
+def _epoch(text):
+    match = _DATETIME.search(text) if isinstance(text, str) else None
+    if match is None:
+        return np.nan
+    try:
+        return float(calendar.timegm(tuple(int(g) for g in match.groups())))
+    except (ValueError, OverflowError):
+        return np.nan
+
+
+def extract(exif):
+    """get_exif の結果 → (datetime, exposure, fnumber, iso, focal, focal35, model)。ワーカースレッドで呼ぶ"""
+    if not exif:
+        return (np.nan,) * len(NUMERIC) + ("",)
+    values = [_epoch(exif.get('DateTimeOriginal'))]
+    for _, tags in _TAGS:
+        value = None
+        for tag in tags:
+            value = exif.get(tag)
+            if value:
+                break
+        values.append(_number(value))
+    model = exif.get('Model')
+    values.append(model.strip() if isinstance(model, str) else "")
+    return tuple(values)
+
+
+class MetadataTable:
+    """
+    行ごとの Exif の項目を列（NumPy 配列）で持つ。model は機種名の番号（models の添字、無ければ -1）。
+    rank は名前順などの基本の並び（並べ替えの同順位をこの順にする）、filled は Exif を読み終えた行。
+    """
+
+    def __init__(self, rows: int = 0):
+        self.columns = {name: np.empty(0) for name in NUMERIC}
+        self.model = np.empty(0, dtype=np.int32)
+        self.rank = np.empty(0, dtype=np.int64)
+        self.filled = np.empty(0, dtype=bool)
+        self.models = []
+        self._model_codes = {}
+        self.extend(rows)
+
+    def __len__(self):
+        return len(self.rank)
+
+    def extend(self, count: int):
+        """末尾に値の無い行を count 行追加する"""
+        if count <= 0:
+            return
+        start = len(self.rank)
+        for name in NUMERIC:
+            self.columns[name] = np.concatenate((self.columns[name], np.full(count, np.nan)))
+        self.model = np.concatenate((self.model, np.full(count, -1, dtype=np.int32)))
+        self.rank = np.concatenate((self.rank, np.arange(start, start + count, dtype=np.int64)))
+        self.filled = np.concatenate((self.filled, np.zeros(count, dtype=bool)))
+
+    def take(self, order):
+        """行を order（元の行番号の並び）の順に並べ替える"""
+        order = np.asarray(order, dtype=np.intp)
+        for name in NUMERIC:
+            self.columns[name] = self.columns[name][order]
+        self.model = self.model[order]
+        self.rank = self.rank[order]
+        self.filled = self.filled[order]
+
+    def delete(self, row: int):
+        for name in NUMERIC:
+            self.columns[name] = np.delete(self.columns[name], row)
+        self.model = np.delete(self.model, row)
+        self.rank = np.delete(self.rank, row)
+        self.filled = np.delete(self.filled, row)
+
+    def reset_rank(self):
+        """今の行の並びを基本の並びにする（名前順などで並べ替えた直後に呼ぶ）"""
+        self.rank = np.arange(len(self.rank), dtype=np.int64)
+
+    def set_base_order(self, order):
+        """基本の並びを order（今の行番号の並び）にする（行そのものは動かさない）"""
+        rank = np.empty(len(self.rank), dtype=np.int64)
+        rank[np.asarray(order, dtype=np.intp)] = np.arange(len(self.rank), dtype=np.int64)
+        self.rank = rank
+
+    def base_order(self):
+        """基本の並び（rank 順）に戻すための行の並び"""
+        return np.argsort(self.rank, kind='stable')
+
+    def set_rows(self, rows, values):
+        """rows の行に extract の結果 values を入れる"""
+        if not rows:
+            return
+        rows = np.asarray(rows, dtype=np.intp)
+        numeric = np.array([v[:len(NUMERIC)] for v in values], dtype=np.float64).reshape(len(rows), len(NUMERIC))
+        for i, name in enumerate(NUMERIC):
+            self.columns[name][rows] = numeric[:, i]
+        self.model[rows] = [self._model_code(v[len(NUMERIC)]) for v in values]
+        self.filled[rows] = True
+
+    def _model_code(self, name):
+        if not name:
+            return -1
+        code = self._model_codes.get(name)
+        if code is None:
+            code = self._model_codes[name] = len(self.models)
+            self.models.append(name)
+        return code
+
+    def model_rank(self):
+        """機種名の辞書順の順位（行ごと、機種名の無い行は最後）"""
+        if not self.models:
+            return np.zeros(len(self.model), dtype=np.int64)
+        order = np.argsort(np.array([m.casefold() for m in self.models]))
+        rank = np.empty(len(self.models) + 1, dtype=np.int64)
+        rank[order] = np.arange(len(self.models))
+        rank[-1] = len(self.models)  # -1（無し）は最後
+        return rank[self.model]
+
+
+def _parse_date(text):
+    """'2024-05-01' / '2024-05-01T14:00' → 区間 [lo, hi)（エポック秒）"""
+    match = _DATE_VALUE.match(text)
+    if match is None:
+        raise ValueError(f"日付は 2024-05-01 か 2024-05-01T14:00 の形で指定してください: {text}")
+    y, mo, d, h, mi, s = match.groups()
+    try:
+        lo = calendar.timegm((int(y), int(mo), int(d), int(h or 0), int(mi or 0), int(s or 0)))
+    except (ValueError, OverflowError):
+        raise ValueError(f"日付が正しくありません: {text}")
+    return lo, lo + (_DAY if h is None else 60 if s is None else 1)
+
+
+def _parse_time(text):
+    """'14:00' → 1 日の中の区間 [lo, hi)（秒）"""
+    match = _TIME_VALUE.match(text)
+    if match is None:
+        raise ValueError(f"時刻は 14:00 の形で指定してください: {text}")
+    h, mi, s = match.groups()
+    lo = int(h) * 3600 + int(mi) * 60 + int(s or 0)
+    return lo, lo + (60 if s is None else 1)
+
+
+def _parse_number(text):
+    try:
+        value = float(Fraction(text))
+    except (ValueError, ZeroDivisionError):
+        raise ValueError(f"数値ではありません: {text}")
+    return value, value
+
+
+class MetaQuery:
+    """条件式（compile_query の結果）。mask() と arrange() は MetadataTable の配列演算だけで評価する"""
+
+    def __init__(self, conditions, sort_keys):
+        # conditions: (field, op, 値の区間の並び, 点の値か) / sort_keys: (field, 降順か)
+        self.conditions = conditions
+        self.sort_keys = sort_keys
+
+    def mask(self, table: MetadataTable):
+        """条件を満たす行の bool 配列（条件が無ければ None）"""
+        if not self.conditions:
+            return None
+        result = np.ones(len(table), dtype=bool)
+        for field, op, values, point in self.conditions:
+            result &= self._condition(table, field, op, values, point)
+        return result
+
+    @staticmethod
+    def _condition(table, field, op, values, point):
+        if field == 'model':
+            needle = values.casefold()
+            codes = [i for i, m in enumerate(table.models) if needle in m.casefold()]
+            hit = np.isin(table.model, codes)
+            return hit if op == '=' else ~hit & (table.model >= 0)
+        x = table.columns[FIELDS[field]]
+        if field == 'time':
+            x = np.mod(x, _DAY)
+        if op == '..':
+            (lo, _), (_, hi) = values
+            if lo is None:
+                lo = -np.inf
+            if hi is None:
+                hi = np.inf
+            if field == 'time' and lo > hi:
+                # 22:00..02:00 のように日付をまたぐ
+                return (x >= lo) | (x < hi)
+            return (x >= lo) & ((x <= hi) if point else (x < hi))
+        lo, hi = values[0]
+        if point:
+            hit = {'=': x == lo, '!=': x != lo, '>=': x >= lo, '>': x > lo, '<=': x <= lo, '<': x < lo}[op]
+        else:
+            hit = {'=': (x >= lo) & (x < hi), '>=': x >= lo, '>': x >= hi, '<=': x < hi, '<': x < lo}.get(op)
+            if hit is None:
+                hit = ~((x >= lo) & (x < hi))
+        # != でも値の無い行は含めない
+        return hit & ~np.isnan(x)
+
+    def arrange(self, table: MetadataTable):
+        """
+        (行の並び, 表示する行数) を返す。並びは sort_keys 順（同順位は rank 順）で、
+        条件を満たす行を先頭に集める。表示するのは先頭から「表示する行数」だけ。
+        """
+        keys = [table.rank]
+        for field, descending in reversed(self.sort_keys):
+            if field == 'model':
+                key = table.model_rank()
+                keys.append(-key if descending else key)
+                continue
+            key = table.columns[FIELDS[field]]
+            if field == 'time':
+                key = np.mod(key, _DAY)
+            # NaN は昇順・降順どちらでも最後
+            keys.append(-key if descending else key)
+        order = np.lexsort(keys) if len(keys) > 1 else table.base_order()
+        mask = self.mask(table)
+        if mask is None:
+            return order, len(order)
+        hit = mask[order]
+        return np.concatenate((order[hit], order[~hit])), int(hit.sum())
+
+
+def compile_query(text: str):
+    """条件式を MetaQuery にする（空なら None）。書けない式は ValueError"""
+    conditions = []
+    sort_keys = []
+    for token in (text or "").split():
+        lowered = token.lower()
+        if lowered.startswith('sort:'):
+            for key in filter(None, lowered[5:].split(',')):
+                descending = key.startswith('-')
+                field = key.lstrip('+-')
+                if field not in FIELDS:
+                    raise ValueError(f"並べ替えられない項目です: {field}")
+                sort_keys.append((field, descending))
+            continue
+        match = _CONDITION.match(token)
+        if match is None:
+            raise ValueError(f"条件は 項目>=値 の形で指定してください: {token}")
+        field, op, value = match.group(1).lower(), match.group(2), match.group(3)
+        if field not in FIELDS:
+            raise ValueError(f"不明な項目です: {field}（使える項目: {', '.join(FIELDS)}）")
+        if field == 'model':
+            if op not in ('=', '!='):
+                raise ValueError("model は = か != で指定してください")
+            conditions.append((field, op, value, False))
+            continue
+        parse = _parse_date if field == 'date' else _parse_time if field == 'time' else _parse_number
+        if op == '=' and '..' in value:
+            lo, hi = value.split('..', 1)
+            conditions.append((field, '..', (parse(lo) if lo else (None, None), parse(hi) if hi else (None, None)),
+                               parse is _parse_number))
+        else:
+            conditions.append((field, op, (parse(value),), parse is _parse_number))
+    if not conditions and not sort_keys:
+        return None
+    return MetaQuery(conditions, sort_keys)
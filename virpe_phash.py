@@ -0,0 +1,166 @@
+"""知覚ハッシュ（dHash）で連写・ほぼ同じ画像をグループにまとめる
+
+ハッシュは縮小デコードした 72x64 の輝度を 9x8 に平均し、隣り合う画素の大小を 64 ビットにしたもの。
+計算はプロセスプールで行い、チャンク単位で NumPy にまとめて処理する。
+"""
+import os
+import re
+from datetime import datetime
+
+HASH_SIZE = 8
+# 縮小デコードする大きさ（9x8 のブロックごとに 8x8 画素を平均する）
+SAMPLE_WIDTH = (HASH_SIZE + 1) * 8
+SAMPLE_HEIGHT = HASH_SIZE * 8
+# 1 つのワーカーに渡すファイル数
+CHUNK_SIZE = 64
+
+# ほぼ同じ画像とみなすハミング距離
+NEAR_DISTANCE = 6
+# 撮影時刻が近いときに連写とみなすハミング距離と秒数
+BURST_DISTANCE = 16
+BURST_SECONDS = 2.0
+
+_EXIF_TIME = re.compile(r"(\d{4}):(\d{2}):(\d{2}) (\d{2}):(\d{2}):(\d{2})")
+
+
+def dhash_pixels(gray):
+    """(N, SAMPLE_HEIGHT, SAMPLE_WIDTH) の輝度配列から N 個の 64 ビットハッシュ（uint64）を求める"""
+    import numpy as np
+    g = np.asarray(gray, dtype=np.float32)
+    if g.ndim == 2:
+        g = g[None]
+    n = g.shape[0]
+    blocks = g.reshape(n, HASH_SIZE, 8, HASH_SIZE + 1, 8).mean(axis=(2, 4))
+    bits = blocks[:, :, 1:] > blocks[:, :, :-1]
+    return np.packbits(bits.reshape(n, HASH_SIZE * HASH_SIZE), axis=1).view('>u8').ravel().astype(np.uint64)
+
+
+def _load_gray(path):
+    """path を SAMPLE_WIDTH x SAMPLE_HEIGHT の輝度に縮小デコードする（読めなければ None）"""
+    import numpy as np
+    from PyQt6.QtCore import QSize
+    from PyQt6.QtGui import QImage, QImageReader
+    size = QSize(SAMPLE_WIDTH, SAMPLE_HEIGHT)
+    reader = QImageReader(path)
+    reader.setAutoTransform(True)
+    # JPEG は DCT 段階で縮小されるので、原寸デコードよりずっと速い
+    reader.setScaledSize(size)
+    image = reader.read()
+    if image.isNull():
+        return None
+    if image.size() != size:
+        image = image.scaled(size)
+    image = image.convertToFormat(QImage.Format.Format_Grayscale8)
+    ptr = image.constBits()
+    ptr.setsize(image.sizeInBytes())
+    rows = np.frombuffer(ptr, dtype=np.uint8).reshape(SAMPLE_HEIGHT, image.bytesPerLine())
+    return rows[:, :SAMPLE_WIDTH].copy()
+
+
+def hash_files(paths):
+    """ワーカープロセスで呼ぶ。[(path, hash または None)] を返す"""
+    import numpy as np
+    loaded = []
+    failed = []
+    for path in paths:
+        try:
+            gray = _load_gray(path)
+        except Exception:
+            gray = None
+        if gray is None:
+            failed.append((path, None))
+        else:
+            loaded.append((path, gray))
+    if not loaded:
+        return failed
+    hashes = dhash_pixels(np.stack([gray for _, gray in loaded]))
+    return [(path, int(h)) for (path, _), h in zip(loaded, hashes)] + failed
+
+
+def exif_timestamp(exif):
+    """Exif の DateTimeOriginal（あれば SubSecTimeOriginal も）を秒に変換する（無ければ None）"""
+    if not exif:
+        return None
+    m = _EXIF_TIME.search(str(exif.get('DateTimeOriginal') or ""))
+    if not m:
+        return None
+    try:
+        ts = datetime(*map(int, m.groups())).timestamp()
+    except (ValueError, OverflowError, OSError):
+        return None
+    subsec = str(exif.get('SubSecTimeOriginal') or "").strip()
+    if subsec.isdigit():
+        ts += int(subsec) / 10 ** len(subsec)
+    return ts
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+def near_pairs(hashes, radius):
+    """
+    ハミング距離が radius 以下の組 (j, i)（j < i）を列挙する。
+    64 ビットを radius+1 個に分けると、距離 radius 以下の 2 つはどれか 1 つの部分が必ず一致する
+    （multi-index hashing）ので、部分ごとの辞書で候補を絞ってから距離を測る。
+    """
+    parts = radius + 1
+    bounds = [(64 * k // parts, 64 * (k + 1) // parts) for k in range(parts)]
+    tables = [{} for _ in bounds]
+    for i, h in enumerate(hashes):
+        seen = set()
+        for (lo, hi), table in zip(bounds, tables):
+            bucket = table.setdefault((h >> lo) & ((1 << (hi - lo)) - 1), [])
+            for j in bucket:
+                if j not in seen:
+                    seen.add(j)
+                    if hamming(h, hashes[j]) <= radius:
+                        yield j, i
+            bucket.append(i)
+
+
+def group_images(items, near=NEAR_DISTANCE, burst_distance=BURST_DISTANCE, burst_seconds=BURST_SECONDS):
+    """
+    items: 一覧の順の (name, hash, 撮影時刻の秒 または None)。hash が None のものは対象外。
+    ほぼ同じ画像（距離 near 以下）と、撮影時刻が burst_seconds 以内で距離 burst_distance 以下の連写をまとめる。
+    戻り値: 2 枚以上のグループに入った name → グループ番号（一覧の順に 0 から）
+    """
+    items = [item for item in items if item[1] is not None]
+    parent = list(range(len(items)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i, j):
+        ri, rj = find(i), find(j)
+        if ri != rj:
+            parent[max(ri, rj)] = min(ri, rj)
+
+    for j, i in near_pairs([h for _, h, _ in items], near):
+        union(i, j)
+
+    timed = sorted((ts, i) for i, (_, _, ts) in enumerate(items) if ts is not None)
+    for (t0, i), (t1, j) in zip(timed, timed[1:]):
+        if t1 - t0 <= burst_seconds and hamming(items[i][1], items[j][1]) <= burst_distance:
+            union(i, j)
+
+    members = {}
+    for i in range(len(items)):
+        members.setdefault(find(i), []).append(i)
+    groups = {}
+    number = 0
+    for root in sorted(members):
+        rows = members[root]
+        if len(rows) < 2:
+            continue
+        for i in rows:
+            groups[items[i][0]] = number
+        number += 1
+    return groups
+
+
+def default_jobs():
+    return max(1, (os.cpu_count() or 2) - 1)
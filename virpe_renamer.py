@@ -0,0 +1,185 @@
+"""リネームをワーカースレッドで行うキュー（ネットワークドライブでも GUI を止めない）
+
+計画・ジャーナル・取り消しは virpe_journal。
+"""
+import logging
+import threading
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+from virpe_journal import apply_renames, default_journal
+
+logger = logging.getLogger(__name__)
+
+
+class _RenameSignals(QObject):
+    # 入れ替えの単位ごとの [(old, new, エラー または None)]
+    done = pyqtSignal(object)
+    # ディスク上のリネーム 1 回（src, dst）
+    moved = pyqtSignal(str, str)
+    # plan() の結果（[(old, new)], [(path, エラーメッセージ)]）
+    planned = pyqtSignal(object, object)
+
+
+class _RenameTask(QRunnable):
+    def __init__(self, signals, pairs, cancelled, undo_of=None):
+        super().__init__()
+        self._signals = signals
+        self.pairs = pairs
+        self.cancelled = cancelled
+        self.undo_of = undo_of
+
+    def run(self):
+        signals = self._signals
+        reported = set()
+
+        def report(results):
+            reported.update((old, new) for old, new, _ in results)
+            signals.done.emit(results)
+
+        try:
+            apply_renames(self.pairs, default_journal(), self.cancelled, report, self.undo_of, signals.moved.emit)
+            # 計画で除かれたもの（元のファイルが重複しているなど）
+            error = "リネームされませんでした"
+        except Exception as e:
+            logger.warning("rename batch error: %s", e)
+            error = str(e)
+        # 結果を返していないものも返す（一覧を元に戻し、キューを空にするため）。名前が変わらないものは成功
+        rest = [(old, new, None if old == new else error) for old, new in self.pairs if (old, new) not in reported]
+        if rest:
+            signals.done.emit(rest)
+
+
+class _PlanTask(QRunnable):
+    def __init__(self, signals, plan):
+        super().__init__()
+        self._signals = signals
+        self.plan = plan
+
+    def run(self):
+        try:
+            pairs, errors = self.plan()
+        except Exception as e:
+            logger.warning("rename planning error: %s", e)
+            pairs, errors = [], [(None, str(e))]
+        self._signals.planned.emit(pairs, errors)
+
+
+class _RecoverTask(QRunnable):
+    def run(self):
+        try:
+            restored = default_journal().recover()
+        except OSError as e:
+            logger.warning("rename journal recovery error: %s", e)
+            return
+        if restored:
+            logger.warning("前回中断されたリネームを %d 件元に戻しました", restored)
+
+
+class RenameQueue(QObject):
+    """
+    submit() したリネームを 1 つのトランザクションとして、1 本のワーカースレッドで順に実行する。
+    失敗したものだけが failed で GUI スレッドへ返るので、呼び出し側は一覧を先に書き換えておき
+    （楽観的更新）、それを元に戻せばよい。キャッシュなどパスをキーにしたものは
+    moved（ディスク上のリネームを実行順に、入れ替え用の一時的な名前を含めて）に合わせて付け替える。
+    """
+
+    # [(old, new, エラーメッセージ)]（入れ替えは 1 度にまとめて返す）
+    failed = pyqtSignal(object)
+    # ディスク上のリネーム 1 回（src, dst）
+    moved = pyqtSignal(str, str)
+    # plan() で求めた [(old, new)] と、求められなかった [(path, エラーメッセージ)]
+    planned = pyqtSignal(object, object)
+    # 完了数, 全体数
+    progress = pyqtSignal(int, int)
+    # キューが空になった（成功数, 失敗数）
+    idle = pyqtSignal(int, int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(1)
+        self._signals = _RenameSignals()
+        self._signals.done.connect(self._on_done)
+        self._signals.moved.connect(self.moved)
+        self._signals.planned.connect(self.planned)
+        self._cancelled = threading.Event()
+        # リネーム待ちの new_path → old_path
+        self._pending = {}
+        self._sources = set()
+        self._total = 0
+        self._done = 0
+        self._failed = 0
+        # 前回落ちたときのトランザクションを、最初のリネームより先に元へ戻す
+        self._pool.start(_RecoverTask())
+
+    @property
+    def busy(self) -> bool:
+        return bool(self._pending)
+
+    def source_of(self, path):
+        """path がリネーム待ちなら、まだディスク上にある元のパスを返す"""
+        return self._pending.get(path, path)
+
+    def submit(self, pairs, undo_of=None):
+        """
+        (old_path, new_path) の並びをキューに積む。同じ名前への変更や、
+        リネーム待ちと衝突するものは除き、受け付けた組のリストを返す。
+        undo_of はジャーナル上の取り消すトランザクション（undo_pairs を参照）。
+        """
+        accepted = []
+        for old, new in pairs:
+            if not new or old == new or new in self._pending or old in self._sources:
+                continue
+            self._pending[new] = old
+            self._sources.add(old)
+            accepted.append((old, new))
+        if not accepted:
+            return accepted
+        if self._total == self._done:
+            self._total = self._done = self._failed = 0
+        self._total += len(accepted)
+        self._pool.start(_RenameTask(self._signals, accepted, self._cancelled, undo_of))
+        self.progress.emit(self._done, self._total)
+        return accepted
+
+    def plan(self, func):
+        """
+        func()（変更先を求める処理。([(old, new)], [(path, エラーメッセージ)]) を返す）をワーカースレッドで実行し、
+        結果を planned で返す。Exif を読むような遅い処理を GUI スレッドで行わないためのもの。
+        先に積んだリネームが終わってから実行される。
+        """
+        self._pool.start(_PlanTask(self._signals, func))
+
+    def cancel(self):
+        """まだ実行していないリネームを取り消す（取り消したものは failed で返る）"""
+        self._cancelled.set()
+        # これ以降に積まれたものは取り消さない
+        self._cancelled = threading.Event()
+
+    def undo_pairs(self):
+        """
+        最新の取り消せるトランザクションと、元に戻すための (現在のパス, 元のパス) のリストを返す
+        （無ければ (None, [])）。submit(pairs, undo_of=id) で実行する。
+        """
+        tx = default_journal().last_undoable()
+        if tx is None:
+            return None, []
+        return tx['id'], [(new, old) for old, new in reversed(tx['moves'])]
+
+    def _on_done(self, results):
+        failures = []
+        for old, new, error in results:
+            self._pending.pop(new, None)
+            self._sources.discard(old)
+            self._done += 1
+            if error:
+                self._failed += 1
+                failures.append((old, new, error))
+        if failures:
+            self.failed.emit(failures)
+        self.progress.emit(self._done, self._total)
+        if not self._pending:
+            self.idle.emit(self._done - self._failed, self._failed)
+
+    def shutdown(self):
+        self.cancel()
+        self._pool.waitForDone(5000)
@@ -0,0 +1,79 @@
+"""多重起動の抑止の待ち受け側（2 回目以降の起動から送られたパスを受け取る。送る側は virpe_instance）"""
+import logging
+from PyQt6.QtCore import QObject, pyqtSignal
+from PyQt6.QtNetwork import QLocalServer
+from virpe_instance import decode_message, forward, server_name
+
+logger = logging.getLogger(__name__)
+
+
+class InstanceServer(QObject):
+    """QLocalServer で待ち受け、送られたパスを received(list) で知らせる"""
+
+    received = pyqtSignal(list)
+
+    def __init__(self, name=None, parent=None):
+        super().__init__(parent)
+        self.name = name or server_name()
+        self._server = QLocalServer(self)
+        # 他のユーザーからは接続させない
+        self._server.setSocketOptions(QLocalServer.SocketOption.UserAccessOption)
+        self._server.newConnection.connect(self._on_connection)
+        # 接続 → 受け取り途中のデータ（処理済みなら None）
+        self._buffers = {}
+
+    def listen(self) -> bool:
+        """待ち受けを始める。別の ViRPE が待ち受けていれば False"""
+        # UserAccessOption の Unix ソケットは別の名前で作ってから置き換えるので、listen は既存のソケットがあっても
+        # 失敗しない（待ち受け中の ViRPE から奪ってしまう）。先に確かめる
+        if forward(None, self.name, reply_timeout=0.5):
+            return False
+        if self._server.listen(self.name):
+            return True
+        # 前回異常終了したときのソケットが残っているだけなら消して待ち受け直す
+        QLocalServer.removeServer(self.name)
+        if self._server.listen(self.name):
+            return True
+        logger.warning("single instance: listen failed: %s", self._server.errorString())
+        return False
+
+    def close(self):
+        self._server.close()
+
+    def _on_connection(self):
+        while self._server.hasPendingConnections():
+            conn = self._server.nextPendingConnection()
+            self._buffers[conn] = b""
+            conn.readyRead.connect(lambda conn=conn: self._on_ready_read(conn))
+            conn.disconnected.connect(lambda conn=conn: self._on_disconnected(conn))
+
+    def _on_ready_read(self, conn):
+        data = self._buffers.get(conn)
+        if data is None:
+            return
+        data += bytes(conn.readAll())
+        if b"\n" not in data:
+            self._buffers[conn] = data
+            return
+        self._buffers[conn] = None
+        conn.write(b"ok\n")
+        conn.flush()
+        conn.disconnectFromServer()
+        self._handle(data.split(b"\n", 1)[0])
+
+    def _on_disconnected(self, conn):
+        data = self._buffers.pop(conn, None)
+        if data:
+            # 改行の前に切られた分も 1 行として扱う
+            self._handle(data)
+        conn.deleteLater()
+
+    def _handle(self, line):
+        try:
+            paths = decode_message(line)
+        except ValueError:
+            logger.debug("single instance: bad message %r", line[:200])
+            return
+        # PING は待ち受けの確認だけ
+        if paths is not None:
+            self.received.emit(paths)
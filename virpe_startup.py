@@ -0,0 +1,59 @@
+"""起動時間の計測（--profile-startup / --startup-budget）
+
+    python ViRPE.py --profile-startup
+    QT_QPA_PLATFORM=offscreen python ViRPE.py --startup-budget 1500
+
+--startup-budget は最初の描画まで進んだら終了し、合計が予算(ms)を超えていれば終了コード 1 を返す。
+"""
+import sys
+import time
+
+
+class StartupProfile:
+    """起動の各フェーズにかかった時間を順に記録する"""
+
+    def __init__(self, t0=None):
+        self.t0 = time.perf_counter() if t0 is None else t0
+        self._last = self.t0
+        self.phases = []
+
+    def mark(self, name):
+        """前回の mark（または計測開始）からここまでを name のフェーズとして記録する"""
+        now = time.perf_counter()
+        self.phases.append((name, now - self._last))
+        self._last = now
+
+    @property
+    def total(self) -> float:
+        return self._last - self.t0
+
+    def report(self, file=None):
+        file = file or sys.stderr
+        width = max([len('total')] + [len(name) for name, _ in self.phases])
+        for name, seconds in self.phases:
+            print(f"startup: {name:<{width}} {seconds * 1000:8.1f} ms", file=file)
+        print(f"startup: {'total':<{width}} {self.total * 1000:8.1f} ms", file=file)
+
+
+def parse_startup_args(argv):
+    """
+    argv から起動計測のオプションを取り除く。
+    戻り値: (計測するか, 予算ms または None, 残りの argv)
+    """
+    profile = False
+    budget = None
+    rest = []
+    it = iter(argv)
+    for arg in it:
+        if arg == '--profile-startup':
+            profile = True
+        elif arg == '--startup-budget' or arg.startswith('--startup-budget='):
+            value = arg.partition('=')[2] or next(it, '')
+            try:
+                budget = float(value)
+            except ValueError:
+                raise SystemExit(f"--startup-budget には ms を数値で指定してください: {value!r}")
+            profile = True
+        else:
+            rest.append(arg)
+    return profile, budget, rest
@@ -0,0 +1,199 @@
+"""リネーム用のファイル名テンプレート
+
+    {stem} {ExposureTime}秒[ F{FNumber}][ ISO{ISO}] {DateTimeOriginal:%Y%m%d_%H%M%S}
+
+- {名前} … Exif タグ名（get_exif の辞書のキー）または下記の組み込みフィールド（どちらでもなければ ValueError）
+- {名前:書式} … 日時は strftime 形式、数値は format() 形式
+- [ ... ] … 中のフィールドが 1 つでも空なら、括弧内ごと出力しない
+- {place} / {country} … GPS の座標に最も近い地名と国コード（virpe_geo の地名辞典を作っておく。無ければ空）
+"""
+import re
+from datetime import datetime
+from fractions import Fraction
+from functools import lru_cache
+
+_TOKEN = re.compile(r'\{([^{}:]+)(?::([^{}]*))?\}|\[|\]|[^{}\[\]]+')
+
+
+def _iso(exif):
+    return exif.get('ISOSpeedRatings') or exif.get('PhotographicSensitivity')
+
+
+def _shutter(exif):
+    # 従来のリネームと同じ表記（1/250 → 1／250秒）
+    value = exif.get('ExposureTime')
+    if isinstance(value, Fraction):
+        return f"{value.numerator}／{value.denominator}秒"
+    if isinstance(value, (int, float)):
+        return f"{value:.1f}秒"
+    return None
+
+
+def _focal(exif):
+    # 焦点距離（35mm 換算があれば併記、フルサイズは (f)）
+    actual = exif.get('FocalLength')
+    film = exif.get('FocalLengthIn35mmFilm')
+    if not actual:
+        return None
+    if film and film == actual:
+        return f"{int(actual)}mm(f)"
+    if film:
+        return f"{int(actual)}mm(35:{int(film)})"
+    return f"{int(actual)}mm"
+
+
+def _place(field):
+    # GPS 座標に最も近い地名（virpe_geo の地名辞典。NumPy を使うので、使うときに読み込む）
+    def place(exif):
+        from virpe_geo import place_of
+        return place_of(exif, field)
+    return place
+
+
+def _prefetch_places(exifs):
+    from virpe_geo import prefetch_places
+    prefetch_places(exifs)
+
+
+# 組み込みフィールド（Exif タグ名より優先）
+BUILTIN_FIELDS = {
+    'ISO': _iso,
+    'shutter': _shutter,
+    'fnumber': lambda exif: f"F{float(exif['FNumber'])}" if exif.get('FNumber') else None,
+    'iso': lambda exif: f"ISO{_iso(exif)}" if _iso(exif) else None,
+    'focal': _focal,
+    'place': _place('place'),
+    'country': _place('country'),
+}
+# 多数のファイルをまとめて処理するとき、先に一括で求めておけるフィールド
+PREFETCH_FIELDS = {
+    'place': _prefetch_places,
+    'country': _prefetch_places,
+}
+
+
+def format_value(value, spec=""):
+    """Exif の値を 1 つ文字列にする（空なら ""）"""
+    if value is None or value == "":
+        return ""
+    if spec:
+        if '%' in spec and isinstance(value, str):
+            try:
+                return datetime.strptime(value.strip()[:19], "%Y:%m:%d %H:%M:%S").strftime(spec)
+            except ValueError:
+                return value
+        try:
+            return format(float(value) if isinstance(value, Fraction) else value, spec)
+        except (TypeError, ValueError):
+            return str(value)
+    if isinstance(value, Fraction):
+        if value.denominator == 1:
+            return str(value.numerator)
+        if value.numerator == 1:
+            return f"1/{value.denominator}"
+        return f"{float(value):g}"
+    if isinstance(value, float):
+        return f"{value:g}"
+    if isinstance(value, tuple):
+        return "-".join(format_value(v) for v in value)
+    return str(value)
+
+
+def _check_field(name, source):
+    if name == 'stem' or name in BUILTIN_FIELDS:
+        return
+    from virpe_exif import tag_names
+    if name not in tag_names():
+        raise ValueError(
+            f"不明なフィールドです: {{{name}}}（Exif タグ名か stem, {', '.join(BUILTIN_FIELDS)}）: {source!r}"
+        )
+
+
+def _field(name, spec):
+    builtin = BUILTIN_FIELDS.get(name)
+    if name == 'stem':
+        return lambda exif, stem: stem
+    if builtin is not None:
+        return lambda exif, stem: format_value(builtin(exif), spec)
+    return lambda exif, stem: format_value(exif.get(name), spec)
+
+
+class RenameTemplate:
+    """compile_template() で作る。呼び出しごとの解析は無く、部品の関数を順に呼ぶだけ"""
+
+    __slots__ = ('source', 'uses_stem', 'fields', '_parts')
+
+    def __init__(self, source, parts, uses_stem, fields=frozenset()):
+        self.source = source
+        self.uses_stem = uses_stem
+        # テンプレートに出てくるフィールド名
+        self.fields = fields
+        self._parts = parts
+
+    def prepare(self, exifs):
+        """これから render する Exif の並び。{place} などはここでまとめて求めておく（1 件ずつより速い）"""
+        exifs = [exif for exif in exifs if exif]
+        for prefetch in {PREFETCH_FIELDS[f] for f in self.fields if f in PREFETCH_FIELDS}:
+            prefetch(exifs)
+
+    def render(self, exif, stem=""):
+        """Exif 辞書と元のファイル名（拡張子なし）から新しいファイル名（拡張子なし）を作る"""
+        return _render(self._parts, exif, stem)[0]
+
+    def render_many(self, items):
+        """(exif, stem) の並びをまとめて処理する"""
+        items = list(items)
+        self.prepare(exif for exif, _ in items)
+        parts = self._parts
+        return [_render(parts, exif, stem)[0] for exif, stem in items]
+
+
+def _render(parts, exif, stem):
+    # 戻り値: (文字列, 空のフィールドがあったか)
+    out = []
+    missing = False
+    for kind, value in parts:
+        if kind == 'text':
+            out.append(value)
+        elif kind == 'field':
+            text = value(exif, stem)
+            if not text:
+                missing = True
+            out.append(text)
+        else:  # 'group'
+            text, group_missing = _render(value, exif, stem)
+            if not group_missing:
+                out.append(text)
+    return "".join(out), missing
+
+
+@lru_cache(maxsize=32)
+def compile_template(source: str) -> RenameTemplate:
+    """テンプレート文字列を部品のリストに変換する（同じ文字列は 1 度だけ解析）"""
+    stack = [[]]
+    uses_stem = False
+    fields = set()
+    pos = 0
+    for m in _TOKEN.finditer(source):
+        if m.start() != pos:
+            raise ValueError(f"テンプレートを解釈できません: {source!r} ({pos}文字目)")
+        pos = m.end()
+        token = m.group(0)
+        if m.group(1):
+            name = m.group(1).strip()
+            _check_field(name, source)
+            uses_stem = uses_stem or name == 'stem'
+            fields.add(name)
+            stack[-1].append(('field', _field(name, m.group(2) or "")))
+        elif token == '[':
+            stack.append([])
+        elif token == ']':
+            if len(stack) == 1:
+                raise ValueError(f"テンプレートの ] が余分です: {source!r}")
+            group = stack.pop()
+            stack[-1].append(('group', group))
+        else:
+            stack[-1].append(('text', token))
+    if pos != len(source) or len(stack) != 1:
+        raise ValueError(f"テンプレートを解釈できません: {source!r}")
+    return RenameTemplate(source, stack[0], uses_stem, frozenset(fields))
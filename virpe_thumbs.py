@@ -0,0 +1,262 @@
+"""サムネイルのディスクキャッシュ（freedesktop.org Thumbnail Managing Standard の形式）と生成ワーカー
+
+    <キャッシュ>/thumbnails/normal/<URI の MD5>.png   （128px、large は 256px）
+    <キャッシュ>/thumbnails/fail/virpe/<URI の MD5>.png（作れなかったファイルの印）
+
+PNG の tEXt に Thumb::URI と Thumb::MTime（秒）を書き、読むときに元ファイルの更新時刻と照合する。
+Linux では他のアプリと同じ ~/.cache/thumbnails を使う。
+"""
+import hashlib
+import logging
+import os
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from PyQt6.QtCore import QObject, QRunnable, QSize, QThreadPool, Qt, pyqtSignal
+from PyQt6.QtGui import QImage, QImageReader
+from virpe_trace import span
+
+logger = logging.getLogger(__name__)
+
+# freedesktop の大きさの区分
+SIZES = {"normal": 128, "large": 256}
+FAIL_DIR = "virpe"
+# 一覧に表示しているサムネイルをメモリに置いておく上限（件数）
+MEMORY_ITEMS = 2000
+
+
+def thumbnail_root():
+    if sys.platform.startswith('linux'):
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+        return os.path.join(base, 'thumbnails')
+    from virpe_core import user_cache_dir
+    return user_cache_dir('thumbnails')
+
+
+def size_name(size: int) -> str:
+    """表示する大きさ（px）に足りる最小の区分"""
+    return "normal" if size <= SIZES["normal"] else "large"
+
+
+def file_uri(path: str) -> str:
+    return Path(os.path.abspath(path)).as_uri()
+
+
+def thumbnail_path(path: str, kind: str = "normal", root: str = None) -> str:
+    digest = hashlib.md5(file_uri(path).encode('utf-8')).hexdigest()
+    return os.path.join(root or thumbnail_root(), kind, digest + ".png")
+
+
+def _valid(thumb: str, uri: str, mtime: int) -> QImageReader:
+    """thumb が uri / mtime のものなら（画像を読む前の）QImageReader を、違えば None を返す"""
+    if not os.path.exists(thumb):
+        return None
+    reader = QImageReader(thumb)
+    # tEXt はヘッダと一緒に読まれるので、ここでは画素をデコードしない
+    if reader.text("Thumb::URI") != uri or reader.text("Thumb::MTime") != str(mtime):
+        return None
+    return reader
+
+
+def load_thumbnail(path: str, mtime: int, kind: str = "normal", root: str = None):
+    """
+    キャッシュ済みのサムネイルを返す。無ければ None、作れなかった印があれば null の QImage。
+    mtime は元ファイルの更新時刻（秒）。
+    """
+    uri = file_uri(path)
+    reader = _valid(thumbnail_path(path, kind, root), uri, mtime)
+    if reader is not None:
+        image = reader.read()
+        if not image.isNull():
+            return image
+    root = root or thumbnail_root()
+    if _valid(thumbnail_path(path, os.path.join("fail", FAIL_DIR), root), uri, mtime) is not None:
+        return QImage()
+    return None
+
+
+def _save(image: QImage, dest: str, uri: str, mtime: int):
+    image.setText("Thumb::URI", uri)
+    image.setText("Thumb::MTime", str(mtime))
+    image.setText("Software", "ViRPE")
+    folder = os.path.dirname(dest)
+    os.makedirs(folder, mode=0o700, exist_ok=True)
+    # 書きかけのファイルを他のアプリに読ませないよう、一時ファイルに書いてから置き換える
+    fd, temp = tempfile.mkstemp(suffix=".png", dir=folder)
+    os.close(fd)
+    try:
+        if not image.save(temp, "PNG"):
+            raise OSError(f"PNG を書けません: {temp}")
+        os.chmod(temp, 0o600)
+        os.replace(temp, dest)
+    except OSError:
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
+        raise
+
+
+def make_thumbnail(path: str, size: int) -> QImage:
+    """
+    size x size に収まるサムネイルを作る。Exif 埋め込みのサムネイルが十分な大きさならそれを使い、
+    足りなければ縮小デコードする（RAW は埋め込みプレビュー）。
+    """
+    from virpe_decode import decode_image, decode_thumbnail
+    image = decode_thumbnail(path)
+    if image.isNull() or max(image.width(), image.height()) < size:
+        # 一覧のサムネイル用に読んだファイルは、選択中の画像の内容を押し出さないよう置いておかない
+        image = decode_image(path, QSize(size, size), keep=False).image
+    if image.isNull():
+        return image
+    if image.width() > size or image.height() > size:
+        image = image.scaled(size, size, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
+    return image
+
+
+def get_thumbnail(path: str, mtime: int, size: int = 128, root: str = None) -> QImage:
+    """キャッシュにあればそれを、無ければ作って保存してから返す（作れなければ null）"""
+    kind = size_name(size)
+    image = load_thumbnail(path, mtime, kind, root)
+    if image is not None:
+        return image
+    uri = file_uri(path)
+    with span("thumbnail", path=path, generate=True):
+        image = make_thumbnail(path, SIZES[kind])
+    try:
+        if image.isNull():
+            _save(QImage(1, 1, QImage.Format.Format_ARGB32), thumbnail_path(path, os.path.join("fail", FAIL_DIR), root), uri, mtime)
+        else:
+            _save(image, thumbnail_path(path, kind, root), uri, mtime)
+    except OSError as e:
+        logger.debug("thumbnail cache write error: %s (%s)", path, e)
+    return image
+
+
+class ThumbnailCache:
+    """
+    一覧に表示するサムネイル（name → QImage）の LRU。MemoryBudget のプールとして登録できる。
+    作れなかったものは null の QImage を置いて、何度も要求しないようにする。
+    """
+
+    def __init__(self, max_items: int = MEMORY_ITEMS):
+        self.max_items = max_items
+        self._items = OrderedDict()
+
+    def __contains__(self, name):
+        return name in self._items
+
+    def get(self, name):
+        image = self._items.get(name)
+        if image is not None:
+            self._items.move_to_end(name)
+        return image
+
+    def put(self, name, image: QImage):
+        self._items[name] = image
+        self._items.move_to_end(name)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    def rename_many(self, pairs):
+        """(old_name, new_name) の付け替え（入れ替えを含んでよい）"""
+        moved = [(new, self._items.pop(old)) for old, new in pairs if old in self._items]
+        self._items.update(moved)
+
+    def clear(self):
+        self._items.clear()
+
+    def images(self):
+        return [image for image in self._items.values() if not image.isNull()]
+
+    def shrink(self) -> bool:
+        # 1 件ずつだと使用量の計算が件数分かかるので、古いものから 1 割ずつ捨てる
+        if not self._items:
+            return False
+        for _ in range(max(1, len(self._items) // 10)):
+            self._items.popitem(last=False)
+        return True
+
+
+class _ThumbSignals(QObject):
+    # path, サムネイル（作れなければ null）
+    ready = pyqtSignal(str, QImage)
+
+
+class _ThumbTask(QRunnable):
+    def __init__(self, owner, path: str, mtime: int, generation: int):
+        super().__init__()
+        self._owner = owner
+        self.path = path
+        self.mtime = mtime
+        self.generation = generation
+
+    def run(self):
+        # 待っている間にスクロールして見えなくなったものは作らない
+        if self.generation != self._owner._generation or not self._owner._begin(self.path):
+            return
+        try:
+            image = get_thumbnail(self.path, self.mtime, self._owner.size, self._owner.root)
+        except Exception as e:
+            logger.debug("thumbnail error: %s (%s)", self.path, e)
+            image = QImage()
+        finally:
+            self._owner._end(self.path)
+        self._owner._signals.ready.emit(self.path, image)
+
+
+class ThumbnailLoader(QObject):
+    """
+    サムネイルをワーカースレッドで読み込み・生成する。request() のたびに未着手のものを取り消し、
+    渡された順（見えている行が先）に積み直す。GUI スレッドではディスクを読まない。
+    """
+
+    ready = pyqtSignal(str, QImage)
+
+    def __init__(self, size: int = 128, max_threads: int = 2, root: str = None, parent=None):
+        super().__init__(parent)
+        self.size = size
+        self.root = root
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(max(1, max_threads))
+        self._signals = _ThumbSignals()
+        self._signals.ready.connect(self.ready)
+        self._generation = 0
+        # ワーカーが作っている最中の path（同じものを二重に作らない）
+        self._running = set()
+        self._lock = threading.Lock()
+
+    def request(self, items):
+        """items: 欲しい順の (path, mtime_ns)。前回の request の未着手分は取り消す"""
+        self._pool.clear()
+        self._generation += 1
+        with self._lock:
+            running = set(self._running)
+        priority = 0
+        for path, mtime_ns in items:
+            if path in running:
+                continue
+            # QThreadPool は priority の大きいものから実行する
+            self._pool.start(_ThumbTask(self, path, mtime_ns // 1_000_000_000, self._generation), priority)
+            priority -= 1
+
+    def _begin(self, path) -> bool:
+        with self._lock:
+            if path in self._running:
+                return False
+            self._running.add(path)
+            return True
+
+    def _end(self, path):
+        with self._lock:
+            self._running.discard(path)
+
+    def cancel(self):
+        self._pool.clear()
+        self._generation += 1
+
+    def shutdown(self):
+        self.cancel()
+        self._pool.waitForDone(1000)
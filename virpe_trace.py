@@ -0,0 +1,147 @@
+"""処理時間の計測（スパン）。無効なときは何も記録しない
+
+    with span("decode", path=path):
+        ...
+
+環境変数 VIPRE_TRACE=1 で有効になる（値に .json のパスを書くとそこへ保存）。
+記録はリングバッファに溜め、Chrome のトレース形式（chrome://tracing, Perfetto）と
+処理ごとの p50/p95 の一覧で書き出せる。
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# リングバッファに残すスパンの数
+DEFAULT_CAPACITY = 50_000
+
+_enabled = False
+_events = deque(maxlen=DEFAULT_CAPACITY)
+_ns = time.perf_counter_ns
+
+
+class _Span:
+    __slots__ = ('name', 'args', 'start')
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = _ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = _ns()
+        # deque.append はスレッドセーフ
+        _events.append((self.name, self.start, end - self.start, threading.get_ident(), self.args))
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return None
+
+
+_NULL = _NullSpan()
+
+
+def span(name, **args):
+    """name の処理時間を記録するコンテキストマネージャ（無効なら何もしない共有オブジェクトを返す）"""
+    if not _enabled:
+        return _NULL
+    return _Span(name, args)
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable(capacity=DEFAULT_CAPACITY):
+    global _enabled, _events
+    if _events.maxlen != capacity:
+        _events = deque(_events, maxlen=capacity)
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def clear():
+    _events.clear()
+
+
+def events():
+    """記録済みのスパン (name, start_ns, duration_ns, thread_id, args) のリスト"""
+    return list(_events)
+
+
+def chrome_trace():
+    """Chrome のトレース形式（Complete イベント）の辞書"""
+    pid = os.getpid()
+    names = {t.ident: t.name for t in threading.enumerate()}
+    trace = []
+    for tid in {e[3] for e in _events}:
+        trace.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+                      "args": {"name": names.get(tid, f"thread-{tid}")}})
+    for name, start, duration, tid, args in list(_events):
+        event = {"name": name, "ph": "X", "pid": pid, "tid": tid, "ts": start / 1000, "dur": duration / 1000}
+        if args:
+            event["args"] = {k: str(v) for k, v in args.items()}
+        trace.append(event)
+    return {"traceEvents": trace, "displayTimeUnit": "ms"}
+
+
+def summary():
+    """処理名 → {count, total_ms, p50_ms, p95_ms, max_ms}"""
+    durations = {}
+    for name, _, duration, _, _ in list(_events):
+        durations.setdefault(name, []).append(duration)
+    result = {}
+    for name, values in durations.items():
+        values.sort()
+        n = len(values)
+        result[name] = {
+            "count": n,
+            "total_ms": sum(values) / 1e6,
+            "p50_ms": values[(n - 1) // 2] / 1e6,
+            "p95_ms": values[min(n - 1, int(n * 0.95))] / 1e6,
+            "max_ms": values[-1] / 1e6,
+        }
+    return result
+
+
+def format_summary():
+    rows = sorted(summary().items(), key=lambda item: -item[1]["total_ms"])
+    lines = [f"{'span':<20} {'count':>7} {'total ms':>10} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}"]
+    for name, s in rows:
+        lines.append(f"{name:<20} {s['count']:>7} {s['total_ms']:>10.1f} {s['p50_ms']:>9.2f} {s['p95_ms']:>9.2f} {s['max_ms']:>9.2f}")
+    return "\n".join(lines)
+
+
+def default_path():
+    """VIPRE_TRACE に .json のパスがあればそれ、無ければキャッシュディレクトリ内の日時つきファイル"""
+    value = os.environ.get('VIPRE_TRACE', '')
+    if value.lower().endswith('.json'):
+        return value
+    from virpe_core import user_cache_dir
+    return os.path.join(user_cache_dir('traces'), time.strftime("trace-%Y%m%d-%H%M%S.json"))
+
+
+def dump(path=None):
+    """Chrome のトレース形式で保存し、保存先を返す"""
+    path = path or default_path()
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(chrome_trace(), f)
+    return path
+
+
+if os.environ.get('VIPRE_TRACE', '') not in ('', '0'):
+    enable()
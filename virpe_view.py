@@ -0,0 +1,339 @@
+"""画像表示ウィジェット（ビューポートに見えている範囲だけを描画する）"""
+import logging
+import math
+from PyQt6.QtCore import Qt, QPointF, QRectF, QTimer, pyqtSignal
+from PyQt6.QtGui import QImage, QPainter
+from PyQt6.QtWidgets import QAbstractScrollArea
+from virpe_trace import span
+
+logger = logging.getLogger(__name__)
+
+# ズーム倍率の範囲
+MIN_ZOOM = 0.05
+MAX_ZOOM = 6.0
+# 操作が止まってから高画質で描き直すまでの時間(ms)
+SMOOTH_DELAY_MS = 150
+
+
+class ImagePyramid:
+    """
+    元画像と、1/2, 1/4, ... に縮小した画像の段（段番号 → 画像）。縮小版は必要になったときに作る。
+    表示倍率以上の解像度を持つ最小の段から描けば、拡大縮小のコストはビューポートの大きさで決まる。
+    image が縮小デコードされたものなら、width/height には原寸の大きさを渡す。
+    """
+
+    def __init__(self, image: QImage, width: int = 0, height: int = 0):
+        self.levels = {0: image}
+        self.width = width or image.width()
+        self.height = height or image.height()
+        # 手元の最も細かい段の、原寸に対する倍率
+        self.base_scale = min(1.0, image.width() / self.width)
+
+    @property
+    def base(self) -> QImage:
+        return self.levels[0]
+
+    def _want(self, scale: float) -> int:
+        if scale >= self.base_scale:
+            return 0
+        return int(math.floor(math.log2(self.base_scale / scale)))
+
+    def level_for(self, scale: float, build: bool = True):
+        """
+        倍率 scale で描くのに使う段を返す。
+        build=False のときは未作成の段を作らず、作成済みで最も近い細かい段を返す。
+        """
+        want = self._want(scale)
+        finer = max(k for k in self.levels if k <= want)
+        if finer == want or not build:
+            return self.levels[finer]
+        # 手元で最も近い細かい段から 1/2 ずつ縮小する（途中の段は残さない）
+        image = self.levels[finer]
+        level = finer
+        while level < want and image.width() >= 2 and image.height() >= 2:
+            level += 1
+            with span("scale", level=level):
+                image = image.scaled(
+                    image.width() // 2, image.height() // 2,
+                    Qt.AspectRatioMode.IgnoreAspectRatio, Qt.TransformationMode.SmoothTransformation,
+                )
+        self.levels[level] = image
+        return image
+
+    def shrink(self, scale: float, fit_width: int, fit_height: int) -> bool:
+        """
+        メモリを減らす（MemoryBudget から呼ばれる）。倍率 scale の表示に使わない段を捨て、
+        それでも減らせるなら元画像を fit_width x fit_height に収まる大きさに縮小する。減らせたら True。
+        """
+        # 今の倍率で使う段は捨てない（捨てると描くたびに作り直す）
+        want = self._want(scale)
+        unused = [k for k in self.levels if k not in (0, want)]
+        if unused:
+            for k in unused:
+                del self.levels[k]
+            return True
+        base = self.base
+        if base.width() <= fit_width and base.height() <= fit_height:
+            return False
+        small = base.scaled(fit_width, fit_height, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
+        if scale > small.width() / self.width:
+            # 今の倍率ではこの大きさでは足りない
+            return False
+        self.levels = {0: small}
+        self.base_scale = min(1.0, small.width() / self.width)
+        return True
+
+
+class ImageView(QAbstractScrollArea):
+    """
+    Fit（ビューポートに合わせる）と Zoom（倍率指定・ドラッグでパン・ホイールで拡大縮小）の表示。
+    拡大した画像そのものは作らず、見えている範囲をピラミッドの適切な段から直接描く。
+    操作中は高速な最近傍補間で描き、操作が止まったら滑らかな補間で描き直す。
+    """
+
+    zoom_changed = pyqtSignal(float)
+    # 手元の解像度では足りない倍率になった（原寸のデコードが必要）
+    resolution_needed = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._pyramid = None
+        self._text = ""
+        # virpe_memory.MemoryBudget（表示中の画像もメモリ予算に含める）
+        self.budget = None
+        # 右下に小さく表示する文字列（メモリ使用量などのデバッグ表示）
+        self._overlay = ""
+        self._zoom = None  # None=Fit, float=倍率(1.0=100%)
+        self._dragging = False
+        self._last_pos = None
+        self._interacting = False
+        self._smooth_timer = QTimer(self)
+        self._smooth_timer.setSingleShot(True)
+        self._smooth_timer.setInterval(SMOOTH_DELAY_MS)
+        self._smooth_timer.timeout.connect(self._on_idle)
+        self.viewport().setCursor(Qt.CursorShape.OpenHandCursor)
+        self.horizontalScrollBar().valueChanged.connect(lambda _: self.viewport().update())
+        self.verticalScrollBar().valueChanged.connect(lambda _: self.viewport().update())
+
+    # --- 状態 ---
+
+    def set_image(self, image: QImage, full_width: int = 0, full_height: int = 0, keep_view: bool = False):
+        """
+        image を表示する。縮小デコードした画像なら full_width/full_height に原寸を渡す。
+        keep_view=True なら同じ画像の高解像度版への差し替えとして、倍率と位置を保つ。
+        """
+        if image is None or image.isNull():
+            self._pyramid = None
+        else:
+            self._pyramid = ImagePyramid(image, full_width, full_height)
+        if keep_view:
+            hbar, vbar = self.horizontalScrollBar(), self.verticalScrollBar()
+            h, v = hbar.value(), vbar.value()
+            self._update_scrollbars()
+            hbar.setValue(h)
+            vbar.setValue(v)
+        else:
+            self._update_scrollbars()
+            if self._zoom is not None:
+                self._center()
+        self.viewport().update()
+        self._check_resolution()
+        if self.budget is not None:
+            self.budget.enforce()
+
+    def images(self):
+        if self._pyramid is None:
+            return []
+        return list(self._pyramid.levels.values())
+
+    def shrink(self) -> bool:
+        """表示に使わない縮小段を捨て、Fit 表示なら元画像をビューポートの大きさまで縮小する"""
+        if self._pyramid is None:
+            return False
+        vp = self.viewport()
+        dpr = self.devicePixelRatioF()
+        return self._pyramid.shrink(self.scale(), int(vp.width() * dpr), int(vp.height() * dpr))
+
+    def set_overlay(self, text: str):
+        if text != self._overlay:
+            self._overlay = text
+            self.viewport().update()
+
+    def _check_resolution(self):
+        # Fit では小さい画像も引き伸ばして表示するので、Zoom のときだけ判定する
+        if self._zoom is None or self._pyramid is None or self._pyramid.base_scale >= 1.0:
+            return
+        if self._zoom > self._pyramid.base_scale * 1.01:
+            self.resolution_needed.emit()
+
+    def setText(self, text: str):
+        self._pyramid = None
+        self._text = text
+        self._update_scrollbars()
+        self.viewport().update()
+
+    def image_size(self):
+        if self._pyramid is None:
+            return 0, 0
+        return self._pyramid.width, self._pyramid.height
+
+    @property
+    def zoom(self):
+        return self._zoom
+
+    def scale(self) -> float:
+        """現在の表示倍率（Fit なら計算した倍率）"""
+        if self._pyramid is None:
+            return 1.0
+        if self._zoom is not None:
+            return self._zoom
+        vp = self.viewport()
+        return min(vp.width() / self._pyramid.width, vp.height() / self._pyramid.height)
+
+    def set_fit(self):
+        self._zoom = None
+        self._update_scrollbars()
+        self.viewport().update()
+
+    def set_zoom(self, zoom: float, anchor: QPointF = None):
+        """倍率を変更する。anchor（ビューポート座標）が指す画像上の位置を動かさない"""
+        zoom = max(MIN_ZOOM, min(MAX_ZOOM, zoom))
+        if self._pyramid is None:
+            self._zoom = zoom
+            return
+        vp = self.viewport()
+        if anchor is None:
+            anchor = QPointF(vp.width() / 2, vp.height() / 2)
+        old_scale = self.scale()
+        ox, oy = self._origin(old_scale)
+        img_x = (anchor.x() - ox) / old_scale
+        img_y = (anchor.y() - oy) / old_scale
+
+        self._zoom = zoom
+        self._update_scrollbars()
+        self.horizontalScrollBar().setValue(int(img_x * zoom - anchor.x()))
+        self.verticalScrollBar().setValue(int(img_y * zoom - anchor.y()))
+        self.zoom_changed.emit(zoom)
+        self.viewport().update()
+        self._check_resolution()
+
+    def _center(self):
+        hbar, vbar = self.horizontalScrollBar(), self.verticalScrollBar()
+        hbar.setValue(hbar.maximum() // 2)
+        vbar.setValue(vbar.maximum() // 2)
+
+    def _update_scrollbars(self):
+        hbar, vbar = self.horizontalScrollBar(), self.verticalScrollBar()
+        if self._pyramid is None or self._zoom is None:
+            hbar.setRange(0, 0)
+            vbar.setRange(0, 0)
+            return
+        vp = self.viewport()
+        sw = int(self._pyramid.width * self._zoom)
+        sh = int(self._pyramid.height * self._zoom)
+        hbar.setRange(0, max(0, sw - vp.width()))
+        vbar.setRange(0, max(0, sh - vp.height()))
+        hbar.setPageStep(vp.width())
+        vbar.setPageStep(vp.height())
+
+    def _origin(self, scale):
+        """画像の左上がビューポート上のどこに来るか（小さい画像は中央寄せ）"""
+        vp = self.viewport()
+        sw = self._pyramid.width * scale
+        sh = self._pyramid.height * scale
+        ox = (vp.width() - sw) / 2 if sw <= vp.width() else -self.horizontalScrollBar().value()
+        oy = (vp.height() - sh) / 2 if sh <= vp.height() else -self.verticalScrollBar().value()
+        return ox, oy
+
+    # --- 描画 ---
+
+    def _mark_interacting(self):
+        self._interacting = True
+        self._smooth_timer.start()
+
+    def _on_idle(self):
+        self._interacting = False
+        self.viewport().update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self.viewport())
+        painter.fillRect(event.rect(), self.palette().window())
+        if self._pyramid is None:
+            painter.drawText(self.viewport().rect(), Qt.AlignmentFlag.AlignCenter, self._text)
+            return
+
+        scale = self.scale()
+        ox, oy = self._origin(scale)
+        image_rect = QRectF(ox, oy, self._pyramid.width * scale, self._pyramid.height * scale)
+        target = image_rect.intersected(QRectF(event.rect()))
+        if target.isEmpty():
+            return
+
+        # 操作中は未作成の段を作らず、手持ちの段から最近傍補間で描く
+        smooth = not self._interacting
+        levels = len(self._pyramid.levels)
+        level = self._pyramid.level_for(scale, build=smooth)
+        # ビューポート座標 → 使う段のピクセル座標
+        kx = level.width() / image_rect.width()
+        ky = level.height() / image_rect.height()
+        source = QRectF((target.x() - ox) * kx, (target.y() - oy) * ky, target.width() * kx, target.height() * ky)
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform, smooth)
+        with span("paint", smooth=smooth):
+            painter.drawImage(target, level, source)
+        if self._overlay:
+            painter.drawText(self.viewport().rect().adjusted(4, 4, -4, -4),
+                             Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignBottom, self._overlay)
+        if self.budget is not None and len(self._pyramid.levels) != levels:
+            # 新しく段を作った（描き終わってから予算を確認する）
+            QTimer.singleShot(0, self.budget.enforce)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self._update_scrollbars()
+        self._mark_interacting()
+
+    # --- 操作 ---
+
+    def wheelEvent(self, event):
+        # ホイールでズーム（Zoom モード時のみ）
+        if self._zoom is None or self._pyramid is None:
+            return super().wheelEvent(event)
+        delta = event.angleDelta().y()
+        if delta == 0:
+            event.accept()
+            return
+        # ホイールの刻みを元に倍率を決定（ポインタ位置基準）
+        self._mark_interacting()
+        self.set_zoom(self._zoom * (1.001 ** delta), event.position())
+        event.accept()
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.MouseButton.LeftButton:
+            self._dragging = True
+            self._last_pos = event.position()
+            self.viewport().setCursor(Qt.CursorShape.ClosedHandCursor)
+            event.accept()
+        else:
+            super().mousePressEvent(event)
+
+    def mouseMoveEvent(self, event):
+        if self._dragging and self._last_pos is not None:
+            cur = event.position()
+            hbar, vbar = self.horizontalScrollBar(), self.verticalScrollBar()
+            # subtract dx/dy to move content with mouse drag direction
+            hbar.setValue(int(hbar.value() - (cur.x() - self._last_pos.x())))
+            vbar.setValue(int(vbar.value() - (cur.y() - self._last_pos.y())))
+            self._last_pos = cur
+            self._mark_interacting()
+            event.accept()
+        else:
+            super().mouseMoveEvent(event)
+
+    def mouseReleaseEvent(self, event):
+        if event.button() == Qt.MouseButton.LeftButton:
+            self._dragging = False
+            self._last_pos = None
+            self.viewport().setCursor(Qt.CursorShape.OpenHandCursor)
+            event.accept()
+        else:
+            super().mouseReleaseEvent(event)